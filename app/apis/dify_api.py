@@ -6,41 +6,124 @@ from fastapi import (
     Depends,
     HTTPException,
     Form,
+    Request,
+    Query,
+    Header,
     status,
     Body # Keep if you use it for other Pydantic models directly in Body
 )
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session as SQLAlchemySession # Keep if DB interaction is planned here
 import shutil
-import os
-import uuid
 import json
-from typing import Dict, Any, List, Optional  # Ensure Optional is from typing
+import time
+import hashlib
+import contextlib
+import asyncio
+from typing import AsyncIterator, Callable, Dict, Any, FrozenSet, List, Optional, Sequence  # Ensure Optional is from typing
 import re
-from pydantic import BaseModel,Field # For request body Pydantic models
+import logging
+from dataclasses import dataclass
+from pydantic import BaseModel,Field, ValidationError # For request body Pydantic models
 
 # Assuming these are correctly set up and accessible
 from app.db.database import get_db
 from app.db.models import User as UserModel
 from app.apis.auth_api import get_current_active_user # Your authentication dependency
 from app.core.config import settings # Application settings
+from app.core.logging_config import log_payload
+from app.core import json_codec
+from app.core.json_codec import FastJSONResponse
+from app.core.json_stream import IncrementalJSONArrayParser, IncrementalJSONError
+from app.schemas.vocabulary_schemas import DifyWordSchema, dify_word_text
 
 # Service for Dify API calls
-from app.services.dify_workflow_service import call_dify_api, DifyWorkflowError
+from app.services.dify_workflow_service import call_dify_api, stream_dify_api, parse_dify_result, DifyWorkflowError
+from app.services.dify_cache import response_cache_stats
+from app.services.dify_singleflight import single_flight_stats
+from app.services.dify_resilience import resilience_stats, is_local_rejection, is_upstream_failure
+from app.services.dify_retry import retry_stats
+from app.services.dify_upload_cache import get_upload_cache, upload_cache_stats
+from app.services.image_preprocessing import image_preprocessor, max_image_input_bytes, preprocessed_filename
+from app.services.composition_jobs import composition_job_pool, CompositionJob, CompositionJobQueueFull
+from app.services.dify_batch import bounded_fan_out
+from app.services.dify_microbatch import grammar_micro_batcher
+from app.services.text_chunking import chunk_text
+from app.services.vocab_semantic_cache import vocab_semantic_cache
+from app.services.vocab_word_bank import vocab_word_bank
+from app.services.known_words import known_word_filter
+from app.services.word_details import word_detail_store
+from app.services.word_detail_fetcher import word_detail_fetcher
+from app.services.idempotency import idempotency_store, IdempotencyKeyConflict, StoredResponse
 
 # Utilities for file handling related to Dify
 from app.dify_integration.dify_utils import (
     upload_file_to_dify, # For pre-uploading files to Dify's storage if needed
-    determine_file_category_and_mime
+    determine_file_category_and_mime,
+    UploadTooLargeError,
+    UPLOAD_CHUNK_SIZE,
+    MAGIC_SNIFF_BYTES,
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     # prefix is set in app/main.py when including this router, e.g., /api/v1/dify
     tags=["Dify AI Modules"] # OpenAPI/Swagger tag for this group of endpoints
 )
 
-TEMP_UPLOAD_DIR = "temp_uploads_for_dify_processing" # A dedicated temp directory
-if not os.path.exists(TEMP_UPLOAD_DIR):
-    os.makedirs(TEMP_UPLOAD_DIR)
+COMPOSITION_JOB_PING_INTERVAL_SECONDS = 15
+
+# Keys carrying the untouched Dify response next to the extracted result; only sent with ?include_raw=true.
+RAW_DIFY_RESPONSE_KEYS = ("dify_full_response", "dify_full_outputs")
+
+
+def include_raw_param(
+    include_raw: bool = Query(settings.DIFY_RESPONSE_INCLUDE_RAW_DEFAULT, description="同时返回Dify原始响应 (dify_full_*)，仅用于调试"),
+) -> bool:
+    return include_raw
+
+
+def shape_dify_result(result: Dict[str, Any], include_raw: bool) -> Dict[str, Any]:
+    """Drops the raw Dify response from an endpoint result unless the client asked for it."""
+    if include_raw:
+        return result
+    return {k: v for k, v in result.items() if k not in RAW_DIFY_RESPONSE_KEYS}
+
+
+def idempotency_key_param(
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255, description="客户端生成的唯一键；重试时携带同一个键，不会重复执行"),
+) -> Optional[str]:
+    return idempotency_key or None
+
+
+async def idempotent_json_response(
+    request: Request,
+    idempotency_key: Optional[str],
+    user_id: int,
+    request_fingerprint: Any,
+    fn: Callable[[], Any],
+    status_code: int = status.HTTP_200_OK,
+) -> Response:
+    """
+    Returns what `fn` (a coroutine function) returns as JSON. With an Idempotency-Key, a repeat of the request replays
+    the stored response, or waits for the original while it still runs (header Idempotent-Replayed: true).
+    `request_fingerprint` (JSON data) identifies the request's content; another one under the same key is rejected.
+    """
+    async def render() -> StoredResponse:
+        return StoredResponse(status_code=status_code, body=json_codec.dumps(await fn()))
+
+    if idempotency_key is None or not idempotency_store.enabled:
+        stored, replayed = await render(), False
+    else:
+        fingerprint = hashlib.sha256(json_codec.dumps([request.url.path, request_fingerprint], sort_keys=True)).hexdigest()
+        try:
+            stored, replayed = await idempotency_store.run(user_id, idempotency_key, fingerprint, render)
+        except IdempotencyKeyConflict:
+            logger.info("Idempotency-Key reused for a different request", extra={"user_id": user_id, "path": request.url.path})
+            raise HTTPException(status_code=422, detail="该 Idempotency-Key 已用于另一个内容不同的请求。")
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return Response(content=stored.body, status_code=stored.status_code, media_type="application/json", headers=headers)
 
 # --- Helper function to consistently extract text output from Dify's response ---
 # backend/app/apis/dify_api.py
@@ -51,14 +134,10 @@ def extract_text_from_dify_response(dify_response_data: Dict[str, Any], configur
     text_output: Any = None
     final_output_key_used: str = configured_output_key
 
-    print(f"--- Raw Dify Response Data Received by extract_text_from_dify_response ---")
-    print(json.dumps(dify_response_data, indent=2, ensure_ascii=False))
-    print(f"--- End of Raw Dify Response Data ---")
-    print(f"Configured output key for extraction: {configured_output_key}")
+    log_payload(logger, "Extracting text from Dify response", dify_response_data, output_key=configured_output_key)
 
     # 1. 检查是否是聊天/完成型应用的响应结构 (如 /chat-messages)
     if "answer" in dify_response_data and dify_response_data["answer"] is not None:
-        print("Found 'answer' key, treating as Chat/Completion App response.")
         text_output = dify_response_data.get("answer")
         final_output_key_used = "answer (from Chat/Completion App)"
     else:
@@ -67,41 +146,33 @@ def extract_text_from_dify_response(dify_response_data: Dict[str, Any], configur
 
         if "data" in dify_response_data and isinstance(dify_response_data.get("data"), dict):
             dify_outputs_container = dify_response_data.get("data")
-            print("Found 'data' object in Dify response.")
         elif "outputs" in dify_response_data and isinstance(dify_response_data.get("outputs"), dict):
             # Fallback if 'outputs' is at the top level (less common for /workflows/run success)
             dify_outputs_container = dify_response_data # outputs is a direct key of response_data
-            print("Found 'outputs' object at top level of Dify response.")
-        else:
-            print("Neither 'data' (containing 'outputs') nor top-level 'outputs' dictionary found.")
 
         actual_outputs_dict: PyOptional[Dict[str, Any]] = None
         if dify_outputs_container and "outputs" in dify_outputs_container and \
            isinstance(dify_outputs_container.get("outputs"), dict):
             actual_outputs_dict = dify_outputs_container.get("outputs")
-            print(f"Successfully accessed 'outputs' dictionary: {list(actual_outputs_dict.keys()) if actual_outputs_dict else 'is None'}")
-        else:
-            print("Failed to access a valid 'outputs' dictionary from Dify response container.")
 
 
         if actual_outputs_dict: # 确保 actual_outputs_dict 是一个字典
-            print(f"Processing 'outputs' object. Attempting to get value for key: '{configured_output_key}'")
             text_output = actual_outputs_dict.get(configured_output_key)
             final_output_key_used = f"outputs.{configured_output_key}"
 
             if text_output is None and configured_output_key != "text" and "text" in actual_outputs_dict:
-                print(f"Warning: Key '{configured_output_key}' not found in 'outputs'. Falling back to 'outputs.text'.")
+                logger.warning("Output key not found in 'outputs', falling back to 'outputs.text'", extra={"output_key": configured_output_key})
                 text_output = actual_outputs_dict.get("text")
                 final_output_key_used = "outputs.text (fallback)"
         else:
             # 如果没有找到 outputs 对象，但配置的输出键存在于顶层（不太可能 для /workflows/run 成功时）
             if configured_output_key in dify_response_data:
-                 print(f"Warning: No 'outputs' object, but configured output key '{configured_output_key}' found at top level of Dify response.")
+                 logger.debug("No 'outputs' object, output key found at the top level of the Dify response", extra={"output_key": configured_output_key})
                  text_output = dify_response_data.get(configured_output_key)
                  final_output_key_used = f"{configured_output_key} (top-level)"
 
 
-    print(f"Extracted text_output (before type conversion) using key '{final_output_key_used}': '{str(text_output)[:200]}...'")
+    logger.debug("Extracted text output", extra={"output_key": final_output_key_used, "found": text_output is not None})
 
     # 3. 处理和返回提取到的文本
     if text_output is None:
@@ -109,7 +180,7 @@ def extract_text_from_dify_response(dify_response_data: Dict[str, Any], configur
         workflow_data = dify_response_data.get("data", {})
         if workflow_data.get("status") == "failed" and workflow_data.get("error"):
             dify_internal_error = workflow_data.get('error')
-            print(f"Dify workflow itself failed. Error: {dify_internal_error}")
+            logger.error("Dify workflow itself failed", extra={"error": dify_internal_error})
             # 提取 KeyError: 'text' 这种具体错误
             key_error_match = re.search(r"KeyError: '([^']*)'", dify_internal_error)
             if key_error_match:
@@ -121,12 +192,44 @@ def extract_text_from_dify_response(dify_response_data: Dict[str, Any], configur
     
     if not isinstance(text_output, str):
         try:
-            return json.dumps(text_output, ensure_ascii=False) if isinstance(text_output, (dict, list)) else str(text_output)
+            return json_codec.dumps_str(text_output) if isinstance(text_output, (dict, list)) else str(text_output)
         except TypeError:
             return str(text_output)
     return text_output
 
 
+# --- Helpers for Server-Sent Events relayed to the browser ---
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no", # Stop nginx from buffering the stream
+}
+
+def format_sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json_codec.dumps_str(data)}\n\n"
+
+async def open_dify_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Waits for the first upstream event before the HTTP response is started, so connection/auth
+    failures still surface as a normal HTTP error status. Returns an iterator over all events.
+    """
+    try:
+        first_event = await events.__anext__()
+    except StopAsyncIteration:
+        first_event = None
+    except DifyWorkflowError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    async def chained() -> AsyncIterator[Dict[str, Any]]:
+        try:
+            if first_event is not None:
+                yield first_event
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+    return chained()
+
+
 # === Pydantic Models for Request Bodies ===
 class ChatRequest(BaseModel):
     query: str
@@ -139,12 +242,31 @@ class GenerateWordsRequest(BaseModel):
 class ParseGrammarRequest(BaseModel):
     text_to_parse: str = Field(..., min_length=1, description="需要进行语法解析的文本")
 
+class BatchGenerateWordsRequest(BaseModel):
+    items: List[GenerateWordsRequest] = Field(..., min_length=1, max_length=settings.DIFY_BATCH_MAX_ITEMS)
+
+class BatchParseGrammarRequest(BaseModel):
+    items: List[ParseGrammarRequest] = Field(..., min_length=1, max_length=settings.DIFY_BATCH_MAX_ITEMS)
+
+
+def build_chat_payload(request_data: ChatRequest, dify_user_identifier: str, response_mode: str) -> Dict[str, Any]:
+    dify_payload: Dict[str, Any] = {
+        "query": request_data.query,  # Top-level query, required by /chat-messages
+        "inputs": {},                 # Send an empty object for inputs, as it's optional
+        "user": dify_user_identifier,
+        "response_mode": response_mode,
+    }
+    if request_data.conversation_id:
+        dify_payload["conversation_id"] = request_data.conversation_id
+    return dify_payload
+
 
 # === API Endpoints ===
 
 @router.post("/ai-chat", summary="Send text message to AI Chat Application")
 async def ai_chat_endpoint(
     request_data: ChatRequest, # ChatRequest has 'query' and 'conversation_id'
+    include_raw: bool = Depends(include_raw_param),
     current_user: UserModel = Depends(get_current_active_user),
 ):
     if not settings.CHAT_APP_API_KEY or not settings.CHAT_APP_BASE_URL or not settings.CHAT_APP_API_ENDPOINT:
@@ -161,51 +283,276 @@ async def ai_chat_endpoint(
     if not settings.CHAT_TEXT_INPUT_KEY:
         raise DifyWorkflowError("CHAT_TEXT_INPUT_KEY is not configured for the chat application.", 500)
 
-    dify_payload: Dict[str, Any] = {
-        "query": request_data.query,  # Top-level query, required by /chat-messages
-        "inputs": {},                 # Send an empty object for inputs, as it's optional
-        "user": dify_user_identifier,
-        "response_mode": "blocking",
-    }
-
-    if request_data.conversation_id:
-        dify_payload["conversation_id"] = request_data.conversation_id
+    dify_payload = build_chat_payload(request_data, dify_user_identifier, response_mode="blocking")
     
     # The rest of the try/except block remains the same
     try:
-        print(f"Constructed Dify Payload for /ai-chat (with empty inputs): {json.dumps(dify_payload, indent=2, ensure_ascii=False)}")
-        dify_response_data = call_dify_api( # call_dify_api sends this payload as JSON body
+        dify_response_data = await call_dify_api( # call_dify_api sends this payload as JSON body
             dify_base_url=settings.CHAT_APP_BASE_URL,
             dify_api_key=settings.CHAT_APP_API_KEY,
             dify_api_endpoint_path=settings.CHAT_APP_API_ENDPOINT, # Should be /chat-messages
-            payload=dify_payload
+            payload=dify_payload,
+            dify_app="chat"
         )
         
         # extract_text_from_response will get 'answer' for chat apps
         ai_text = extract_text_from_dify_response(dify_response_data, settings.CHAT_TEXT_OUTPUT_KEY)
         
-        return {
+        return shape_dify_result({
             "message": "AI回复已生成。",
             "ai_text": ai_text,
             "conversation_id": dify_response_data.get("conversation_id"),
             "dify_full_response": dify_response_data
-        }
+        }, include_raw)
     except DifyWorkflowError as e:
         # Log the payload that caused the error for easier debugging
-        print(f"DifyWorkflowError with payload: {json.dumps(dify_payload, indent=2, ensure_ascii=False)}")
+        logger.warning("DifyWorkflowError during AI chat", extra={"status_code": e.status_code, "error": str(e)})
+        log_payload(logger, "Chat payload that failed", dify_payload)
         raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
-        import traceback; traceback.print_exc()
+        logger.exception("Unexpected error during AI chat")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"AI聊天时发生意外错误: {type(e).__name__}")
 
 
 
+@router.post("/ai-chat/stream", summary="Stream AI chat reply as Server-Sent Events")
+async def ai_chat_stream_endpoint(
+    request_data: ChatRequest,
+    current_user: UserModel = Depends(get_current_active_user),
+):
+    """
+    Same as /ai-chat but relays Dify 'message' chunks as they arrive.
+    SSE events: 'message' {answer, conversation_id, message_id}, then 'done' with the final
+    conversation_id and latency (time_to_first_token_ms, total_ms), or 'error' {status_code, detail}.
+    """
+    if not settings.CHAT_APP_API_KEY or not settings.CHAT_APP_BASE_URL or not settings.CHAT_APP_API_ENDPOINT:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="AI聊天服务未正确配置。")
+
+    dify_user_identifier = str(current_user.id)
+    dify_payload = build_chat_payload(request_data, dify_user_identifier, response_mode="streaming")
+
+    started_at = time.perf_counter()
+    events = await open_dify_stream(stream_dify_api(
+        dify_base_url=settings.CHAT_APP_BASE_URL,
+        dify_api_key=settings.CHAT_APP_API_KEY,
+        dify_api_endpoint_path=settings.CHAT_APP_API_ENDPOINT,
+        payload=dify_payload,
+        dify_app="chat"
+    ))
+
+    async def relay_chat_events() -> AsyncIterator[str]:
+        conversation_id = request_data.conversation_id
+        message_id = None
+        first_token_ms: Optional[float] = None
+        try:
+            async for event in events:
+                event_type = event.get("event")
+                conversation_id = event.get("conversation_id") or conversation_id
+                message_id = event.get("message_id") or message_id
+                if event_type in ("message", "agent_message"):
+                    chunk = event.get("answer") or ""
+                    if not chunk:
+                        continue
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - started_at) * 1000
+                    yield format_sse_event("message", {"answer": chunk, "conversation_id": conversation_id, "message_id": message_id})
+                elif event_type == "ping":
+                    yield ": ping\n\n" # Keep proxies from closing an idle connection
+            total_ms = (time.perf_counter() - started_at) * 1000
+            logger.info("AI chat stream finished", extra={"dify_user": dify_user_identifier, "time_to_first_token_ms": first_token_ms, "total_ms": round(total_ms, 1)})
+            yield format_sse_event("done", {
+                "conversation_id": conversation_id,
+                "message_id": message_id,
+                "time_to_first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+                "total_ms": round(total_ms, 1),
+            })
+        except DifyWorkflowError as e:
+            logger.warning("DifyWorkflowError during chat stream", extra={"status_code": e.status_code, "error": str(e)})
+            yield format_sse_event("error", {"status_code": e.status_code, "detail": str(e)})
+
+    return StreamingResponse(relay_chat_events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.post("/correct-composition", summary="Submit composition (text and/or image) for AI correction")
 async def correct_composition_endpoint(
+    request: Request,
+    composition_text: Optional[str] = Form(None),
+    composition_image: Optional[UploadFile] = File(None),
+    include_raw: bool = Depends(include_raw_param),
+    idempotency_key: Optional[str] = Depends(idempotency_key_param),
+    current_user: UserModel = Depends(get_current_active_user),
+):
+    try:
+        # A keyed run may outlive this request (a retry can still pick up its result), so it gets its own copy of the image
+        submission = await read_composition_submission(composition_text, composition_image, detach=idempotency_key is not None)
+
+        async def correct() -> Dict[str, Any]:
+            return shape_dify_result(await run_composition_correction(submission, str(current_user.id)), include_raw)
+
+        fingerprint = [submission.text, submission.image_sha256, include_raw]
+        return await idempotent_json_response(request, idempotency_key, current_user.id, fingerprint, correct)
+    except HTTPException: # Re-raise if it's already an HTTPException (e.g., from file validation)
+        raise
+    except Exception as e:
+        raise composition_error_to_http(e)
+
+
+@router.post("/correct-composition/stream", summary="Composition correction with workflow progress streamed as SSE")
+async def correct_composition_stream_endpoint(
+    composition_text: Optional[str] = Form(None),
+    composition_image: Optional[UploadFile] = File(None),
+    include_raw: bool = Depends(include_raw_param),
+    current_user: UserModel = Depends(get_current_active_user),
+):
+    try:
+        # The image is uploaded to Dify before the stream starts, so upload errors keep their HTTP status.
+        submission = await read_composition_submission(composition_text, composition_image)
+        dify_payload = await build_composition_payload(submission, str(current_user.id))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise composition_error_to_http(e)
+
+    return await stream_workflow_endpoint(
+        dify_base_url=settings.COMPOSITION_APP_BASE_URL,
+        dify_api_key=settings.COMPOSITION_APP_API_KEY,
+        dify_api_endpoint_path=settings.COMPOSITION_APP_API_ENDPOINT,
+        payload=dify_payload,
+        dify_app="composition",
+        build_result=build_composition_result,
+        include_raw=include_raw,
+    )
+
+
+# --- Job mode: accept now, upload + run the workflow in the background worker pool ---
+@router.post("/correct-composition/jobs", status_code=status.HTTP_202_ACCEPTED, summary="Queue a composition correction job")
+async def submit_composition_job_endpoint(
+    request: Request,
     composition_text: Optional[str] = Form(None),
     composition_image: Optional[UploadFile] = File(None),
+    include_raw: bool = Depends(include_raw_param),
+    idempotency_key: Optional[str] = Depends(idempotency_key_param),
     current_user: UserModel = Depends(get_current_active_user),
 ):
+    """
+    Validates the submission and reads the image into memory (capped), then returns a job id right away
+    (with an Idempotency-Key, a retried submission gets the same job back instead of queueing another).
+    Poll GET /correct-composition/jobs/{job_id} or subscribe to .../events (SSE) for the result.
+    `include_raw` is decided here: the stored result is already shaped, so slim jobs don't keep the raw response.
+    """
+    submission = await read_composition_submission(composition_text, composition_image, detach=True)
+    dify_user_identifier = str(current_user.id)
+
+    async def work() -> Dict[str, Any]:
+        return shape_dify_result(await run_composition_correction(submission, dify_user_identifier), include_raw)
+
+    def map_error(e: BaseException) -> Dict[str, Any]:
+        http_error = e if isinstance(e, HTTPException) else composition_error_to_http(e)
+        return {"status_code": http_error.status_code, "detail": http_error.detail}
+
+    async def queue() -> Dict[str, Any]:
+        try:
+            job = composition_job_pool.submit(current_user.id, work, map_error)
+        except CompositionJobQueueFull as e:
+            logger.warning("Composition job rejected", extra={"reason": str(e)})
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="作文批改任务繁忙，请稍后再试。")
+
+        logger.info("Composition job queued", extra={"job_id": job.job_id, "user_id": current_user.id})
+        return {
+            "job_id": job.job_id,
+            "status": job.status,
+            "status_url": request.app.url_path_for("get_composition_job_endpoint", job_id=job.job_id),
+            "events_url": request.app.url_path_for("composition_job_events_endpoint", job_id=job.job_id),
+        }
+
+    fingerprint = [submission.text, submission.image_sha256, include_raw]
+    return await idempotent_json_response(request, idempotency_key, current_user.id, fingerprint, queue, status_code=status.HTTP_202_ACCEPTED)
+
+
+def get_user_composition_job(job_id: str, current_user: UserModel) -> CompositionJob:
+    job = composition_job_pool.get(job_id)
+    if job is None or job.user_id != current_user.id: # Other users' jobs are indistinguishable from expired ones
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="作文批改任务不存在或已过期。")
+    return job
+
+
+@router.get("/correct-composition/jobs/{job_id}", summary="Status (and result, once finished) of a composition correction job")
+async def get_composition_job_endpoint(
+    job_id: str,
+    current_user: UserModel = Depends(get_current_active_user),
+):
+    return get_user_composition_job(job_id, current_user).to_dict()
+
+
+@router.get("/correct-composition/jobs/{job_id}/events", summary="Composition correction job status streamed as SSE")
+async def composition_job_events_endpoint(
+    job_id: str,
+    current_user: UserModel = Depends(get_current_active_user),
+):
+    """
+    Emits a 'status' event on every status change, then 'workflow_finished' (same data as
+    /correct-composition) or 'error' ({status_code, detail}) and closes.
+    """
+    job = get_user_composition_job(job_id, current_user)
+
+    async def relay_job_events() -> AsyncIterator[str]:
+        seen_version = -1
+        while True:
+            if job.version != seen_version:
+                seen_version = job.version
+                yield format_sse_event("status", {"job_id": job.job_id, "status": job.status})
+                if job.status == "succeeded":
+                    yield format_sse_event("workflow_finished", job.result or {})
+                    return
+                if job.status == "failed":
+                    yield format_sse_event("error", job.error or {})
+                    return
+            if not await job.wait_for_change(seen_version, timeout=COMPOSITION_JOB_PING_INTERVAL_SECONDS):
+                yield ": ping\n\n" # Keep proxies from closing an idle connection
+
+    return StreamingResponse(relay_job_events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@dataclass
+class CompositionSubmission:
+    """
+    A validated composition submission. The image is either still the request's UploadFile, streamed to
+    Dify as it is read, or (job mode) detached into memory so it can outlive the request.
+    """
+    text: Optional[str] = None
+    image_file: Optional[UploadFile] = None
+    image_content: Optional[bytes] = None
+    image_size: Optional[int] = None
+    image_filename: Optional[str] = None
+    image_mime_type: Optional[str] = None
+    image_category: Optional[str] = None
+    image_sha256: Optional[str] = None # Content address for the upload cache
+
+    @property
+    def has_image(self) -> bool:
+        return self.image_file is not None or self.image_content is not None
+
+    async def iter_image_chunks(self) -> AsyncIterator[bytes]:
+        if self.image_content is not None:
+            yield self.image_content
+            return
+        await self.image_file.seek(0)
+        while True:
+            chunk = await self.image_file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def read_composition_submission(
+    composition_text: Optional[str],
+    composition_image: Optional[UploadFile],
+    detach: bool = False,
+) -> CompositionSubmission:
+    """
+    Checks the configuration and validates the text/image (size cap, extension + magic bytes).
+    With `detach` the image is read into memory (capped) and the UploadFile closed, for use after the request.
+    """
     # 检查作文批改服务的核心配置 (这部分逻辑是好的，保持)
     if not settings.COMPOSITION_APP_API_KEY or \
        not settings.COMPOSITION_APP_BASE_URL or \
@@ -213,208 +560,583 @@ async def correct_composition_endpoint(
        not settings.COMPOSITION_TEXT_INPUT_KEY or \
        not settings.COMPOSITION_FILE_INPUT_KEY or \
        not settings.COMPOSITION_TEXT_OUTPUT_KEY:
-        print("[API ERROR] Composition correction service is not properly configured in settings.")
+        logger.error("Composition correction service is not properly configured in settings.")
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="作文批改服务配置不完整。")
 
     if not composition_text and not composition_image:
-        print("[API VALIDATION] User must provide either text or an image for composition correction.")
+        logger.info("Composition correction request without text or image.")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="请提供作文文本或上传作文图片。")
 
-    dify_user_identifier = str(current_user.id)
-    workflow_inputs: Dict[str, Any] = {}
-    temp_filepath: Optional[str] = None # Initialize for finally block
-    original_filename: Optional[str] = None
+    submission = CompositionSubmission(text=composition_text or None)
 
-    try:
-        # 处理文本输入
-        if composition_text:
-            workflow_inputs[settings.COMPOSITION_TEXT_INPUT_KEY] = composition_text
-            print(f"Composition text for Dify: '{composition_text}' using key '{settings.COMPOSITION_TEXT_INPUT_KEY}'")
-
-        # 处理图片文件输入
-        if composition_image:
+    # 处理图片文件输入
+    if composition_image:
+        try:
             original_filename = composition_image.filename
             if not original_filename: # Should not happen if UploadFile is present
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="上传的作文图片没有有效的文件名。")
-            
-            file_extension = os.path.splitext(original_filename)[1]
-            temp_filename_only = f"{uuid.uuid4()}{file_extension}"
-            temp_filepath = os.path.join(TEMP_UPLOAD_DIR, temp_filename_only)
-            
-            print(f"Saving uploaded composition image temporarily to: {temp_filepath}")
-            try:
-                with open(temp_filepath, "wb") as buffer:
-                    content = await composition_image.read()
-                    buffer.write(content)
-            except Exception as e_save:
-                print(f"Error saving temporary file: {e_save}")
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="保存上传文件时出错。")
-            finally:
-                await composition_image.close() # Ensure file is closed
-
-            dify_file_category, mime_type, detected_ext = determine_file_category_and_mime(original_filename)
-            
+
+            max_bytes = max_image_input_bytes()
+            if composition_image.size is not None and composition_image.size > max_bytes:
+                raise UploadTooLargeError(max_bytes)
+
+            head = await composition_image.read(MAGIC_SNIFF_BYTES)
+            await composition_image.seek(0)
+            dify_file_category, mime_type, detected_ext = determine_file_category_and_mime(original_filename, head)
+
             # 根据Dify文档，文件类型（type）可以是 "image", "document", "audio", "video", "custom"
             # 对于作文批改，我们主要期望图片。
             if not dify_file_category or dify_file_category != "image": # 严格要求是图片类型
-                if temp_filepath and os.path.exists(temp_filepath): os.remove(temp_filepath)
-                print(f"Invalid file type for composition: {dify_file_category}, original: {original_filename}")
+                logger.info("Invalid file type for composition", extra={"category": dify_file_category, "upload_filename": original_filename})
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"作文批改仅支持图片文件。检测到的类型: {dify_file_category or '未知'}")
 
             if not mime_type: # Should be set if category is "image"
-                if temp_filepath and os.path.exists(temp_filepath): os.remove(temp_filepath)
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无法确定上传文件的MIME类型。")
 
-            # 上传文件到Dify的文件服务获取upload_file_id
-            print(f"Uploading '{original_filename}' (as Dify type '{dify_file_category}') to Dify file service for user '{dify_user_identifier}'...")
-            dify_upload_id = upload_file_to_dify(
-                temp_filepath,
-                mime_type,
+            submission.image_filename = original_filename
+            submission.image_mime_type = mime_type
+            submission.image_category = dify_file_category
+            submission.image_file = composition_image
+
+            # One local pass: enforce the size cap, hash for the upload cache, and copy into memory if the image must
+            # outlive the request (detach) or will be preprocessed anyway; otherwise it streams to Dify from the upload.
+            digest = hashlib.sha256()
+            content = bytearray() if detach or image_preprocessor.applies(composition_image.size, mime_type) else None
+            size = 0
+            async for chunk in submission.iter_image_chunks():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                if content is not None:
+                    content += chunk
+            submission.image_sha256 = digest.hexdigest()
+            submission.image_size = size
+            if content is not None:
+                submission.image_content = bytes(content)
+                submission.image_file = None
+        except UploadTooLargeError as e:
+            await composition_image.close()
+            raise composition_error_to_http(e)
+        except BaseException:
+            await composition_image.close()
+            raise
+        if detach:
+            await composition_image.close()
+
+    return submission
+
+
+async def preprocess_composition_image(submission: CompositionSubmission) -> None:
+    """
+    Downscales/re-encodes the image on the preprocessing pool (see image_preprocessing) and swaps it into
+    the submission, if it is large or in another format (ImagePreprocessor.applies); other images are left alone.
+    The upload cache stays keyed by the original bytes, so cache hits skip this step too.
+    """
+    if not image_preprocessor.applies(submission.image_size, submission.image_mime_type):
+        return
+    if submission.image_content is None:
+        submission.image_content = b"".join([chunk async for chunk in submission.iter_image_chunks()])
+        submission.image_file = None
+    processed = await image_preprocessor.preprocess(submission.image_content)
+    if processed is None:
+        return
+    submission.image_content = processed.content
+    submission.image_size = len(processed.content)
+    submission.image_mime_type = processed.mime_type
+    submission.image_filename = preprocessed_filename(submission.image_filename, processed)
+
+
+async def build_composition_payload(
+    submission: CompositionSubmission,
+    dify_user_identifier: str,
+) -> Dict[str, Any]:
+    """Streams the image (if any) to Dify's file service and returns the workflow payload."""
+    workflow_inputs: Dict[str, Any] = {}
+
+    # 处理文本输入
+    if submission.text:
+        workflow_inputs[settings.COMPOSITION_TEXT_INPUT_KEY] = submission.text
+
+    # 处理图片文件输入
+    if submission.has_image:
+        upload_cache = get_upload_cache()
+        dify_upload_id = upload_cache.get("composition", dify_user_identifier, submission.image_sha256, submission.image_size) if submission.image_sha256 else None
+        if dify_upload_id:
+            logger.info("Reusing Dify upload of identical composition image", extra={"sha256": submission.image_sha256[:12], "upload_file_id": dify_upload_id})
+        else:
+            await preprocess_composition_image(submission)
+            # 上传文件到Dify的文件服务获取upload_file_id (no temp file: chunks go straight from the upload to Dify)
+            dify_upload_id = await upload_file_to_dify(
+                submission.iter_image_chunks(),
+                submission.image_filename,
+                submission.image_mime_type,
                 dify_user_identifier,
                 api_base_url=settings.COMPOSITION_APP_BASE_URL, # Pass app-specific URL
-                api_key=settings.COMPOSITION_APP_API_KEY      # Pass app-specific Key
+                api_key=settings.COMPOSITION_APP_API_KEY,     # Pass app-specific Key
+                size=submission.image_size,
+                dify_app="composition",
             )
-            print(f"Composition image uploaded to Dify, Dify Upload ID: {dify_upload_id}")
-            
-            # --- MODIFICATION: Pass a single file object, not a list ---
-            # Dify的错误信息 "composition_image in input form must be a file" 暗示
-            # 这个特定的输入变量期望一个文件对象，而不是文件对象列表。
-            workflow_inputs[settings.COMPOSITION_FILE_INPUT_KEY] = {
-                "transfer_method": "local_file", # Per Dify docs for uploaded files
-                "upload_file_id": dify_upload_id,
-                "type": dify_file_category       # e.g., "image" (来自 determine_file_category_and_mime)
-            }
-            # --- END MODIFICATION ---
-            print(f"Composition image input for Dify (as single object): using key '{settings.COMPOSITION_FILE_INPUT_KEY}' with ID '{dify_upload_id}' and type '{dify_file_category}'")
-        
-        # 确保至少有一个输入被处理了 (文本或图片)
-        if not workflow_inputs:
-             # This case should ideally be caught by the initial check:
-             # `if not composition_text and not composition_image:`
-             # But as a safeguard:
-             print("[API VALIDATION] No inputs were prepared for Dify workflow.")
-             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="未提供有效输入进行作文批改。")
-        
-        # 构建发送给Dify的完整payload
-        dify_payload = {
-            "inputs": workflow_inputs,
-            "response_mode": "blocking",
-            "user": dify_user_identifier,
+            logger.debug("Composition image uploaded to Dify", extra={"upload_file_id": dify_upload_id})
+            if submission.image_sha256:
+                upload_cache.set("composition", dify_user_identifier, submission.image_sha256, submission.image_size, dify_upload_id)
+
+        # --- MODIFICATION: Pass a single file object, not a list ---
+        # Dify的错误信息 "composition_image in input form must be a file" 暗示
+        # 这个特定的输入变量期望一个文件对象，而不是文件对象列表。
+        workflow_inputs[settings.COMPOSITION_FILE_INPUT_KEY] = {
+            "transfer_method": "local_file", # Per Dify docs for uploaded files
+            "upload_file_id": dify_upload_id,
+            "type": submission.image_category       # e.g., "image" (来自 determine_file_category_and_mime)
         }
-        
-        # 调用Dify API
-        print(f"Calling Dify workflow for composition correction with payload: {json.dumps(dify_payload, indent=2, ensure_ascii=False)}")
-        dify_response_data = call_dify_api(
+        # --- END MODIFICATION ---
+    
+    # 确保至少有一个输入被处理了 (文本或图片)
+    if not workflow_inputs:
+         # This case should ideally be caught by the initial check:
+         # `if not composition_text and not composition_image:`
+         # But as a safeguard:
+         logger.info("No inputs were prepared for Dify workflow.")
+         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="未提供有效输入进行作文批改。")
+    
+    # 构建发送给Dify的完整payload
+    return {
+        "inputs": workflow_inputs,
+        "response_mode": "blocking",
+        "user": dify_user_identifier,
+    }
+
+
+def build_composition_result(dify_response_data: Dict[str, Any]) -> Dict[str, Any]:
+    # 从Dify响应中提取批改结果文本
+    ai_feedback_text = extract_text_from_dify_response(dify_response_data, settings.COMPOSITION_TEXT_OUTPUT_KEY)
+    
+    return {
+        "message": "作文批改请求已处理。",
+        "ai_text": ai_feedback_text,
+        "dify_full_outputs": dify_response_data
+    }
+
+
+async def run_composition_correction(submission: CompositionSubmission, dify_user_identifier: str) -> Dict[str, Any]:
+    """Upload + blocking workflow call; shared by /correct-composition and the job workers."""
+    dify_payload = await build_composition_payload(submission, dify_user_identifier)
+
+    # 调用Dify API
+    try:
+        dify_response_data = await call_dify_api(
             dify_base_url=settings.COMPOSITION_APP_BASE_URL,
             dify_api_key=settings.COMPOSITION_APP_API_KEY,
             dify_api_endpoint_path=settings.COMPOSITION_APP_API_ENDPOINT, # Usually "/workflows/run"
-            payload=dify_payload
+            payload=dify_payload,
+            dify_app="composition"
         )
-        
-        # 从Dify响应中提取批改结果文本
-        ai_feedback_text = extract_text_from_dify_response(dify_response_data, settings.COMPOSITION_TEXT_OUTPUT_KEY)
-        
-        return {
-            "message": "作文批改请求已处理。",
-            "ai_text": ai_feedback_text,
-            "dify_full_outputs": dify_response_data
-        }
-
     except DifyWorkflowError as e:
-        print(f"[API ERROR] DifyWorkflowError during composition correction: {str(e)}, Details: {e.details}")
+        if e.status_code < 500 and submission.image_sha256:
+            # Dify may have dropped a cached upload_file_id; make the next attempt upload again.
+            get_upload_cache().invalidate("composition", dify_user_identifier, submission.image_sha256)
+        raise
+    return build_composition_result(dify_response_data)
+
+
+def composition_error_to_http(e: Exception) -> HTTPException:
+    """Maps errors raised while correcting a composition to the HTTP error returned to the client."""
+    if isinstance(e, DifyWorkflowError):
+        logger.warning("DifyWorkflowError during composition correction", extra={"status_code": e.status_code, "error": str(e)})
         # Try to extract a more user-friendly message from Dify's error details if possible
         detail_message = str(e)
         if e.details and isinstance(e.details, dict) and "message" in e.details:
             detail_message = f"Dify服务错误: {e.details['message']}"
-        raise HTTPException(status_code=e.status_code, detail=detail_message)
-    except HTTPException: # Re-raise if it's already an HTTPException (e.g., from file validation)
-        raise
-    except IOError as e:
-        print(f"[API ERROR] IOError during composition correction: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"文件处理失败: {str(e)}")
-    except ValueError as e:
-        print(f"[API ERROR] ValueError during composition correction: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"请求参数或数据格式错误: {str(e)}")
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"作文批改时发生意外服务器错误。")
-    finally:
-        # 清理临时上传的文件
-        if temp_filepath and os.path.exists(temp_filepath):
-            try:
-                os.remove(temp_filepath)
-                print(f"Temporary composition file {temp_filepath} removed.")
-            except Exception as e_remove:
-                print(f"Error removing temp composition file {temp_filepath}: {e_remove}")
+        return HTTPException(status_code=e.status_code, detail=detail_message)
+    if isinstance(e, UploadTooLargeError):
+        logger.info("Composition image rejected", extra={"reason": str(e)})
+        return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"作文图片过大，最大允许 {e.max_bytes / (1024 * 1024):.1f} MB。")
+    if isinstance(e, IOError):
+        logger.error("IOError during composition correction", extra={"error": str(e)})
+        return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"文件处理失败: {str(e)}")
+    if isinstance(e, ValueError):
+        logger.warning("ValueError during composition correction", extra={"error": str(e)})
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"请求参数或数据格式错误: {str(e)}")
+    logger.error("Unexpected error during composition correction", exc_info=e)
+    return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"作文批改时发生意外服务器错误。")
+
 
 @router.post("/generate-vocabulary", summary="Generate vocabulary based on keywords")
 async def generate_vocabulary_endpoint(
+    request: Request,
     request_data: GenerateWordsRequest,
+    include_raw: bool = Depends(include_raw_param),
+    idempotency_key: Optional[str] = Depends(idempotency_key_param),
+    db: SQLAlchemySession = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user),
 ):
+    known_words = known_word_filter.known_words(db, current_user.id)
+
+    async def generate() -> Dict[str, Any]:
+        return shape_dify_result(await run_vocabulary_generation(request_data, str(current_user.id), known_words), include_raw)
+
+    try:
+        # Words are plain JSON data already (validated once in build_vocabulary_result), rendered without jsonable_encoder
+        return await idempotent_json_response(request, idempotency_key, current_user.id, [request_data.model_dump(), include_raw], generate)
+    except HTTPException:
+        raise
+    except DifyWorkflowError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.exception("Unexpected error during vocabulary generation")
+        raise HTTPException(status_code=500, detail=f"生成单词时发生意外错误: {type(e).__name__}")
+
+
+@router.post("/generate-vocabulary/batch", summary="Generate vocabulary for many keyword sets at once (bounded fan-out)")
+async def generate_vocabulary_batch_endpoint(
+    request_data: BatchGenerateWordsRequest,
+    stream: bool = Query(False, description="Stream one NDJSON line per item as it completes instead of one JSON body in item order"),
+    include_raw: bool = Depends(include_raw_param),
+    db: SQLAlchemySession = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user),
+):
+    dify_user_identifier = str(current_user.id)
+    known_words = known_word_filter.known_words(db, current_user.id) # Loaded once for the whole batch
+    return await batch_response(
+        request_data.items,
+        lambda item: run_vocabulary_generation(item, dify_user_identifier, known_words),
+        stream=stream,
+        include_raw=include_raw,
+        dify_app="vocab",
+    )
+
+
+@router.post("/generate-vocabulary/stream", summary="Vocabulary generation with workflow progress streamed as SSE")
+async def generate_vocabulary_stream_endpoint(
+    request_data: GenerateWordsRequest,
+    include_raw: bool = Depends(include_raw_param),
+    current_user: UserModel = Depends(get_current_active_user),
+):
+    dify_payload = build_vocabulary_payload(request_data, str(current_user.id))
+    return await stream_workflow_endpoint(
+        dify_base_url=settings.VOCAB_GEN_APP_BASE_URL,
+        dify_api_key=settings.VOCAB_GEN_APP_API_KEY,
+        dify_api_endpoint_path=settings.VOCAB_GEN_APP_API_ENDPOINT,
+        payload=dify_payload,
+        dify_app="vocab",
+        build_result=build_vocabulary_result,
+        include_raw=include_raw,
+    )
+
+
+@router.post("/generate-vocabulary/ndjson", summary="Vocabulary generation streamed as NDJSON, one line per word as soon as it is complete")
+async def generate_vocabulary_ndjson_endpoint(
+    request_data: GenerateWordsRequest,
+    current_user: UserModel = Depends(get_current_active_user),
+):
+    """
+    Parses the word list while the LLM is still writing it (Dify 'text_chunk' events) and emits one
+    JSON object per line (application/x-ndjson):
+      {"type": "word", "index": i, "word": {...}}       a complete, valid word
+      {"type": "skipped", "index": i, "detail": "..."}  a complete array element that is not a valid word
+      {"type": "done", "count": n, "source": "stream" | "final" | "stream+final", "time_to_first_word_ms": ..., "total_ms": ...}
+      {"type": "error", "status_code": ..., "detail": "...", "emitted": n}   terminal, nothing follows
+    If the streamed text is not a parseable array (e.g. the workflow post-processes the LLM output), the
+    words not emitted yet are taken from the final workflow output instead ("source": "final").
+    """
+    dify_payload = build_vocabulary_payload(request_data, str(current_user.id))
+    started_at = time.perf_counter()
+    events = await open_dify_stream(stream_dify_api(
+        dify_base_url=settings.VOCAB_GEN_APP_BASE_URL,
+        dify_api_key=settings.VOCAB_GEN_APP_API_KEY,
+        dify_api_endpoint_path=settings.VOCAB_GEN_APP_API_ENDPOINT,
+        payload=dify_payload,
+        dify_app="vocab"
+    ))
+
+    def ndjson_line(record: Dict[str, Any]) -> bytes:
+        return json_codec.dumps(record) + b"\n"
+
+    async def relay_words() -> AsyncIterator[bytes]:
+        parser: Optional[IncrementalJSONArrayParser] = IncrementalJSONArrayParser()
+        consumed = 0 # Array elements handled (emitted or skipped)
+        emitted = 0
+        words: List[Dict[str, Any]] = []
+        first_word_ms: Optional[float] = None
+        source = "stream"
+        try:
+            async for event in events:
+                event_type = event.get("event")
+                if event_type == "text_chunk" and parser is not None:
+                    try:
+                        elements = parser.feed((event.get("data") or {}).get("text", ""))
+                    except IncrementalJSONError as e:
+                        # Keep going: the final output may still be valid (handled at workflow_finished)
+                        logger.warning("Streamed word list is malformed, falling back to the final output", extra={"error": str(e), "emitted": emitted})
+                        parser = None
+                        elements = e.completed
+                    for element in elements:
+                        try:
+                            word = DifyWordSchema.model_validate(element).model_dump(mode="json", exclude_unset=True)
+                        except ValidationError as e:
+                            yield ndjson_line({"type": "skipped", "index": consumed, "detail": f"{e.errors()[0]['msg']} ({e.errors()[0]['loc']})"})
+                        else:
+                            if first_word_ms is None:
+                                first_word_ms = (time.perf_counter() - started_at) * 1000
+                            yield ndjson_line({"type": "word", "index": consumed, "word": word})
+                            words.append(word)
+                            emitted += 1
+                        consumed += 1
+                elif event_type == "workflow_finished":
+                    if parser is None or not parser.finished:
+                        # Nothing (complete) was streamed: the remaining words come from the final output
+                        blocking_body = {k: v for k, v in event.items() if k != "event"}
+                        final_words = build_vocabulary_result(parse_dify_result(blocking_body, settings.VOCAB_GEN_APP_API_ENDPOINT))["words"]
+                        source = "final" if consumed == 0 else "stream+final"
+                        for index in range(consumed, len(final_words)):
+                            if first_word_ms is None:
+                                first_word_ms = (time.perf_counter() - started_at) * 1000
+                            yield ndjson_line({"type": "word", "index": index, "word": final_words[index]})
+                            words.append(final_words[index])
+                            emitted += 1
+                    vocab_word_bank.add(request_data.keywords, words)
+                    word_detail_store.save(words)
+                    total_ms = (time.perf_counter() - started_at) * 1000
+                    logger.info("Vocabulary NDJSON stream finished", extra={"words": emitted, "source": source, "time_to_first_word_ms": first_word_ms, "total_ms": round(total_ms, 1)})
+                    yield ndjson_line({
+                        "type": "done",
+                        "count": emitted,
+                        "source": source,
+                        "time_to_first_word_ms": round(first_word_ms, 1) if first_word_ms is not None else None,
+                        "total_ms": round(total_ms, 1),
+                    })
+                    return
+            raise DifyWorkflowError("Dify stream ended before the workflow finished.", status_code=502)
+        except DifyWorkflowError as e:
+            logger.warning("DifyWorkflowError during vocabulary NDJSON stream", extra={"status_code": e.status_code, "error": str(e), "emitted": emitted})
+            yield ndjson_line({"type": "error", "status_code": e.status_code, "detail": str(e), "emitted": emitted})
+
+    return StreamingResponse(relay_words(), media_type="application/x-ndjson", headers=SSE_HEADERS)
+
+
+def build_vocabulary_payload(request_data: GenerateWordsRequest, dify_user_identifier: str, exclude_words: Sequence[str] = ()) -> Dict[str, Any]:
     if not settings.VOCAB_GEN_APP_API_KEY or not settings.VOCAB_GEN_APP_BASE_URL: # 检查 Base URL
         raise HTTPException(status_code=503, detail="单词生成服务未正确配置 (API Key or Base URL)。")
     if not settings.VOCAB_GEN_APP_API_ENDPOINT or not settings.VOCAB_GEN_INPUT_KEY or not settings.VOCAB_GEN_WORD_COUNT_KEY or not settings.VOCAB_GEN_OUTPUT_KEY:
         raise HTTPException(status_code=503, detail="单词生成服务Dify工作流变量名未正确配置。")
 
-
-    dify_user_identifier = str(current_user.id)
-    
     # 构建发送给 Dify 工作流的 inputs 对象
     dify_workflow_inputs = {
         settings.VOCAB_GEN_INPUT_KEY: request_data.keywords,
         settings.VOCAB_GEN_WORD_COUNT_KEY: request_data.word_count # 使用配置的键名
     }
+    if settings.VOCAB_GEN_EXCLUDE_KEY and exclude_words:
+        dify_workflow_inputs[settings.VOCAB_GEN_EXCLUDE_KEY] = ", ".join(exclude_words)
 
-    dify_payload = {
+    return {
         "inputs": dify_workflow_inputs,
         "response_mode": "blocking",
         "user": dify_user_identifier,
     }
+
+
+async def run_vocabulary_generation(
+    request_data: GenerateWordsRequest,
+    dify_user_identifier: str,
+    known_words: FrozenSet[str] = frozenset(),
+) -> Dict[str, Any]:
+    """
+    One vocabulary generation, shared by the single and the batch endpoint. Raises HTTPException / DifyWorkflowError.
+    Words in `known_words` (the user's KNOWN/MASTERED words, casefolded) are dropped. To still return `word_count`
+    fresh words, Dify is asked for more up front (KnownWordFilter.fetch_count) and, only if that falls short, once more.
+    """
+    if not known_words:
+        return await generate_vocabulary_or_fallback(request_data, dify_user_identifier)
+
+    known_word_filter.requests += 1
+    fetch_count = known_word_filter.fetch_count(dify_user_identifier, request_data.word_count, known_words)
+    result = await generate_vocabulary_or_fallback(request_data.model_copy(update={"word_count": fetch_count}), dify_user_identifier)
+    generated = result["words"]
+    fresh = [word for word in generated if dify_word_text(word).casefold() not in known_words]
+    known_word_filter.record(dify_user_identifier, generated=len(generated), dropped=len(generated) - len(fresh))
+
+    missing = request_data.word_count - len(fresh)
+    if missing <= 0:
+        if len(fresh) < len(generated):
+            known_word_filter.second_calls_avoided += 1
+    elif result.get("source") != "word_bank":
+        # Ask for a longer list: the caches top up the one we have instead of generating it again
+        second_count = min(len(generated) + known_word_filter.fetch_count(dify_user_identifier, missing, known_words), settings.VOCAB_GEN_OVERFETCH_MAX_WORDS)
+        if second_count > len(generated):
+            known_word_filter.second_calls += 1
+            more = await generate_vocabulary_or_fallback(request_data.model_copy(update={"word_count": second_count}), dify_user_identifier)
+            seen = known_words | {dify_word_text(word).casefold() for word in fresh}
+            fresh += [word for word in more["words"] if dify_word_text(word).casefold() not in seen]
+    return {**result, "words": fresh[:request_data.word_count]}
+
+
+async def generate_vocabulary_or_fallback(request_data: GenerateWordsRequest, dify_user_identifier: str) -> Dict[str, Any]:
+    """
+    While the vocab app is degraded (slower than VOCAB_WORD_BANK_FALLBACK_AFTER_SECONDS, circuit open, at capacity,
+    failing upstream) the words come from the local word bank instead, flagged with "source": "word_bank".
+    Without banked words for the keywords, the Dify call is awaited (or its error raised) as usual.
+    """
+    if not vocab_word_bank.enabled:
+        return await generate_vocabulary_cached(request_data, dify_user_identifier)
+
+    generation = asyncio.ensure_future(generate_vocabulary_cached(request_data, dify_user_identifier))
+    # The call may end up unawaited (served from the bank, client gone); mark its outcome as retrieved
+    generation.add_done_callback(lambda finished: finished.cancelled() or finished.exception())
+    fallback_after = settings.VOCAB_WORD_BANK_FALLBACK_AFTER_SECONDS or None
+    error: Optional[DifyWorkflowError] = None
     try:
-        print(f"Calling Vocab Gen Dify. User: {dify_user_identifier}, Inputs: {dify_workflow_inputs}")
-        dify_response_data = call_dify_api(
-            dify_base_url=settings.VOCAB_GEN_APP_BASE_URL,
-            dify_api_key=settings.VOCAB_GEN_APP_API_KEY,
-            dify_api_endpoint_path=settings.VOCAB_GEN_APP_API_ENDPOINT,
-            payload=dify_payload
-        )
-        
-        generated_words_data = dify_response_data.get(settings.VOCAB_GEN_OUTPUT_KEY)
-        generated_words: List[Dict[str, Any]] = []
-
-        if isinstance(generated_words_data, str):
-            try:
-                parsed_data = json.loads(generated_words_data)
-                if isinstance(parsed_data, list): generated_words = parsed_data
-                else: raise DifyWorkflowError("AI返回的单词列表格式无效 (解析后不是列表)。", details=dify_response_data)
-            except json.JSONDecodeError:
-                raise DifyWorkflowError(f"AI返回的单词列表格式无效 (JSON字符串解析失败)。内容: {generated_words_data[:200]}...", details=dify_response_data)
-        elif isinstance(generated_words_data, list):
-            generated_words = generated_words_data
+        # Shielded: after a timeout the call keeps running, so its words still reach the caches and the bank
+        return await asyncio.wait_for(asyncio.shield(generation), timeout=fallback_after)
+    except asyncio.TimeoutError:
+        reason = "slow_upstream"
+    except DifyWorkflowError as e:
+        if not (is_upstream_failure(e) or is_local_rejection(e)):
+            raise
+        error = e
+        reason = e.details.get("reason", "upstream_error") if isinstance(e.details, dict) else "upstream_error"
+
+    words = vocab_word_bank.lookup(request_data.keywords, request_data.word_count)
+    if words:
+        logger.warning("Vocabulary served from the local word bank", extra={"keywords": request_data.keywords, "reason": reason, "words": len(words)})
+        return {"message": "单词列表生成成功。", "words": words, "dify_full_outputs": None, "source": "word_bank", "fallback_reason": reason}
+    if error is not None:
+        raise error
+    return await generation # Nothing banked for these keywords: keep waiting for Dify
+
+
+async def generate_vocabulary_cached(request_data: GenerateWordsRequest, dify_user_identifier: str) -> Dict[str, Any]:
+    """
+    Near-duplicate keywords are served from the semantic cache: its list is truncated to `word_count`, or topped up
+    by another Dify call for the missing words. Lists served from it carry no raw Dify output.
+    The LLM tends to repeat the words it gave before, so a top-up either tells the workflow which words to leave out
+    (VOCAB_GEN_EXCLUDE_KEY) or, without that input, asks for the held words plus twice the missing ones and keeps
+    the new ones. A list that a top-up could not extend is served short from then on instead of topped up again.
+    """
+    if not vocab_semantic_cache.enabled:
+        return await generate_vocabulary_upstream(request_data, dify_user_identifier)
+
+    scope = "" if settings.VOCAB_GEN_CACHE_SHAREABLE else dify_user_identifier
+    match = vocab_semantic_cache.lookup(scope, request_data.keywords)
+    if match is None:
+        result = await generate_vocabulary_upstream(request_data, dify_user_identifier)
+        vocab_semantic_cache.store(scope, request_data.keywords, result["words"])
+        return result
+
+    words = match.words
+    missing = request_data.word_count - len(words)
+    if missing > 0 and not match.exhausted:
+        held = [dify_word_text(word) for word in words]
+        if settings.VOCAB_GEN_EXCLUDE_KEY:
+            topup_count = missing
         else:
-            raise DifyWorkflowError("AI未能生成有效的单词列表 (期望列表或JSON字符串)。", details=dify_response_data)
+            topup_count = max(min(len(words) + 2 * missing, settings.VOCAB_GEN_OVERFETCH_MAX_WORDS), request_data.word_count)
+        topup = await generate_vocabulary_upstream(request_data.model_copy(update={"word_count": topup_count}), dify_user_identifier, exclude_words=held)
+        seen = {word.casefold() for word in held}
+        added = []
+        for word in topup["words"]:
+            key = dify_word_text(word).casefold()
+            if key not in seen:
+                seen.add(key)
+                added.append(word)
+        vocab_semantic_cache.record_topup(len(added))
+        words = words + added
+        vocab_semantic_cache.store(scope, match.keywords, words, exhausted=not added)
+    logger.debug("Vocabulary served from the semantic cache",
+                 extra={"keywords": request_data.keywords, "matched_keywords": match.keywords, "similarity": match.similarity, "topup": max(missing, 0)})
+    return {"message": "单词列表生成成功。", "words": words[:request_data.word_count], "dify_full_outputs": None}
 
-        return {"message": "单词列表生成成功。", "words": generated_words, "dify_full_outputs": dify_response_data}
-    except DifyWorkflowError as e:
-        raise HTTPException(status_code=e.status_code, detail=str(e))
-    except Exception as e:
-        import traceback; traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"生成单词时发生意外错误: {type(e).__name__}")
+
+async def generate_vocabulary_upstream(request_data: GenerateWordsRequest, dify_user_identifier: str, exclude_words: Sequence[str] = ()) -> Dict[str, Any]:
+    dify_payload = build_vocabulary_payload(request_data, dify_user_identifier, exclude_words)
+    dify_response_data = await call_dify_api(
+        dify_base_url=settings.VOCAB_GEN_APP_BASE_URL,
+        dify_api_key=settings.VOCAB_GEN_APP_API_KEY,
+        dify_api_endpoint_path=settings.VOCAB_GEN_APP_API_ENDPOINT,
+        payload=dify_payload,
+        dify_app="vocab"
+    )
+    result = build_vocabulary_result(dify_response_data)
+    vocab_word_bank.add(request_data.keywords, result["words"])
+    word_detail_store.save(result["words"])
+    return result
+
+
+def build_vocabulary_result(dify_response_data: Dict[str, Any]) -> Dict[str, Any]:
+    generated_words_data = dify_response_data.get(settings.VOCAB_GEN_OUTPUT_KEY)
+
+    # The entries are passed through as Dify sent them (all fields, no per-entry validation), only the list is checked
+    if isinstance(generated_words_data, str):
+        try:
+            generated_words = json_codec.loads(generated_words_data)
+        except json_codec.JSONDecodeError:
+            raise DifyWorkflowError(f"AI返回的单词列表格式无效 (JSON字符串解析失败)。内容: {generated_words_data[:200]}...", details=dify_response_data)
+        if not isinstance(generated_words, list):
+            raise DifyWorkflowError("AI返回的单词列表格式无效 (解析后不是列表)。", details=dify_response_data)
+    elif isinstance(generated_words_data, list):
+        generated_words = generated_words_data
+    else:
+        raise DifyWorkflowError("AI未能生成有效的单词列表 (期望列表或JSON字符串)。", details=dify_response_data)
+
+    return {"message": "单词列表生成成功。", "words": generated_words, "dify_full_outputs": dify_response_data}
 
 
 @router.post("/parse-grammar", summary="Parse grammar of the provided text using Dify")
 async def parse_grammar_endpoint(
     request_data: ParseGrammarRequest, # Uses ParseGrammarRequest Pydantic model
+    include_raw: bool = Depends(include_raw_param),
+    current_user: UserModel = Depends(get_current_active_user),
+):
+    try:
+        return shape_dify_result(await run_grammar_parse(request_data, str(current_user.id)), include_raw)
+    except HTTPException:
+        raise
+    except DifyWorkflowError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.exception("Unexpected error during grammar parsing")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"语法解析时发生意外错误: {type(e).__name__}")
+
+
+@router.post("/parse-grammar/batch", summary="Parse the grammar of many texts at once (bounded fan-out)")
+async def parse_grammar_batch_endpoint(
+    request_data: BatchParseGrammarRequest,
+    stream: bool = Query(False, description="Stream one NDJSON line per item as it completes instead of one JSON body in item order"),
+    include_raw: bool = Depends(include_raw_param),
+    current_user: UserModel = Depends(get_current_active_user),
+):
+    dify_user_identifier = str(current_user.id)
+    return await batch_response(
+        request_data.items,
+        lambda item: run_grammar_parse(item, dify_user_identifier),
+        stream=stream,
+        include_raw=include_raw,
+        dify_app="grammar",
+    )
+
+
+@router.post("/parse-grammar/stream", summary="Grammar parsing with workflow progress streamed as SSE")
+async def parse_grammar_stream_endpoint(
+    request_data: ParseGrammarRequest,
+    include_raw: bool = Depends(include_raw_param),
     current_user: UserModel = Depends(get_current_active_user),
 ):
+    dify_payload = build_grammar_payload(request_data, str(current_user.id))
+    return await stream_workflow_endpoint(
+        dify_base_url=settings.GRAMMAR_PARSE_APP_BASE_URL,
+        dify_api_key=settings.GRAMMAR_PARSE_APP_API_KEY,
+        dify_api_endpoint_path=settings.GRAMMAR_PARSE_APP_API_ENDPOINT,
+        payload=dify_payload,
+        dify_app="grammar",
+        build_result=build_grammar_result,
+        include_raw=include_raw,
+    )
+
+
+def build_grammar_payload(request_data: ParseGrammarRequest, dify_user_identifier: str) -> Dict[str, Any]:
     if not settings.GRAMMAR_PARSE_APP_API_KEY or not settings.GRAMMAR_PARSE_APP_BASE_URL or not settings.GRAMMAR_PARSE_APP_API_ENDPOINT:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="语法解析服务未正确配置。")
 
-    dify_user_identifier = str(current_user.id)
-    
-    dify_payload = {
+    return {
         "inputs": {
             settings.GRAMMAR_PARSE_INPUT_KEY: request_data.text_to_parse
         },
@@ -422,28 +1144,204 @@ async def parse_grammar_endpoint(
         "user": dify_user_identifier,
     }
 
-    try:
-        print(f"Calling Grammar Parse Dify. User: {dify_user_identifier}, Text: '{request_data.text_to_parse[:50]}...'")
-        dify_response_data = call_dify_api(
+
+async def run_grammar_parse(request_data: ParseGrammarRequest, dify_user_identifier: str) -> Dict[str, Any]:
+    """One grammar parse, shared by the single and the batch endpoint. Raises HTTPException / DifyWorkflowError."""
+    dify_payload = build_grammar_payload(request_data, dify_user_identifier)
+    text = request_data.text_to_parse
+    if settings.GRAMMAR_PARSE_CHUNKING_ENABLED and len(text) > settings.GRAMMAR_PARSE_CHUNK_MAX_CHARS:
+        chunks = chunk_text(text, settings.GRAMMAR_PARSE_CHUNK_MAX_CHARS)
+        if len(chunks) > 1:
+            return await run_chunked_grammar_parse(chunks, dify_user_identifier)
+    return build_grammar_result(await call_grammar_app(dify_payload))
+
+
+async def run_chunked_grammar_parse(chunks: List[str], dify_user_identifier: str) -> Dict[str, Any]:
+    """
+    Parses the chunks of a long text concurrently (GRAMMAR_PARSE_CHUNK_CONCURRENCY) and merges the results in order.
+    Every chunk is a regular grammar call, so it is cached on its own: an edited essay only re-parses the changed chunks.
+    The first failing chunk fails the whole parse.
+    """
+    chunk_outputs: List[Dict[str, Any]] = [{}] * len(chunks)
+
+    async def parse_chunk(chunk: str) -> Dict[str, Any]:
+        return await call_grammar_app(build_grammar_payload(ParseGrammarRequest(text_to_parse=chunk), dify_user_identifier))
+
+    async with contextlib.aclosing(bounded_fan_out(chunks, parse_chunk, settings.GRAMMAR_PARSE_CHUNK_CONCURRENCY)) as outcomes:
+        async for index, outputs, error in outcomes:
+            if error is not None:
+                raise error # Closing the fan-out cancels the chunks still running
+            chunk_outputs[index] = outputs
+
+    parsed_result_text = "\n\n".join(extract_text_from_dify_response(outputs, settings.GRAMMAR_PARSE_OUTPUT_KEY) for outputs in chunk_outputs)
+    return {
+        "message": "文本语法解析成功。",
+        "ai_text": parsed_result_text,
+        "parsed_result": parsed_result_text,
+        "chunks": len(chunks),
+        "dify_full_outputs": chunk_outputs
+    }
+
+
+async def call_grammar_app(dify_payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Blocking grammar call, through the micro-batcher when it is enabled."""
+
+    async def call_single(payload: Dict[str, Any]) -> Dict[str, Any]:
+        return await call_dify_api(
             dify_base_url=settings.GRAMMAR_PARSE_APP_BASE_URL,
             dify_api_key=settings.GRAMMAR_PARSE_APP_API_KEY,
             dify_api_endpoint_path=settings.GRAMMAR_PARSE_APP_API_ENDPOINT,
-            payload=dify_payload
+            payload=payload,
+            dify_app="grammar"
         )
-        
-        parsed_result_text = extract_text_from_dify_response(dify_response_data, settings.GRAMMAR_PARSE_OUTPUT_KEY)
-        
-        return {
-            "message": "文本语法解析成功。",
-            "ai_text": parsed_result_text, # Using ai_text for consistency in frontend if it expects this
-            "parsed_result": parsed_result_text, # Or a more specific key
-            "dify_full_outputs": dify_response_data
-        }
-    except DifyWorkflowError as e:
-        raise HTTPException(status_code=e.status_code, detail=str(e))
-    except Exception as e:
-        import traceback; traceback.print_exc()
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"语法解析时发生意外错误: {type(e).__name__}")
+
+    if grammar_micro_batcher.enabled:
+        return await grammar_micro_batcher.call(dify_payload, call_single)
+    return await call_single(dify_payload)
+
+
+def build_grammar_result(dify_response_data: Dict[str, Any]) -> Dict[str, Any]:
+    parsed_result_text = extract_text_from_dify_response(dify_response_data, settings.GRAMMAR_PARSE_OUTPUT_KEY)
+    
+    return {
+        "message": "文本语法解析成功。",
+        "ai_text": parsed_result_text, # Using ai_text for consistency in frontend if it expects this
+        "parsed_result": parsed_result_text, # Or a more specific key
+        "dify_full_outputs": dify_response_data
+    }
+
+
+# --- Shared SSE relay for the workflow apps (composition, vocabulary, grammar) ---
+async def stream_workflow_endpoint(
+    dify_base_url: str,
+    dify_api_key: str,
+    dify_api_endpoint_path: str,
+    payload: Dict[str, Any],
+    dify_app: str,
+    build_result: Callable[[Dict[str, Any]], Dict[str, Any]],
+    include_raw: bool = False,
+) -> StreamingResponse:
+    """
+    Runs a Dify workflow in streaming mode and relays its progress as SSE:
+    'workflow_started', 'node_started', 'node_finished', 'text_chunk', then 'workflow_finished'
+    whose data is exactly what the blocking endpoint returns (built by `build_result`), or 'error'.
+    Node inputs/outputs are not forwarded, only their identity, status and timing.
+    """
+    started_at = time.perf_counter()
+    events = await open_dify_stream(stream_dify_api(
+        dify_base_url=dify_base_url,
+        dify_api_key=dify_api_key,
+        dify_api_endpoint_path=dify_api_endpoint_path,
+        payload=payload,
+        dify_app=dify_app
+    ))
+
+    async def relay_workflow_events() -> AsyncIterator[str]:
+        try:
+            async for event in events:
+                event_type = event.get("event")
+                data = event.get("data") or {}
+                if event_type == "workflow_started":
+                    yield format_sse_event(event_type, {"workflow_run_id": event.get("workflow_run_id"), "task_id": event.get("task_id")})
+                elif event_type == "node_started":
+                    yield format_sse_event(event_type, {k: data.get(k) for k in ("node_id", "node_type", "title", "index")})
+                elif event_type == "node_finished":
+                    yield format_sse_event(event_type, {k: data.get(k) for k in ("node_id", "node_type", "title", "status", "elapsed_time")})
+                elif event_type == "text_chunk":
+                    yield format_sse_event(event_type, {"text": data.get("text", "")})
+                elif event_type == "ping":
+                    yield ": ping\n\n" # Keep proxies from closing an idle connection
+                elif event_type == "workflow_finished":
+                    # Same shape as the blocking /workflows/run body, so it is normalized the same way.
+                    blocking_body = {k: v for k, v in event.items() if k != "event"}
+                    dify_response_data = parse_dify_result(blocking_body, dify_api_endpoint_path)
+                    result = shape_dify_result(build_result(dify_response_data), include_raw)
+                    logger.info("Workflow stream finished", extra={"dify_app": dify_app, "total_ms": round((time.perf_counter() - started_at) * 1000, 1), "status": data.get("status")})
+                    yield format_sse_event(event_type, result)
+                    return
+            raise DifyWorkflowError("Dify stream ended before the workflow finished.", status_code=502)
+        except DifyWorkflowError as e:
+            logger.warning("DifyWorkflowError during workflow stream", extra={"dify_app": dify_app, "status_code": e.status_code, "error": str(e)})
+            yield format_sse_event("error", {"status_code": e.status_code, "detail": str(e)})
+
+    return StreamingResponse(relay_workflow_events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def batch_item_error(e: BaseException) -> Dict[str, Any]:
+    """Status code and detail of one failed batch item, the same the single-item endpoint would have answered."""
+    if isinstance(e, HTTPException):
+        return {"status_code": e.status_code, "detail": e.detail}
+    if isinstance(e, DifyWorkflowError):
+        return {"status_code": e.status_code, "detail": str(e)}
+    logger.error("Unexpected error in batch item", exc_info=e)
+    return {"status_code": status.HTTP_500_INTERNAL_SERVER_ERROR, "detail": f"批量处理时发生意外错误: {type(e).__name__}"}
+
+
+async def batch_response(
+    items: List[Any],
+    run_item: Callable[[Any], Any],
+    stream: bool,
+    include_raw: bool,
+    dify_app: str,
+):
+    """
+    Runs the items with at most DIFY_BATCH_CONCURRENCY in flight. A failing item never fails the batch:
+    every item gets its own status_code and either a result or a detail.
+      stream=false  200 {"results": [{"index", "status_code", "result" | "detail"}, ...] (item order), "succeeded", "failed", "total_ms"}
+      stream=true   NDJSON, {"type": "item", "index", ...} per item in completion order, then {"type": "done", "succeeded", "failed", "total_ms"}
+    """
+    started_at = time.perf_counter()
+
+    def item_record(index: int, result: Any, error: Optional[BaseException]) -> Dict[str, Any]:
+        if error is None:
+            return {"index": index, "status_code": status.HTTP_200_OK, "result": shape_dify_result(result, include_raw)}
+        return {"index": index, **batch_item_error(error)}
+
+    def summary(failed: int) -> Dict[str, Any]:
+        total_ms = round((time.perf_counter() - started_at) * 1000, 1)
+        logger.info("Dify batch finished", extra={"dify_app": dify_app, "items": len(items), "failed": failed, "total_ms": total_ms})
+        return {"succeeded": len(items) - failed, "failed": failed, "total_ms": total_ms}
+
+    if stream:
+        async def ndjson() -> AsyncIterator[bytes]:
+            failed = 0
+            # Closed as soon as the stream is (client gone): the remaining items are cancelled right away
+            async with contextlib.aclosing(bounded_fan_out(items, run_item, settings.DIFY_BATCH_CONCURRENCY)) as outcomes:
+                async for index, result, error in outcomes:
+                    failed += error is not None
+                    yield json_codec.dumps({"type": "item", **item_record(index, result, error)}) + b"\n"
+            yield json_codec.dumps({"type": "done", **summary(failed)}) + b"\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson", headers=SSE_HEADERS)
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    failed = 0
+    async with contextlib.aclosing(bounded_fan_out(items, run_item, settings.DIFY_BATCH_CONCURRENCY)) as outcomes:
+        async for index, result, error in outcomes:
+            failed += error is not None
+            results[index] = item_record(index, result, error)
+    return FastJSONResponse({"results": results, **summary(failed)})
+
+
+@router.get("/stats", summary="Runtime statistics of the Dify call path (cache, coalescing, bulkheads, breakers, retries)")
+async def dify_stats_endpoint(
+    current_user: UserModel = Depends(get_current_active_user),
+):
+    return {
+        "response_cache": response_cache_stats(),
+        "coalescing": single_flight_stats(),
+        "resilience": resilience_stats(),
+        "retries": retry_stats(),
+        "upload_cache": upload_cache_stats(),
+        "image_preprocessing": image_preprocessor.stats(),
+        "composition_jobs": composition_job_pool.stats(),
+        "grammar_microbatch": grammar_micro_batcher.stats(),
+        "vocab_semantic_cache": vocab_semantic_cache.stats(),
+        "vocab_word_bank": vocab_word_bank.stats(),
+        "vocab_known_word_filter": known_word_filter.stats(),
+        "word_details": word_detail_store.stats(),
+        "word_detail_fetcher": word_detail_fetcher.stats(),
+        "idempotency": idempotency_store.stats(),
+    }
 
 # Remember to include your vocabulary_api.router in app/main.py if it's in a separate file.
 # For example, if you created backend/app/apis/vocabulary_api.py:
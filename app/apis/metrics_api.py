@@ -0,0 +1,29 @@
+# backend/app/apis/metrics_api.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import DIFY_APP_SETTINGS_PREFIXES
+from app.core.metrics import registry
+from app.services.composition_jobs import composition_job_pool
+from app.services.dify_resilience import get_bulkhead, get_circuit_breaker
+
+router = APIRouter(tags=["Monitoring"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+_BREAKER_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+# Scrape-time gauges over state the services already keep, so nothing is added to the request path.
+registry.callback_gauge(
+    "dify_bulkhead_waiting", "Calls queued for a free bulkhead slot of a Dify app.", ("dify_app",),
+    lambda: [((dify_app,), get_bulkhead(dify_app).waiting) for dify_app in DIFY_APP_SETTINGS_PREFIXES])
+registry.callback_gauge(
+    "dify_circuit_state", "Circuit breaker state of a Dify app (0 closed, 1 half_open, 2 open).", ("dify_app",),
+    lambda: [((dify_app,), _BREAKER_STATE_VALUES[get_circuit_breaker(dify_app).state]) for dify_app in DIFY_APP_SETTINGS_PREFIXES])
+registry.callback_gauge(
+    "composition_jobs", "Composition correction jobs held in memory, by status.", ("status",),
+    lambda: [((job_status,), count) for job_status, count in composition_job_pool.stats()["by_status"].items()])
+
+
+@router.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
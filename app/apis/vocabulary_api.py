@@ -1,5 +1,7 @@
 # backend/app/apis/vocabulary_api.py
-from fastapi import APIRouter, Depends, HTTPException, status
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from pydantic import ValidationError
 from sqlalchemy.orm import Session as SQLAlchemySession
 from typing import List
 
@@ -8,6 +10,11 @@ from app.db.models import User as UserModel
 from app.apis.auth_api import get_current_active_user
 from app.schemas import vocabulary_schemas as schemas
 from app.crud import vocabulary_crud as crud
+from app.services.known_words import known_word_filter
+from app.services.word_details import word_detail_store
+from app.services.word_detail_fetcher import word_detail_fetcher
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
    # API prefix /api/v1/vocabulary/...
@@ -20,15 +27,14 @@ async def update_single_word_progress(
     db: SQLAlchemySession = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user),
 ):
-    print(f"Received progress update for user {current_user.id}, word: {progress_update.word}, status: {progress_update.status}") # 调试信息
+    logger.debug("Received progress update", extra={"user_id": current_user.id, "word": progress_update.word, "status": progress_update.status}) # 调试信息
     try:
         db_user_word = crud.create_or_update_user_word(db=db, user_id=current_user.id, word_progress=progress_update)
-        print(f"Progress update successful for word ID: {db_user_word.id}") # 调试信息
+        known_word_filter.invalidate(current_user.id)
+        logger.debug("Progress update successful", extra={"user_word_id": db_user_word.id}) # 调试信息
         return db_user_word
     except Exception as e:
-        print(f"Error in update_single_word_progress: {e}") # 调试信息
-        import traceback
-        traceback.print_exc() # 打印完整错误堆栈到后端控制台
+        logger.exception("Error in update_single_word_progress") # 完整错误堆栈写入日志
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="保存单词进度时发生内部错误。")
 
 @router.post("/progress/batch", response_model=List[schemas.UserWordResponse], summary="Update progress for multiple words")
@@ -41,6 +47,7 @@ async def update_batch_word_progress(
     for progress_update in batch_update_request.progress_updates:
         db_user_word = crud.create_or_update_user_word(db=db, user_id=current_user.id, word_progress=progress_update)
         updated_words.append(db_user_word)
+    known_word_filter.invalidate(current_user.id)
     return updated_words
 
 
@@ -52,24 +59,30 @@ async def get_review_list(
   ):
       words_for_review_models = crud.get_words_for_review(db=db, user_id=current_user.id, limit=limit)
       
+      # Details live in the shared word_details table: one IN query for the whole list
+      word_details = crud.get_word_details(db, [user_word_model.word for user_word_model in words_for_review_models])
+
       detailed_review_words = []
+      missing_words = []
       for user_word_model in words_for_review_models:
-          if hasattr(user_word_model, 'dify_word_data_json') and user_word_model.dify_word_data_json:
+          details = word_details.get(crud.normalize_word(user_word_model.word))
+          if details is not None:
+              # Validated one entry at a time: a malformed stored entry costs only its own details, not the whole list
               try:
-                  dify_data = json.loads(user_word_model.dify_word_data_json)
-                  # 确保 dify_data 包含 DifyWordSchema 需要的所有字段，或者用 Pydantic 解析它
-                  # For simplicity, assuming dify_data directly matches DifyWordSchema structure
-                  detailed_review_words.append(dify_data)
-              except json.JSONDecodeError:
-                  print(f"Error parsing stored Dify JSON for word: {user_word_model.word}")
-                  # Fallback: return basic info if JSON is corrupted or missing
-                  detailed_review_words.append({"word": user_word_model.word, "definition_cn": "释义信息丢失"})
-          else:
-              # Fallback if no full Dify data was stored (shouldn't happen if implemented correctly)
-              detailed_review_words.append({"word": user_word_model.word, "definition_cn": "详细信息未存储"})
-      
-      print(f"Returning detailed review list for user {current_user.id}: {len(detailed_review_words)} words")
-      return detailed_review_words # FastAPI will validate against List[schemas.DifyWordSchema]
+                  detailed_review_words.append(schemas.DifyWordSchema.model_validate(details))
+                  continue
+              except ValidationError as e:
+                  logger.warning("Stored word details do not match the schema, replacing them", extra={"word": user_word_model.word, "error": f"{e.errors()[0]['msg']} ({e.errors()[0]['loc']})"})
+          # Not generated through this backend (before details were stored, or stored malformed): placeholder now, backfilled for next time
+          missing_words.append(user_word_model.word)
+          detailed_review_words.append(schemas.DifyWordSchema(word=user_word_model.word, definition_cn="详细信息未存储"))
+      if missing_words:
+          word_detail_store.schedule_backfill(missing_words, word_detail_fetcher.fetch)
+
+      logger.debug("Returning detailed review list", extra={"user_id": current_user.id, "words": len(detailed_review_words), "missing_details": len(missing_words)})
+      # Serialized once by the precompiled adapter; returning a Response skips FastAPI's
+      # second validation against response_model (which stays for the OpenAPI schema).
+      return Response(content=schemas.DIFY_WORD_LIST_ADAPTER.dump_json(detailed_review_words), media_type="application/json")
 
 
 @router.get("/summary", response_model=dict, summary="Get user's vocabulary learning summary")
@@ -2,14 +2,27 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv
 import os
-from typing import Optional
+import logging
+from typing import Any, Optional
+
+from app.core.logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
 
 DOTENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '.env')
-print(f"Attempting to load .env from (config.py): {DOTENV_PATH}")
-if os.path.exists(DOTENV_PATH):
+DOTENV_FOUND = os.path.exists(DOTENV_PATH)
+# Local state files (the vocabulary word bank) live here unless DATA_DIR says otherwise
+DEFAULT_DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data'))
+if DOTENV_FOUND:
     load_dotenv(dotenv_path=DOTENV_PATH)
-else:
-    print(f"[WARNING in config.py] .env file not found at {DOTENV_PATH}. Using environment variables or defaults.")
+
+# Dify app name (as used by the service layer) -> prefix of its per-app settings below
+DIFY_APP_SETTINGS_PREFIXES = {
+    "chat": "CHAT",
+    "composition": "COMPOSITION",
+    "vocab": "VOCAB_GEN",
+    "grammar": "GRAMMAR_PARSE",
+}
 
 class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite:///./test.db"
@@ -17,6 +30,7 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     USER_ID: str = "default_dify_user_from_config" # Default Dify user for API calls
+    DATA_DIR: str = DEFAULT_DATA_DIR # Relative file paths below resolve against this directory, not the working directory
 
     # AI Chat App Config
     CHAT_APP_API_KEY: Optional[str] = None
@@ -24,6 +38,21 @@ class Settings(BaseSettings):
     CHAT_APP_API_ENDPOINT: str = "/chat-messages" # Default to chat app endpoint
     CHAT_TEXT_INPUT_KEY: str = "query"
     CHAT_TEXT_OUTPUT_KEY: str = "answer" # Dify Chat App output is usually 'answer'
+    CHAT_CACHE_ENABLED: bool = False # Chat answers depend on conversation state, never cached by default
+    CHAT_CACHE_SHAREABLE: bool = False
+    CHAT_CACHE_TTL_SECONDS: int = 300
+    CHAT_CACHE_MAX_ENTRIES: int = 256
+    CHAT_COALESCE_ENABLED: bool = False # Duplicate chat messages are rare and answers are not deterministic
+    CHAT_MAX_CONCURRENCY: int = 100 # Per-app bulkhead: slow apps cannot take capacity from the others
+    CHAT_MAX_QUEUE: int = 200
+    CHAT_QUEUE_TIMEOUT_SECONDS: float = 10.0
+    CHAT_BREAKER_FAILURE_THRESHOLD: int = 5 # Consecutive upstream failures/timeouts before failing fast with 503
+    CHAT_BREAKER_RESET_TIMEOUT_SECONDS: float = 30.0 # Open -> half-open probe after this long
+    CHAT_LATENCY_BUDGET_SECONDS: float = 90.0 # Deadline for the whole call, retries included
+    CHAT_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    CHAT_READ_TIMEOUT_SECONDS: float = 60.0 # Per attempt, capped by what is left of the budget
+    CHAT_MAX_RETRIES: int = 0 # Chat messages are not idempotent (they append to the conversation), never retried
+    CHAT_HEDGE_ENABLED: bool = False # Fire a second request when the first exceeds the observed p95
 
     # Composition Correction App Config
     COMPOSITION_APP_API_KEY: Optional[str] = None
@@ -32,6 +61,26 @@ class Settings(BaseSettings):
     COMPOSITION_FILE_INPUT_KEY: str = "composition_image"
     COMPOSITION_TEXT_INPUT_KEY: str = "composition_text"
     COMPOSITION_TEXT_OUTPUT_KEY: str = "correction_feedback"
+    COMPOSITION_CACHE_ENABLED: bool = False
+    COMPOSITION_CACHE_SHAREABLE: bool = False # Compositions are personal work
+    COMPOSITION_CACHE_TTL_SECONDS: int = 600
+    COMPOSITION_CACHE_MAX_ENTRIES: int = 256
+    COMPOSITION_COALESCE_ENABLED: bool = False
+    COMPOSITION_MAX_CONCURRENCY: int = 20 # Image OCR + LLM, the slowest app
+    COMPOSITION_MAX_QUEUE: int = 40
+    COMPOSITION_QUEUE_TIMEOUT_SECONDS: float = 30.0
+    COMPOSITION_BREAKER_FAILURE_THRESHOLD: int = 5 # Consecutive upstream failures/timeouts before failing fast with 503
+    COMPOSITION_BREAKER_RESET_TIMEOUT_SECONDS: float = 60.0 # Open -> half-open probe after this long
+    COMPOSITION_LATENCY_BUDGET_SECONDS: float = 180.0 # Deadline for the whole call, retries included
+    COMPOSITION_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    COMPOSITION_READ_TIMEOUT_SECONDS: float = 150.0 # Per attempt, capped by what is left of the budget
+    COMPOSITION_MAX_RETRIES: int = 1
+    COMPOSITION_HEDGE_ENABLED: bool = False # Fire a second request when the first exceeds the observed p95
+    COMPOSITION_JOB_WORKERS: int = 4 # Background workers for /correct-composition/jobs
+    COMPOSITION_JOB_QUEUE_SIZE: int = 200 # Submissions beyond this are rejected with 503
+    COMPOSITION_JOB_RESULT_TTL_SECONDS: int = 3600 # Finished jobs are kept this long for polling
+    COMPOSITION_JOB_CLEANUP_INTERVAL_SECONDS: int = 60
+    COMPOSITION_JOB_DRAIN_TIMEOUT_SECONDS: float = 60.0 # On shutdown, wait this long for queued/running jobs
 
     # Vocabulary Generation App Config
     VOCAB_GEN_APP_API_KEY: Optional[str] = None
@@ -39,7 +88,32 @@ class Settings(BaseSettings):
     VOCAB_GEN_APP_API_ENDPOINT: str = "/workflows/run"
     VOCAB_GEN_INPUT_KEY: str = "keywords"
     VOCAB_GEN_WORD_COUNT_KEY: str = "count" # 新增
+    VOCAB_GEN_EXCLUDE_KEY: Optional[str] = None # Optional workflow input: comma-separated words to leave out (used by top-ups)
     VOCAB_GEN_OUTPUT_KEY: str = "word_list"
+    VOCAB_GEN_CACHE_ENABLED: bool = True
+    VOCAB_GEN_CACHE_SHAREABLE: bool = True # Same keywords/count give a reusable list for every user
+    VOCAB_GEN_CACHE_TTL_SECONDS: int = 3600
+    VOCAB_GEN_CACHE_MAX_ENTRIES: int = 1024
+    VOCAB_GEN_COALESCE_ENABLED: bool = True # Identical in-flight requests share one upstream call
+    VOCAB_GEN_MAX_CONCURRENCY: int = 50
+    VOCAB_GEN_MAX_QUEUE: int = 100
+    VOCAB_GEN_QUEUE_TIMEOUT_SECONDS: float = 15.0
+    VOCAB_GEN_BREAKER_FAILURE_THRESHOLD: int = 5 # Consecutive upstream failures/timeouts before failing fast with 503
+    VOCAB_GEN_BREAKER_RESET_TIMEOUT_SECONDS: float = 30.0 # Open -> half-open probe after this long
+    VOCAB_GEN_LATENCY_BUDGET_SECONDS: float = 90.0 # Deadline for the whole call, retries included
+    VOCAB_GEN_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    VOCAB_GEN_READ_TIMEOUT_SECONDS: float = 60.0 # Per attempt, capped by what is left of the budget
+    VOCAB_GEN_MAX_RETRIES: int = 2
+    VOCAB_GEN_HEDGE_ENABLED: bool = False # Fire a second request when the first exceeds the observed p95
+    # Semantic cache: near-duplicate keywords ("airport travel" ~ "Airport & travel") reuse a stored word list
+    VOCAB_GEN_SEMANTIC_CACHE_ENABLED: bool = True
+    VOCAB_GEN_SEMANTIC_CACHE_THRESHOLD: float = 0.9 # Minimum cosine similarity of the keyword vectors
+    VOCAB_GEN_SEMANTIC_CACHE_MAX_ENTRIES: int = 2000
+    # Word bank: every generated word is kept on disk and answers requests while the app is slow or failing
+    VOCAB_WORD_BANK_ENABLED: bool = True
+    VOCAB_WORD_BANK_PATH: str = "vocab_word_bank.jsonl" # Relative to DATA_DIR unless absolute
+    VOCAB_WORD_BANK_MAX_WORDS: int = 50000
+    VOCAB_WORD_BANK_FALLBACK_AFTER_SECONDS: float = 10.0 # Answer from the bank once Dify takes longer than this (0 = only on errors)
 
     # Grammar Parsing App Config
     GRAMMAR_PARSE_APP_API_KEY: Optional[str] = None
@@ -47,7 +121,97 @@ class Settings(BaseSettings):
     GRAMMAR_PARSE_APP_API_ENDPOINT: str = "/workflows/run"
     GRAMMAR_PARSE_INPUT_KEY: str = "text_to_parse"
     GRAMMAR_PARSE_OUTPUT_KEY: str = "correction_feedback"
+    GRAMMAR_PARSE_CACHE_ENABLED: bool = True
+    GRAMMAR_PARSE_CACHE_SHAREABLE: bool = True
+    GRAMMAR_PARSE_CACHE_TTL_SECONDS: int = 3600
+    GRAMMAR_PARSE_CACHE_MAX_ENTRIES: int = 2048
+    GRAMMAR_PARSE_COALESCE_ENABLED: bool = True
+    GRAMMAR_PARSE_MAX_CONCURRENCY: int = 50
+    GRAMMAR_PARSE_MAX_QUEUE: int = 100
+    GRAMMAR_PARSE_QUEUE_TIMEOUT_SECONDS: float = 15.0
+    GRAMMAR_PARSE_BREAKER_FAILURE_THRESHOLD: int = 5 # Consecutive upstream failures/timeouts before failing fast with 503
+    GRAMMAR_PARSE_BREAKER_RESET_TIMEOUT_SECONDS: float = 30.0 # Open -> half-open probe after this long
+    GRAMMAR_PARSE_LATENCY_BUDGET_SECONDS: float = 60.0 # Deadline for the whole call, retries included
+    GRAMMAR_PARSE_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    GRAMMAR_PARSE_READ_TIMEOUT_SECONDS: float = 45.0 # Per attempt, capped by what is left of the budget
+    GRAMMAR_PARSE_MAX_RETRIES: int = 2
+    GRAMMAR_PARSE_HEDGE_ENABLED: bool = False # Fire a second request when the first exceeds the observed p95
+    # Micro-batching: concurrent parse requests share one workflow run with a list input (needs a workflow that accepts it)
+    GRAMMAR_PARSE_MICROBATCH_ENABLED: bool = False
+    GRAMMAR_PARSE_MICROBATCH_WINDOW_MS: float = 25.0 # How long the first request of a batch waits for company
+    GRAMMAR_PARSE_MICROBATCH_MAX_ITEMS: int = 8 # A full batch is sent without waiting for the window
+    GRAMMAR_PARSE_MICROBATCH_APP_API_KEY: Optional[str] = None # Key of the list-input workflow, defaults to GRAMMAR_PARSE_APP_API_KEY
+    GRAMMAR_PARSE_MICROBATCH_INPUT_KEY: str = "texts" # JSON array of the texts
+    GRAMMAR_PARSE_MICROBATCH_OUTPUT_KEY: str = "results" # Array (or JSON array string) with one result per text, same order
+    # Chunking: texts longer than CHUNK_MAX_CHARS are parsed as sentence-aligned chunks, concurrently, each cached on its own
+    GRAMMAR_PARSE_CHUNKING_ENABLED: bool = False
+    GRAMMAR_PARSE_CHUNK_MAX_CHARS: int = 1000
+    GRAMMAR_PARSE_CHUNK_CONCURRENCY: int = 4 # Chunks of one text in flight at once
+
+    # Known-Word Filtering Config (generated vocabulary drops words the user has as KNOWN/MASTERED)
+    VOCAB_GEN_FILTER_KNOWN_WORDS: bool = True
+    VOCAB_GEN_OVERFETCH_MARGIN: float = 0.2 # Extra share asked for on top of the expected known words
+    VOCAB_GEN_OVERFETCH_MAX_WORDS: int = 40 # Most words ever asked from Dify in one call
+    KNOWN_WORDS_CACHE_TTL_SECONDS: int = 300 # Per-user known-word sets (also invalidated by progress updates)
+    KNOWN_WORDS_CACHE_MAX_USERS: int = 5000
+
+    # Word Details Config (shared word_details table: generated words written through, missing ones backfilled)
+    WORD_DETAIL_STORE_ENABLED: bool = True
+    WORD_DETAIL_BACKFILL_CONCURRENCY: int = 4 # Background lookups in flight at once
+    WORD_DETAIL_BACKFILL_RETRY_SECONDS: int = 3600 # A word whose backfill failed is not looked up again before this
+    # Backfill looks in the word bank first; beyond it, each word costs one token-billed vocab generation (count 1)
+    WORD_DETAIL_BACKFILL_DIFY_CALLS_PER_HOUR: int = 0 # Cap on those paid runs, triggered by review-list reads (0 = word bank only)
+
+    # Idempotency Config (Idempotency-Key on composition correction and vocabulary generation)
+    IDEMPOTENCY_ENABLED: bool = True
+    IDEMPOTENCY_TTL_SECONDS: int = 86400 # How long a completed response answers retries with the same key
+    IDEMPOTENCY_MAX_ENTRIES: int = 10000
+
+    # Logging Config
+    LOG_LEVEL: str = "INFO" # DEBUG logs every Dify request/response body (truncated)
+    LOG_FORMAT: str = "text" # "text" for local development, "json" for the log pipeline
+    LOG_PAYLOAD_SAMPLE_RATE: float = 0.0 # Fraction of calls whose bodies are logged at INFO, e.g. 0.01
+    LOG_PAYLOAD_MAX_CHARS: int = 2000 # Logged bodies are cut after this many characters
+
+    # Metrics Config
+    METRICS_ENABLED: bool = True # Serves GET /metrics (unauthenticated: keep it off the public ingress)
 
+    # Dify HTTP Client Config (one keep-alive pool per Dify base URL, shared by all apps on it)
+    DIFY_HTTP_MAX_CONNECTIONS: int = 256 # Upper bound of concurrent upstream requests per base URL
+    DIFY_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 64
+    DIFY_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    DIFY_HTTP_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    DIFY_HTTP_POOL_TIMEOUT_SECONDS: float = 30.0 # How long a request may wait for a free pooled connection
+    DIFY_HTTP_WARMUP_ON_STARTUP: bool = True
+    DIFY_HTTP_WARMUP_CONNECTIONS: int = 2 # Connections opened per base URL at startup
+    DIFY_UPLOAD_MAX_BYTES: int = 10 * 1024 * 1024 # Files above this are rejected (413) while being streamed to Dify
+    DIFY_RESPONSE_INCLUDE_RAW_DEFAULT: bool = False # Echo the raw Dify response (dify_full_*) unless ?include_raw= says otherwise
+
+    # Dify Batch Endpoints Config (/parse-grammar/batch, /generate-vocabulary/batch)
+    DIFY_BATCH_MAX_ITEMS: int = 100 # Items per batch request, larger batches are rejected (422)
+    DIFY_BATCH_CONCURRENCY: int = 8 # Items of one batch in flight at once (the per-app bulkhead still applies on top)
+
+    # Dify Upload Cache Config (app + Dify user + SHA-256 of the file -> upload_file_id; identical resubmissions skip the upload)
+    DIFY_UPLOAD_CACHE_ENABLED: bool = True
+    DIFY_UPLOAD_CACHE_MAX_ENTRIES: int = 5000
+    DIFY_UPLOAD_CACHE_TTL_SECONDS: int = 86400 # Keep below Dify's retention of uploaded files
+
+    # Composition Image Preprocessing Config (needs Pillow; runs on a process pool before the Dify upload)
+    IMAGE_PREPROCESS_ENABLED: bool = True
+    IMAGE_PREPROCESS_WORKERS: int = 2 # Worker processes
+    IMAGE_PREPROCESS_MIN_BYTES: int = 1536 * 1024 # Smaller JPEG/PNG/WEBP/GIF images skip preprocessing and stream to Dify unbuffered
+    IMAGE_PREPROCESS_MAX_EDGE: int = 2048 # Longest edge in pixels after downscaling
+    IMAGE_PREPROCESS_FORMAT: str = "JPEG" # "JPEG" or "WEBP"
+    IMAGE_PREPROCESS_QUALITY: int = 80
+    IMAGE_PREPROCESS_GRAYSCALE: bool = False # Handwriting OCR works on grayscale, but drops teachers' colored marks
+    IMAGE_PREPROCESS_MAX_INPUT_BYTES: int = 25 * 1024 * 1024 # Raw photo cap; the re-encoded result must fit DIFY_UPLOAD_MAX_BYTES
+
+    # Dify Retry / Hedging Config (per-app budgets and timeouts are above)
+    DIFY_RETRY_BACKOFF_BASE_SECONDS: float = 0.5 # Exponential backoff with full jitter between retries
+    DIFY_RETRY_BACKOFF_MAX_SECONDS: float = 8.0
+    DIFY_LATENCY_WINDOW_SIZE: int = 200 # Recent successful calls used for the per-app p50/p95
+    DIFY_HEDGE_MIN_SAMPLES: int = 20 # No hedging until the p95 is based on this many samples
+    DIFY_HEDGE_MIN_DELAY_SECONDS: float = 0.5
 
     model_config = SettingsConfigDict(
         env_file=DOTENV_PATH if os.path.exists(DOTENV_PATH) else None,
@@ -55,17 +219,34 @@ class Settings(BaseSettings):
         extra='ignore'
     )
 
+    def data_path(self, path: str) -> str:
+        """`path` resolved against DATA_DIR (absolute paths are kept)."""
+        return os.path.join(os.path.abspath(self.DATA_DIR), path)
+
+    def dify_app_setting(self, dify_app: str, name: str) -> Any:
+        """Per-app setting lookup, e.g. dify_app_setting("grammar", "CACHE_TTL_SECONDS")."""
+        return getattr(self, f"{DIFY_APP_SETTINGS_PREFIXES[dify_app]}_{name}")
+
 settings = Settings()
 
-# Verification prints
-print("--- Config Loaded (config.py) ---")
-print(f"CHAT_FILE_INPUT_KEY: {settings.CHAT_TEXT_INPUT_KEY}")
-print(f"COMPOSITION_FILE_INPUT_KEY: {settings.COMPOSITION_FILE_INPUT_KEY}")
-print(f"VOCAB_GEN_INPUT_KEY: {settings.VOCAB_GEN_INPUT_KEY}")
-print(f"GRAMMAR_PARSE_INPUT_KEY: {settings.GRAMMAR_PARSE_INPUT_KEY}")
-print("---------------------------------")
+configure_logging(settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_PAYLOAD_SAMPLE_RATE, settings.LOG_PAYLOAD_MAX_CHARS)
+
+# Verification logs
+if DOTENV_FOUND:
+    logger.info("Loaded .env", extra={"path": DOTENV_PATH})
+else:
+    logger.warning(".env file not found, using environment variables or defaults", extra={"path": DOTENV_PATH})
+logger.info(
+    "Config loaded",
+    extra={
+        "chat_text_input_key": settings.CHAT_TEXT_INPUT_KEY,
+        "composition_file_input_key": settings.COMPOSITION_FILE_INPUT_KEY,
+        "vocab_gen_input_key": settings.VOCAB_GEN_INPUT_KEY,
+        "grammar_parse_input_key": settings.GRAMMAR_PARSE_INPUT_KEY,
+    },
+)
 
 if not settings.CHAT_APP_API_KEY or not settings.CHAT_APP_BASE_URL :
-    print("[CRITICAL ERROR in config.py] CHAT_APP_API_KEY or CHAT_APP_BASE_URL not configured!")
+    logger.critical("CHAT_APP_API_KEY or CHAT_APP_BASE_URL not configured!")
 else:
-    print("[INFO in config.py] Dify app configurations appear to be present.")
\ No newline at end of file
+    logger.info("Dify app configurations appear to be present.")
\ No newline at end of file
@@ -0,0 +1,103 @@
+# backend/app/core/json_stream.py
+from typing import Any, List, Optional as PyOptional
+
+from app.core import json_codec
+
+
+class IncrementalJSONError(ValueError):
+    def __init__(self, message: str, offset: int):
+        super().__init__(f"{message} (at character {offset})")
+        self.offset = offset
+        self.completed: List[Any] = [] # Elements completed by the failing feed() before the error
+
+
+class IncrementalJSONArrayParser:
+    """
+    Parses a JSON array of objects/arrays as it is being written (e.g. by an LLM, chunk by chunk):
+    `feed()` returns every top-level element completed by the new text, already decoded.
+    Text before the opening '[' (a ```json fence, a sentence) and after the closing ']' is ignored.
+    Malformed input raises IncrementalJSONError (carrying the elements the same chunk completed before
+    the error); the parser is unusable afterwards.
+    """
+
+    def __init__(self):
+        self.started = False    # Opening '[' seen
+        self.finished = False   # Closing ']' seen
+        self.elements = 0       # Elements returned so far
+        self._offset = 0        # Characters consumed by earlier feed() calls
+        self._depth = 0         # Nesting inside the current element, 0 = between elements
+        self._in_string = False
+        self._escaped = False
+        self._expect_element = True # After '[' or ',': an element (or, right after '[', the closing ']')
+        self._pieces: List[str] = []
+
+    def feed(self, text: str) -> List[Any]:
+        completed: List[Any] = []
+        try:
+            self._feed(text, completed)
+        except IncrementalJSONError as e:
+            e.completed = completed
+            raise
+        return completed
+
+    def _feed(self, text: str, completed: List[Any]) -> None:
+        piece_start: PyOptional[int] = 0 if self._depth else None
+        for i, ch in enumerate(text):
+            if self.finished:
+                break
+            if not self.started:
+                if ch == "[":
+                    self.started = True
+                continue
+            if self._depth:
+                if self._in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif ch == "\\":
+                        self._escaped = True
+                    elif ch == '"':
+                        self._in_string = False
+                elif ch == '"':
+                    self._in_string = True
+                elif ch in "{[":
+                    self._depth += 1
+                elif ch in "}]":
+                    self._depth -= 1
+                    if not self._depth:
+                        self._pieces.append(text[piece_start:i + 1])
+                        piece_start = None
+                        completed.append(self._decode_element(self._offset + i))
+                continue
+            # Between elements
+            if ch.isspace():
+                continue
+            if ch in "{[" and self._expect_element:
+                self._depth = 1
+                self._expect_element = False
+                piece_start = i
+            elif ch == "," and not self._expect_element:
+                self._expect_element = True
+            elif ch == "]" and (not self._expect_element or not self.elements):
+                self.finished = True
+            else:
+                raise IncrementalJSONError(f"Unexpected {ch!r} in the array", self._offset + i)
+        if piece_start is not None:
+            self._pieces.append(text[piece_start:])
+        self._offset += len(text)
+
+    def _decode_element(self, offset: int) -> Any:
+        source = "".join(self._pieces)
+        self._pieces = []
+        try:
+            element = json_codec.loads(source)
+        except json_codec.JSONDecodeError as e:
+            raise IncrementalJSONError(f"Array element {self.elements} is not valid JSON: {e}", offset)
+        self.elements += 1
+        return element
+
+    def close(self) -> None:
+        """Raises if the input ended before the array was complete."""
+        if not self.started:
+            raise IncrementalJSONError("No JSON array found", self._offset)
+        if not self.finished:
+            raise IncrementalJSONError(f"JSON array ended after {self.elements} complete element(s) without a closing ']'", self._offset)
@@ -0,0 +1,111 @@
+# backend/app/core/logging_config.py
+import contextvars
+import json
+import logging
+import random
+import sys
+import time
+from typing import Any, Dict, Optional as PyOptional
+
+_request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+# Set by configure_logging(); module-level so this file doesn't import settings (config.py imports it).
+_payload_sample_rate = 0.0
+_payload_max_chars = 2000
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is emitted as a structured field.
+_STANDARD_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+def set_request_id(request_id: str) -> contextvars.Token:
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token: contextvars.Token) -> None:
+    _request_id.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD_RECORD_ATTRS and not k.startswith("_")}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, request_id, msg, plus any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable variant for local development; `extra=` fields are appended as key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(name)s] [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " | " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+def configure_logging(level: str = "INFO", log_format: str = "text", payload_sample_rate: float = 0.0, payload_max_chars: int = 2000) -> None:
+    """Installs one stdout handler on the `app` logger tree. Safe to call again (e.g. after settings change)."""
+    global _payload_sample_rate, _payload_max_chars
+    _payload_sample_rate = payload_sample_rate
+    _payload_max_chars = payload_max_chars
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(JsonFormatter() if log_format.lower() == "json" else TextFormatter())
+
+    app_logger = logging.getLogger("app")
+    for existing in list(app_logger.handlers):
+        app_logger.removeHandler(existing)
+    app_logger.addHandler(handler)
+    app_logger.setLevel(level.upper())
+    app_logger.propagate = False # uvicorn configures the root logger; don't print every line twice
+
+
+def truncate_for_log(value: Any, max_chars: PyOptional[int] = None) -> str:
+    """Compact JSON (or str) of `value`, cut to LOG_PAYLOAD_MAX_CHARS."""
+    limit = max_chars if max_chars is not None else _payload_max_chars
+    try:
+        text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+    except (TypeError, ValueError):
+        text = repr(value)
+    if len(text) > limit:
+        return f"{text[:limit]}...(+{len(text) - limit} chars)"
+    return text
+
+
+def log_payload(logger: logging.Logger, message: str, payload: Any, **fields: Any) -> None:
+    """
+    Logs a request/response body only at DEBUG, or at INFO for a LOG_PAYLOAD_SAMPLE_RATE sample of calls.
+    The body is serialized (and truncated) only when it will actually be written.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, extra={**fields, "payload": truncate_for_log(payload)})
+    elif _payload_sample_rate > 0 and random.random() < _payload_sample_rate and logger.isEnabledFor(logging.INFO):
+        logger.info(message, extra={**fields, "payload": truncate_for_log(payload), "sampled": True})
@@ -0,0 +1,122 @@
+# backend/app/core/middleware.py
+import re
+import time
+import uuid
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.logging_config import set_request_id, reset_request_id
+from app.core.metrics import HTTP_REQUESTS_TOTAL, HTTP_REQUEST_DURATION_SECONDS, HTTP_REQUESTS_IN_FLIGHT
+from app.services.dify_retry import begin_call_reports
+
+_VALID_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    """
+    Gives every request an id (the client's `X-Request-ID` if it looks sane, else a new one), makes it
+    available to all log records written while handling the request and echoes it in the response.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or []).get(b"x-request-id", b"").decode("latin-1")
+        request_id = incoming if _VALID_REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        token = set_request_id(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            reset_request_id(token)
+
+
+class DifyCallReportMiddleware:
+    """
+    Collects a report for every Dify call made while handling a request and exposes it as
+    `X-Dify-Calls: <app>;attempts=N;outcome=ok;ms=...[;cache=hit][;coalesced=1][;hedge=won|lost]`,
+    one comma-separated entry per call. Streaming responses only list calls finished before the headers.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        reports = begin_call_reports()
+
+        async def send_with_report(message: Message) -> None:
+            if message["type"] == "http.response.start" and reports:
+                header_value = ", ".join(report.to_header_value() for report in reports)
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-dify-calls", header_value.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_report)
+
+
+def _route_template(scope: Scope) -> str:
+    """
+    Template of the matched route including the include_router prefix. Routes of included routers
+    only know their own path (/parse-grammar), so the prefix is recovered from the matched URL path.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    path_regex = getattr(route, "path_regex", None)
+    if not template:
+        return "unmatched"
+    path = scope.get("path", "")
+    if path_regex is None or path_regex.match(path):
+        return template
+    for i in range(1, len(path)):
+        if path[i] == "/" and path_regex.match(path[i:]):
+            return path[:i] + template
+    return template
+
+
+class MetricsMiddleware:
+    """
+    Request count, latency histogram and in-flight gauge for every HTTP request. Routes are labelled
+    by their template (/api/v1/dify/correct-composition/jobs/{job_id}), never the raw path.
+    Streaming responses are timed until their last chunk has been sent.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started_at = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = _route_template(scope)
+            method = scope.get("method", "")
+            HTTP_REQUEST_DURATION_SECONDS.observe(time.perf_counter() - started_at, method=method, route=route)
+            HTTP_REQUESTS_TOTAL.inc(method=method, route=route, status=str(status_code))
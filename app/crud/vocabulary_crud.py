@@ -1,15 +1,54 @@
 # backend/app/crud/vocabulary_crud.py
 from sqlalchemy.orm import Session as SQLAlchemySession
 from sqlalchemy import func, or_
-from typing import List, Optional
+from typing import Any, Dict, Iterable, List, Optional
 from datetime import datetime, timedelta, timezone
+import zlib
 
 from app.db import models
 from app.schemas import vocabulary_schemas as schemas
+from app.core import json_codec
+
+def normalize_word(word: str) -> str:
+    """Key of the shared word_details table."""
+    return word.strip().casefold()
+
+def get_word_details(db: SQLAlchemySession, words: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Stored details of the given words in one IN query, keyed by normalized word (missing words are absent)."""
+    keys = {normalize_word(word) for word in words}
+    if not keys:
+        return {}
+    rows = db.query(models.WordDetail).filter(models.WordDetail.word.in_(keys)).all()
+    return {row.word: json_codec.loads(zlib.decompress(row.data)) for row in rows}
+
+def upsert_word_details(db: SQLAlchemySession, words: List[Dict[str, Any]]) -> int:
+    """Stores (or replaces) the details of generated words, compressed; returns the number of rows written."""
+    details = {normalize_word(schemas.dify_word_text(word)): word for word in words}
+    details.pop("", None)
+    if not details:
+        return 0
+    existing = {row.word: row for row in db.query(models.WordDetail).filter(models.WordDetail.word.in_(details)).all()}
+    for key, word in details.items():
+        data = zlib.compress(json_codec.dumps(word))
+        row = existing.get(key)
+        if row is None:
+            db.add(models.WordDetail(word=key, data=data))
+        elif row.data != data:
+            row.data = data
+    db.commit()
+    return len(details)
 
 def get_user_word(db: SQLAlchemySession, user_id: int, word: str) -> Optional[models.UserWord]:
     return db.query(models.UserWord).filter(models.UserWord.user_id == user_id, models.UserWord.word == word).first()
 
+def get_known_words(db: SQLAlchemySession, user_id: int) -> List[str]:
+    """Words the user marked KNOWN or MASTERED (only the word column, via the user_id index)."""
+    rows = db.query(models.UserWord.word)\
+        .filter(models.UserWord.user_id == user_id)\
+        .filter(models.UserWord.status.in_([schemas.WordLearningStatusEnum.KNOWN, schemas.WordLearningStatusEnum.MASTERED]))\
+        .all()
+    return [word for (word,) in rows]
+
 def create_or_update_user_word(db: SQLAlchemySession, user_id: int, word_progress: schemas.WordProgressUpdateRequest) -> models.UserWord:
     db_user_word = get_user_word(db, user_id=user_id, word=word_progress.word)
     
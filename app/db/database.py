@@ -1,16 +1,38 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session as SQLAlchemySession # Import Session for type hinting
 from app.core.config import settings
+from app.core.metrics import DB_QUERY_DURATION_SECONDS, DB_SESSION_DURATION_SECONDS, DB_SESSIONS_IN_FLIGHT
 from typing import Generator # For type hinting the generator
 
 engine = create_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+_SQL_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context, not the pooled connection: a failing statement (no after_cursor_execute) leaves nothing behind
+    context._query_started_at = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _record_query_duration(conn, cursor, statement, parameters, context, executemany):
+    started_at = context._query_started_at
+    operation = statement.lstrip()[:6].upper()
+    DB_QUERY_DURATION_SECONDS.observe(time.perf_counter() - started_at, operation=operation if operation in _SQL_OPERATIONS else "OTHER")
+
+
 def get_db() -> Generator[SQLAlchemySession, None, None]:
     db = SessionLocal()
+    started_at = time.perf_counter()
+    DB_SESSIONS_IN_FLIGHT.inc()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+        DB_SESSIONS_IN_FLIGHT.dec()
+        DB_SESSION_DURATION_SECONDS.observe(time.perf_counter() - started_at)
\ No newline at end of file
@@ -1,5 +1,5 @@
 # backend/app/db/models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum as SQLAlchemyEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, LargeBinary, Enum as SQLAlchemyEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -57,4 +57,18 @@ class UserWord(Base):
     owner = relationship("User", back_populates="learned_words")
 
     def __repr__(self):
-        return f"<UserWord(user_id={self.user_id}, word='{self.word}', status='{self.status.value}')>"
\ No newline at end of file
+        return f"<UserWord(user_id={self.user_id}, word='{self.word}', status='{self.status.value}')>"
+
+
+# --- WordDetail Model ---
+# Generated details (DifyWordSchema) of a word, one row per word shared by every user who learns it.
+class WordDetail(Base):
+    __tablename__ = "word_details"
+
+    word: str = Column(String, primary_key=True) # Normalized: stripped and casefolded
+    data: bytes = Column(LargeBinary, nullable=False) # zlib-compressed JSON of the word's details
+    created_at: DateTime = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Optional[DateTime] = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<WordDetail(word='{self.word}')>"
\ No newline at end of file
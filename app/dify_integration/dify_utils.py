@@ -1,50 +1,141 @@
 # backend/app/dify_integration/dify_utils.py
+import logging
 import os
-import requests
-from typing import Tuple, Optional as PyOptional
+import uuid
+import httpx
+from typing import AsyncIterator, Tuple, Optional as PyOptional
 
 from app.core.config import settings # Import settings
+from app.core import json_codec
+from app.services.dify_client import get_dify_client, build_timeout, track_dify_request
 
-def upload_file_to_dify(
-    file_path: str,
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAGIC_SNIFF_BYTES = 16 # Enough for every signature in _MAGIC_SIGNATURES
+
+
+class UploadTooLargeError(ValueError):
+    """The upload went over settings.DIFY_UPLOAD_MAX_BYTES (detected while streaming)."""
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Uploaded file exceeds the limit of {max_bytes} bytes.")
+        self.max_bytes = max_bytes
+
+
+async def _capped_chunks(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadTooLargeError(max_bytes) # Aborts the request mid-body, Dify never sees a complete file
+        yield chunk
+
+
+def _multipart_parts(boundary: str, filename: str, mime_type: str, dify_user: str) -> Tuple[bytes, bytes]:
+    """Bytes sent before and after the file content in a multipart/form-data body with fields `user` and `file`."""
+    safe_filename = filename.replace('"', "").replace("\r", "").replace("\n", "")
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="user"\r\n\r\n'
+        f"{dify_user}\r\n"
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{safe_filename}"\r\n'
+        f"Content-Type: {mime_type}\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return head, tail
+
+
+async def upload_file_to_dify(
+    chunks: AsyncIterator[bytes],
+    filename: str,
     mime_type: str,
     dify_user: str,
     api_base_url: str, # 新增参数
-    api_key: str       # 新增参数
+    api_key: str,      # 新增参数
+    size: PyOptional[int] = None,
+    dify_app: PyOptional[str] = None, # Metrics label only
 ) -> str:
-    """Uploads a file to Dify's file service using specific base_url and api_key."""
+    """
+    Streams a file to Dify's file service (POST /files/upload) as a multipart body, chunk by chunk,
+    without staging it on disk. `size`, when known, is sent as Content-Length; otherwise the body is chunked.
+    Raises UploadTooLargeError once more than settings.DIFY_UPLOAD_MAX_BYTES have been streamed.
+    """
     if not api_base_url or not api_key: # 使用传入的参数
         raise ValueError("Dify api_base_url or api_key was not provided for file upload.")
     
     url = f"{api_base_url.rstrip('/')}/files/upload" # 使用传入的 api_base_url
-    headers = {"Authorization": f"Bearer {api_key}"}   # 使用传入的 api_key
-    
+    max_bytes = settings.DIFY_UPLOAD_MAX_BYTES
+    if size is not None and size > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+
+    boundary = uuid.uuid4().hex
+    head, tail = _multipart_parts(boundary, filename, mime_type, dify_user)
+    headers = {
+        "Authorization": f"Bearer {api_key}", # 使用传入的 api_key
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+    }
+    if size is not None:
+        headers["Content-Length"] = str(len(head) + size + len(tail))
+
+    async def body() -> AsyncIterator[bytes]:
+        yield head
+        async for chunk in _capped_chunks(chunks, max_bytes):
+            yield chunk
+        yield tail
+
     try:
-        with open(file_path, "rb") as f:
-            files_payload = {"file": (os.path.basename(file_path), f, mime_type)}
-            data_payload = {"user": dify_user}
-            print(f"Uploading to Dify: URL={url}, User={dify_user}, Filename={os.path.basename(file_path)}, MIME={mime_type}")
-            resp = requests.post(url, headers=headers, files=files_payload, data=data_payload, timeout=60)
-        resp.raise_for_status()
-        response_json = resp.json()
-        print(f"Dify file upload successful: {response_json}")
+        logger.info("Uploading file to Dify", extra={"url": url, "dify_user": dify_user, "upload_filename": filename, "mime_type": mime_type, "size": size})
+        async with track_dify_request(dify_app, "/files/upload") as upstream_call:
+            resp = await get_dify_client(api_base_url).post(url, headers=headers, content=body(), timeout=build_timeout(60))
+            upstream_call.status = str(resp.status_code)
+            resp.raise_for_status()
+        response_json = json_codec.loads(resp.content)
+        logger.debug("Dify file upload successful", extra={"response": response_json})
         if "id" not in response_json:
             raise ValueError("Dify file upload response did not contain an 'id'.")
         return response_json["id"]
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         error_message = f"Error uploading file to Dify: {e}"
-        if hasattr(e, 'response') and e.response is not None:
+        if isinstance(e, httpx.HTTPStatusError):
             error_message += f" | Response: {e.response.text}"
-        print(f"[ERROR] {error_message}")
+        logger.error(error_message)
         raise IOError(error_message)
+    except UploadTooLargeError:
+        raise
     except (KeyError, ValueError) as e:
         error_message = f"Error parsing Dify file upload response: {e}"
-        print(f"[ERROR] {error_message}")
+        logger.error(error_message)
         raise ValueError(error_message)
 
 
-def determine_file_category_and_mime(filename: str) -> Tuple[PyOptional[str], PyOptional[str], PyOptional[str]]:
-    """Determines Dify category and MIME type based on file extension."""
+# (mime, offset, signature); WEBP additionally needs "WEBP" at offset 8, see sniff_mime_type
+_MAGIC_SIGNATURES = (
+    ("image/png", 0, b"\x89PNG\r\n\x1a\n"),
+    ("image/jpeg", 0, b"\xff\xd8\xff"),
+    ("image/gif", 0, b"GIF87a"),
+    ("image/gif", 0, b"GIF89a"),
+    ("image/webp", 0, b"RIFF"),
+    ("application/pdf", 0, b"%PDF-"),
+)
+
+
+def sniff_mime_type(head: bytes) -> PyOptional[str]:
+    """MIME type from the file's leading magic bytes, or None if unrecognized."""
+    for mime, offset, signature in _MAGIC_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if mime == "image/webp" and head[8:12] != b"WEBP":
+                continue
+            return mime
+    return None
+
+
+def determine_file_category_and_mime(filename: str, head: PyOptional[bytes] = None) -> Tuple[PyOptional[str], PyOptional[str], PyOptional[str]]:
+    """
+    Determines Dify category and MIME type based on file extension.
+    If the leading bytes (`head`) are given, the magic bytes win: an image whose content doesn't match
+    a known image signature is rejected, and a mislabelled one (.jpg that is really a PNG) gets its real MIME.
+    """
     ext = os.path.splitext(filename)[1].lower()
     category: PyOptional[str] = None
     mime: PyOptional[str] = None
@@ -60,14 +151,22 @@ def determine_file_category_and_mime(filename: str) -> Tuple[PyOptional[str], Py
         ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
     }
     
-    if ext in image_mime_map:
+    sniffed_mime = sniff_mime_type(head) if head is not None else None
+
+    if sniffed_mime and sniffed_mime.startswith("image/"): # Content is an image, whatever the extension says
+        category = "image"
+        mime = sniffed_mime
+    elif ext in image_mime_map:
+        if head is not None:
+            logger.info("File has an image extension but its content is not a recognized image", extra={"upload_filename": filename})
+            return None, None, ext
         category = "image"
         mime = image_mime_map.get(ext)
     elif ext in doc_mime_map: # If a document is uploaded for a feature that supports it
         category = "document"
         mime = doc_mime_map.get(ext)
     else:
-        print(f"Unsupported file extension: {ext} for filename: {filename}. Will not assign Dify category/mime.")
+        logger.info("Unsupported file extension, no Dify category/mime assigned", extra={"extension": ext, "upload_filename": filename})
         return None, None, ext # Return None if type is not explicitly supported or recognized
 
     return category, mime, ext
\ No newline at end of file
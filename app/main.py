@@ -1,12 +1,33 @@
 # backend/app/main.py
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.db.database import engine, Base
-from app.apis import auth_api, dify_api, vocabulary_api # <--- 确保 vocabulary_api 已导入
+from app.apis import auth_api, dify_api, vocabulary_api, metrics_api # <--- 确保 vocabulary_api 已导入
+from app.services.dify_client import warm_up_dify_clients, close_dify_clients
+from app.services.composition_jobs import composition_job_pool
+from app.services.image_preprocessing import image_preprocessor
+from app.services.vocab_word_bank import vocab_word_bank
+from app.core.config import settings
+from app.core.middleware import DifyCallReportMiddleware, RequestIdMiddleware, MetricsMiddleware
+from app.core.json_codec import FastJSONResponse
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="AI Learning Assistant Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_up_dify_clients() # Open pooled Dify connections before the first request
+    image_preprocessor.start()
+    await asyncio.to_thread(vocab_word_bank.start) # Load the on-disk word bank before it may be needed as a fallback
+    composition_job_pool.start()
+    yield
+    await composition_job_pool.shutdown() # Drain queued/running jobs while the Dify clients are still open
+    await vocab_word_bank.flush()
+    image_preprocessor.shutdown()
+    await close_dify_clients()
+
+app = FastAPI(title="AI Learning Assistant Backend", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 origins = [
     "http://localhost:5173",
@@ -19,11 +40,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Dify-Calls", "X-Request-ID"],
 )
+app.add_middleware(DifyCallReportMiddleware) # Per-call attempts / hedge outcome in the X-Dify-Calls header
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware) # Per-route request count / latency / in-flight for /metrics
+app.add_middleware(RequestIdMiddleware) # Outermost: every log line of the request carries its id
 
 app.include_router(auth_api.router, prefix="/api/v1", tags=["Authentication"])
 app.include_router(dify_api.router, prefix="/api/v1/dify", tags=["Dify AI Modules"])
 app.include_router(vocabulary_api.router, prefix="/api/v1/vocabulary", tags=["Vocabulary Learning"]) # <--- 确保这一行存在且正确
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_api.router) # GET /metrics, Prometheus text format (scraped from inside the network)
 
 @app.get("/api/v1/health", tags=["Health Check"])
 async def health_check():
@@ -1,6 +1,6 @@
 # backend/app/schemas/vocabulary_schemas.py
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from typing import Any, Optional, List
 from datetime import datetime
 import enum # Python's standard enum library
 
@@ -34,8 +34,15 @@ class DifyWordSchema(BaseModel):
     image_url: Optional[str] = None    # URL for an illustrative image (if available)
     # Add any other fields your Dify workflow returns for a word
 
-    class Config:
-        from_attributes = True # If you ever create this from an ORM object directly
+    # Fields the Dify workflow returns beyond the ones above are kept, not dropped
+    model_config = ConfigDict(from_attributes=True, extra="allow") # from_attributes: if you ever create this from an ORM object directly
+
+# Built once at import: dumps validated word lists (the review list) in one pass.
+DIFY_WORD_LIST_ADAPTER = TypeAdapter(List[DifyWordSchema])
+
+def dify_word_text(word: Any) -> str:
+    """The "word" of a generated entry; "" for entries without one (Dify's word list is passed through unvalidated)."""
+    return str(word.get("word") or "") if isinstance(word, dict) else ""
 
 # --- Schemas for User's Word Learning Progress ---
 
@@ -0,0 +1,176 @@
+# backend/app/services/composition_jobs.py
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional as PyOptional
+
+from app.core.config import settings
+from app.core.logging_config import get_request_id, set_request_id
+
+logger = logging.getLogger(__name__)
+
+JobWork = Callable[[], Awaitable[Dict[str, Any]]]
+JobErrorMapper = Callable[[BaseException], Dict[str, Any]]
+
+
+@dataclass
+class CompositionJob:
+    job_id: str
+    user_id: int
+    status: str = "queued" # queued -> running -> succeeded / failed
+    result: PyOptional[Dict[str, Any]] = None
+    error: PyOptional[Dict[str, Any]] = None # {"status_code": ..., "detail": ...}
+    created_at: float = field(default_factory=time.time)
+    started_at: PyOptional[float] = None
+    finished_at: PyOptional[float] = None
+    request_id: str = "-" # Of the submitting request, so the worker's log lines can be correlated
+    version: int = 0 # Bumped on every status change, lets SSE listeners wait for the next one
+    _changed: asyncio.Condition = field(default_factory=asyncio.Condition, repr=False)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    async def _set_status(self, status: str) -> None:
+        async with self._changed:
+            self.status = status
+            self.version += 1
+            self._changed.notify_all()
+
+    async def wait_for_change(self, seen_version: int, timeout: float) -> bool:
+        """Waits until the job moves past `seen_version`; False on timeout."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.version != seen_version), timeout=timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "succeeded":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class CompositionJobQueueFull(Exception):
+    pass
+
+
+class CompositionJobPool:
+    """
+    Bounded queue + fixed number of worker tasks running composition corrections in the background.
+    Jobs and results live in process memory (per uvicorn worker) and are dropped after the result TTL.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, CompositionJob] = {}
+        self._queue: PyOptional["asyncio.Queue[tuple]"] = None
+        self._workers: list = []
+        self._cleanup_task: PyOptional[asyncio.Task] = None
+        self._accepting = False
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=settings.COMPOSITION_JOB_QUEUE_SIZE)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(settings.COMPOSITION_JOB_WORKERS)]
+        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+        self._accepting = True
+        logger.info("Composition job pool started", extra={"workers": settings.COMPOSITION_JOB_WORKERS})
+
+    async def shutdown(self) -> None:
+        """Stops accepting jobs, lets queued/running ones finish (up to the drain timeout), then stops workers."""
+        self._accepting = False
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=settings.COMPOSITION_JOB_DRAIN_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                logger.warning("Composition job pool drain timed out", extra={"still_queued": self._queue.qsize()})
+        tasks = self._workers + ([self._cleanup_task] if self._cleanup_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._cleanup_task = None
+
+    def submit(self, user_id: int, work: JobWork, map_error: JobErrorMapper) -> CompositionJob:
+        if not self._accepting or self._queue is None:
+            self.rejected += 1
+            raise CompositionJobQueueFull("Composition job pool is not accepting jobs.")
+        job = CompositionJob(job_id=uuid.uuid4().hex, user_id=user_id, request_id=get_request_id())
+        try:
+            self._queue.put_nowait((job, work, map_error))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise CompositionJobQueueFull(f"Composition job queue is full ({self._queue.maxsize} jobs).")
+        self._jobs[job.job_id] = job
+        self.submitted += 1
+        return job
+
+    def get(self, job_id: str) -> PyOptional[CompositionJob]:
+        return self._jobs.get(job_id)
+
+    async def _worker(self, index: int) -> None:
+        assert self._queue is not None
+        while True:
+            job, work, map_error = await self._queue.get()
+            set_request_id(job.request_id)
+            try:
+                job.started_at = time.time()
+                await job._set_status("running")
+                try:
+                    job.result = await work()
+                    job.finished_at = time.time()
+                    self.succeeded += 1
+                    await job._set_status("succeeded")
+                except Exception as e:
+                    job.error = map_error(e)
+                    job.finished_at = time.time()
+                    self.failed += 1
+                    await job._set_status("failed")
+            finally:
+                self._queue.task_done()
+
+    async def _cleanup_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.COMPOSITION_JOB_CLEANUP_INTERVAL_SECONDS)
+            self.remove_expired()
+
+    def remove_expired(self) -> int:
+        cutoff = time.time() - settings.COMPOSITION_JOB_RESULT_TTL_SECONDS
+        expired = [job_id for job_id, job in self._jobs.items() if job.is_finished and job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": settings.COMPOSITION_JOB_QUEUE_SIZE,
+            "stored_jobs": len(self._jobs),
+            "by_status": statuses,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+        }
+
+
+composition_job_pool = CompositionJobPool()
@@ -0,0 +1,35 @@
+# backend/app/services/dify_batch.py
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional as PyOptional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+async def bounded_fan_out(
+    items: Sequence[T],
+    run_item: Callable[[T], Awaitable[Any]],
+    concurrency: int,
+) -> AsyncIterator[Tuple[int, Any, PyOptional[BaseException]]]:
+    """
+    Runs `run_item` for every item with at most `concurrency` running at once and yields
+    (index, result, error) in completion order; exactly one of result/error is set per item.
+    Closing the iterator early (client gone) cancels the items still queued or running.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(index: int, item: T) -> Tuple[int, Any, PyOptional[BaseException]]:
+        async with semaphore:
+            try:
+                return index, await run_item(item), None
+            except Exception as e:
+                return index, None, e
+
+    tasks: List[asyncio.Task] = [asyncio.create_task(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,141 @@
+# backend/app/services/dify_cache.py
+import copy
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional as PyOptional, Tuple
+
+from app.core.config import settings, DIFY_APP_SETTINGS_PREFIXES
+from app.core import json_codec
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class TTLLRUCache:
+    """Bounded in-process cache: entries expire after `ttl_seconds`, least recently used are evicted first."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> PyOptional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: str) -> bool:
+        return self._entries.pop(key, None) is not None
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _normalize_value(value: Any) -> Any:
+    if isinstance(value, str):
+        return _WHITESPACE_RE.sub(" ", value.strip())
+    if isinstance(value, dict):
+        return {k: _normalize_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize_value(v) for v in value]
+    return value
+
+
+def make_request_key(dify_app: str, dify_api_endpoint_path: str, payload: Dict[str, Any], include_user: bool) -> str:
+    """
+    Key = app + endpoint + normalized inputs (+ query/conversation for chat apps).
+    The Dify `user` is only part of the key when `include_user` is set (apps not declared shareable).
+    """
+    key_material: Dict[str, Any] = {
+        "app": dify_app,
+        "endpoint": dify_api_endpoint_path,
+        "inputs": _normalize_value(payload.get("inputs") or {}),
+        "query": _normalize_value(payload.get("query")),
+        "conversation_id": payload.get("conversation_id"),
+    }
+    if include_user:
+        key_material["user"] = payload.get("user")
+    return hashlib.sha256(json_codec.dumps(key_material, sort_keys=True)).hexdigest()
+
+
+class DifyResponseCache:
+    """Result cache of one Dify app, configured by its <PREFIX>_CACHE_* settings."""
+
+    def __init__(self, dify_app: str):
+        self.dify_app = dify_app
+        self.enabled: bool = settings.dify_app_setting(dify_app, "CACHE_ENABLED")
+        self.shareable: bool = settings.dify_app_setting(dify_app, "CACHE_SHAREABLE")
+        self._cache = TTLLRUCache(
+            max_entries=settings.dify_app_setting(dify_app, "CACHE_MAX_ENTRIES"),
+            ttl_seconds=settings.dify_app_setting(dify_app, "CACHE_TTL_SECONDS"),
+        )
+
+    def make_key(self, dify_api_endpoint_path: str, payload: Dict[str, Any]) -> str:
+        return make_request_key(self.dify_app, dify_api_endpoint_path, payload, include_user=not self.shareable)
+
+    def get(self, key: str) -> PyOptional[Dict[str, Any]]:
+        value = self._cache.get(key)
+        # Callers may decorate the response dict, so never hand out the cached instance itself.
+        return copy.deepcopy(value) if value is not None else None
+
+    def set(self, key: str, result: Dict[str, Any]) -> None:
+        if "raw_dify_response" in result:
+            return # Non-standard/empty output, worth retrying rather than caching
+        self._cache.set(key, copy.deepcopy(result))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "shareable": self.shareable, **self._cache.stats()}
+
+
+_response_caches: Dict[str, DifyResponseCache] = {}
+
+
+def get_response_cache(dify_app: str) -> DifyResponseCache:
+    cache = _response_caches.get(dify_app)
+    if cache is None:
+        cache = _response_caches[dify_app] = DifyResponseCache(dify_app)
+    return cache
+
+
+def response_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {dify_app: get_response_cache(dify_app).stats() for dify_app in DIFY_APP_SETTINGS_PREFIXES}
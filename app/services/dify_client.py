@@ -0,0 +1,124 @@
+# backend/app/services/dify_client.py
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional as PyOptional
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import (
+    DIFY_UPSTREAM_REQUESTS_TOTAL, DIFY_UPSTREAM_DURATION_SECONDS, DIFY_UPSTREAM_TIMEOUTS_TOTAL, DIFY_UPSTREAM_IN_FLIGHT,
+)
+
+logger = logging.getLogger(__name__)
+
+# One pooled AsyncClient per Dify base URL. Apps that live on the same Dify instance
+# share the keep-alive connections instead of opening a new TCP/TLS connection per call.
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _normalize_base_url(base_url: str) -> str:
+    return base_url.rstrip('/')
+
+
+def build_timeout(read_timeout: PyOptional[float], connect_timeout: PyOptional[float] = None) -> httpx.Timeout:
+    """Builds a per-request timeout: read/write bounded by `read_timeout`, connect/pool from settings unless given."""
+    return httpx.Timeout(
+        read_timeout,
+        connect=connect_timeout if connect_timeout is not None else settings.DIFY_HTTP_CONNECT_TIMEOUT_SECONDS,
+        pool=settings.DIFY_HTTP_POOL_TIMEOUT_SECONDS,
+    )
+
+
+def get_dify_client(base_url: str) -> httpx.AsyncClient:
+    """Returns the shared keep-alive client for a Dify base URL, creating it on first use."""
+    key = _normalize_base_url(base_url)
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.DIFY_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.DIFY_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.DIFY_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=build_timeout(None),
+        )
+        _clients[key] = client
+    return client
+
+
+def configured_dify_base_urls() -> List[str]:
+    """All distinct base URLs of the Dify apps configured in settings."""
+    urls = [
+        settings.CHAT_APP_BASE_URL,
+        settings.COMPOSITION_APP_BASE_URL,
+        settings.VOCAB_GEN_APP_BASE_URL,
+        settings.GRAMMAR_PARSE_APP_BASE_URL,
+    ]
+    distinct: List[str] = []
+    for url in urls:
+        if url and _normalize_base_url(url) not in distinct:
+            distinct.append(_normalize_base_url(url))
+    return distinct
+
+
+async def _open_connection(client: httpx.AsyncClient, base_url: str) -> None:
+    try:
+        # Any HTTP answer (even 404) means the connection is established and back in the pool.
+        await client.get(base_url, timeout=build_timeout(settings.DIFY_HTTP_CONNECT_TIMEOUT_SECONDS))
+    except httpx.HTTPError as e:
+        logger.warning("Dify connection warm-up failed", extra={"base_url": base_url, "error": f"{type(e).__name__}: {e}"})
+
+
+async def warm_up_dify_clients() -> None:
+    """Pre-opens pooled connections to every configured Dify instance so first requests skip the handshake."""
+    if not settings.DIFY_HTTP_WARMUP_ON_STARTUP:
+        return
+    warmups = []
+    for base_url in configured_dify_base_urls():
+        client = get_dify_client(base_url)
+        warmups.extend(_open_connection(client, base_url) for _ in range(settings.DIFY_HTTP_WARMUP_CONNECTIONS))
+    if warmups:
+        await asyncio.gather(*warmups)
+        logger.info("Dify HTTP pools warmed up", extra={"base_urls": configured_dify_base_urls()})
+
+
+async def close_dify_clients() -> None:
+    """Closes all pooled Dify clients (called on application shutdown)."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+class UpstreamCall:
+    """Outcome holder for track_dify_request; callers set `status` once Dify has answered."""
+    def __init__(self):
+        self.status = "cancelled" # Left as is if the caller went away (hedge loser, client disconnect)
+
+
+@asynccontextmanager
+async def track_dify_request(dify_app: PyOptional[str], endpoint: str) -> AsyncIterator[UpstreamCall]:
+    """Records latency, outcome and in-flight count of one request to Dify in the metrics registry."""
+    app_label = dify_app or "none"
+    call = UpstreamCall()
+    DIFY_UPSTREAM_IN_FLIGHT.inc(dify_app=app_label)
+    started_at = time.perf_counter()
+    try:
+        yield call
+    except httpx.TimeoutException:
+        call.status = "timeout"
+        DIFY_UPSTREAM_TIMEOUTS_TOTAL.inc(dify_app=app_label, endpoint=endpoint)
+        raise
+    except httpx.HTTPStatusError as e:
+        call.status = str(e.response.status_code)
+        raise
+    except httpx.TransportError:
+        call.status = "transport_error"
+        raise
+    finally:
+        DIFY_UPSTREAM_IN_FLIGHT.dec(dify_app=app_label)
+        DIFY_UPSTREAM_DURATION_SECONDS.observe(time.perf_counter() - started_at, dify_app=app_label, endpoint=endpoint)
+        DIFY_UPSTREAM_REQUESTS_TOTAL.inc(dify_app=app_label, endpoint=endpoint, status=call.status)
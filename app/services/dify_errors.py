@@ -0,0 +1,8 @@
+# backend/app/services/dify_errors.py
+from typing import Any
+
+class DifyWorkflowError(Exception):
+    def __init__(self, message: str, status_code: int = 500, details: Any = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
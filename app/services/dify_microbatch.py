@@ -0,0 +1,165 @@
+# backend/app/services/dify_microbatch.py
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional as PyOptional, Set
+
+from app.core import json_codec
+from app.core.config import settings
+from app.services.dify_cache import get_response_cache
+from app.services.dify_workflow_service import call_dify_api, DifyWorkflowError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PendingBatch:
+    items: List[Any] = field(default_factory=list)
+    futures: List["asyncio.Future[Any]"] = field(default_factory=list)
+    timer: PyOptional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """
+    Collects submitted items for up to `window_ms` or `max_items` (whichever comes first) and hands them
+    to `run_batch` in one call. `run_batch` returns one outcome per item, in order; an outcome that is an
+    exception is raised to that item's caller. Items are only batched with items of the same key.
+    """
+
+    def __init__(self, window_ms: float, max_items: int, run_batch: Callable[[List[Any]], Awaitable[List[Any]]]):
+        self.window_seconds = max(0.0, window_ms) / 1000
+        self.max_items = max(1, max_items)
+        self.run_batch = run_batch
+        self._pending: Dict[Hashable, _PendingBatch] = {}
+        self._running: Set["asyncio.Task[None]"] = set()
+        self.batches = 0       # run_batch calls
+        self.batched_items = 0 # Items dispatched through them
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _PendingBatch()
+            batch.timer = loop.call_later(self.window_seconds, self._flush, key, batch)
+        future = loop.create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        if len(batch.items) >= self.max_items:
+            self._flush(key, batch)
+        return await future
+
+    def _flush(self, key: Hashable, batch: _PendingBatch) -> None:
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        if batch.timer is not None:
+            batch.timer.cancel()
+        self.batches += 1
+        self.batched_items += len(batch.items)
+        task = asyncio.ensure_future(self._dispatch(batch))
+        self._running.add(task) # Keep a reference until done, nobody awaits the task itself
+        task.add_done_callback(self._running.discard)
+
+    async def _dispatch(self, batch: _PendingBatch) -> None:
+        try:
+            outcomes = await self.run_batch(batch.items)
+        except Exception as e:
+            outcomes = [e] * len(batch.items)
+        for future, outcome in zip(batch.futures, outcomes):
+            if future.done(): # Caller went away
+                continue
+            if isinstance(outcome, BaseException):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_seconds * 1000,
+            "max_items": self.max_items,
+            "batches": self.batches,
+            "batched_items": self.batched_items,
+            "avg_batch_size": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+            "pending_items": sum(len(batch.items) for batch in self._pending.values()),
+        }
+
+
+class GrammarMicroBatcher:
+    """
+    Micro-batching in front of the grammar app (GRAMMAR_PARSE_MICROBATCH_*): concurrent parse requests are
+    sent as one workflow run whose list input (a JSON array of the texts) yields a list output, one entry per text.
+    Any item whose entry cannot be recovered (the run failed, the output is not a list of the same length,
+    an entry is empty) falls back to its own regular call, so batching never changes what a request gets back.
+    """
+
+    def __init__(self):
+        self.enabled: bool = settings.GRAMMAR_PARSE_MICROBATCH_ENABLED
+        self._batcher = MicroBatcher(settings.GRAMMAR_PARSE_MICROBATCH_WINDOW_MS, settings.GRAMMAR_PARSE_MICROBATCH_MAX_ITEMS, self._run_batch)
+        self._cache = get_response_cache("grammar")
+        self.fallbacks = 0 # Items answered by a single call after being batched
+
+    async def call(self, payload: Dict[str, Any], call_single: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Same contract as call_dify_api for one blocking grammar payload; `call_single` is the regular path."""
+        cache_key: PyOptional[str] = None
+        if self._cache.enabled:
+            cache_key = self._cache.make_key(settings.GRAMMAR_PARSE_APP_API_ENDPOINT, payload)
+            cached_result = self._cache.get(cache_key)
+            if cached_result is not None:
+                return cached_result
+
+        # Only texts of the same Dify user share a run, unless grammar results are shareable across users
+        batch_key = "" if self._cache.shareable else payload.get("user", "")
+        outputs = await self._batcher.submit(batch_key, payload)
+        if outputs is None:
+            self.fallbacks += 1
+            return await call_single(payload)
+        if cache_key is not None:
+            self._cache.set(cache_key, outputs)
+        return outputs
+
+    async def _run_batch(self, payloads: List[Dict[str, Any]]) -> List[PyOptional[Dict[str, Any]]]:
+        """Outputs per payload, None where the item has to fall back to a single call."""
+        if len(payloads) == 1:
+            return [None] # Nothing to share the run with
+        texts = [payload["inputs"][settings.GRAMMAR_PARSE_INPUT_KEY] for payload in payloads]
+        batch_payload = {
+            "inputs": {settings.GRAMMAR_PARSE_MICROBATCH_INPUT_KEY: json_codec.dumps_str(texts)},
+            "response_mode": "blocking",
+            "user": payloads[0].get("user", "microbatch"),
+        }
+        try:
+            batch_outputs = await call_dify_api(
+                dify_base_url=settings.GRAMMAR_PARSE_APP_BASE_URL,
+                dify_api_key=settings.GRAMMAR_PARSE_MICROBATCH_APP_API_KEY or settings.GRAMMAR_PARSE_APP_API_KEY,
+                dify_api_endpoint_path=settings.GRAMMAR_PARSE_APP_API_ENDPOINT,
+                payload=batch_payload,
+                dify_app="grammar"
+            )
+        except DifyWorkflowError as e:
+            logger.warning("Grammar micro-batch run failed, falling back to single calls", extra={"items": len(payloads), "error": str(e)})
+            return [None] * len(payloads)
+        entries = batch_outputs.get(settings.GRAMMAR_PARSE_MICROBATCH_OUTPUT_KEY)
+        if isinstance(entries, str):
+            try:
+                entries = json_codec.loads(entries)
+            except json_codec.JSONDecodeError:
+                entries = None
+        if not isinstance(entries, list) or len(entries) != len(payloads):
+            logger.warning("Grammar micro-batch output does not match the inputs, falling back to single calls",
+                           extra={"items": len(payloads), "entries": len(entries) if isinstance(entries, list) else None})
+            return [None] * len(payloads)
+        return [self._item_outputs(entry) for entry in entries]
+
+    @staticmethod
+    def _item_outputs(entry: Any) -> PyOptional[Dict[str, Any]]:
+        """One list entry as the outputs a single run would have produced: the text itself, or an outputs object."""
+        if isinstance(entry, str) and entry.strip():
+            return {settings.GRAMMAR_PARSE_OUTPUT_KEY: entry}
+        if isinstance(entry, dict) and entry.get(settings.GRAMMAR_PARSE_OUTPUT_KEY):
+            return entry
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "fallbacks": self.fallbacks, **self._batcher.stats()}
+
+
+grammar_micro_batcher = GrammarMicroBatcher()
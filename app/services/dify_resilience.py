@@ -0,0 +1,202 @@
+# backend/app/services/dify_resilience.py
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+from app.core.config import settings, DIFY_APP_SETTINGS_PREFIXES
+from app.services.dify_errors import DifyWorkflowError
+
+logger = logging.getLogger(__name__)
+
+
+# Rejections produced locally by the guards below; they say nothing about Dify's health.
+LOCAL_REJECTION_REASONS = ("bulkhead_full", "bulkhead_timeout", "circuit_open")
+# The caller went away (client disconnect, stream closed early): neither success nor failure.
+_ABANDONED = (asyncio.CancelledError, GeneratorExit)
+
+
+def is_local_rejection(exc: BaseException) -> bool:
+    return isinstance(exc, DifyWorkflowError) and isinstance(exc.details, dict) \
+        and exc.details.get("reason") in LOCAL_REJECTION_REASONS
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """Errors that say something about Dify's health (5xx, timeouts, 429), as opposed to bad requests."""
+    if is_local_rejection(exc) or isinstance(exc, _ABANDONED):
+        return False
+    if isinstance(exc, DifyWorkflowError):
+        return exc.status_code >= 500 or exc.status_code == 429
+    return True
+
+
+class Bulkhead:
+    """Caps concurrent upstream calls of one Dify app; excess callers wait in a bounded queue."""
+
+    def __init__(self, dify_app: str):
+        self.dify_app = dify_app
+        self.max_concurrency: int = settings.dify_app_setting(dify_app, "MAX_CONCURRENCY")
+        self.max_queue: int = settings.dify_app_setting(dify_app, "MAX_QUEUE")
+        self.queue_timeout: float = settings.dify_app_setting(dify_app, "QUEUE_TIMEOUT_SECONDS")
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise DifyWorkflowError(
+                    f"Dify app '{self.dify_app}' is at capacity ({self.max_concurrency} running, {self.waiting} queued).",
+                    status_code=503, details={"reason": "bulkhead_full", "dify_app": self.dify_app})
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise DifyWorkflowError(
+                    f"Dify app '{self.dify_app}' queue wait exceeded {self.queue_timeout} seconds.",
+                    status_code=503, details={"reason": "bulkhead_timeout", "dify_app": self.dify_app})
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreaker:
+    """
+    closed -> open after N consecutive upstream failures; open rejects immediately with 503;
+    after the reset timeout one probe call is let through (half_open): success closes, failure re-opens.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, dify_app: str):
+        self.dify_app = dify_app
+        self.failure_threshold: int = settings.dify_app_setting(dify_app, "BREAKER_FAILURE_THRESHOLD")
+        self.reset_timeout: float = settings.dify_app_setting(dify_app, "BREAKER_RESET_TIMEOUT_SECONDS")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _check_can_call(self) -> bool:
+        """Returns True if this call is the half-open probe."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            else:
+                self._reject()
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self._reject()
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def _reject(self) -> None:
+        self.rejected += 1
+        retry_after = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise DifyWorkflowError(
+            f"Dify app '{self.dify_app}' is temporarily unavailable (circuit open after {self.consecutive_failures} consecutive failures).",
+            status_code=503, details={"reason": "circuit_open", "dify_app": self.dify_app, "retry_after_seconds": round(retry_after, 1)})
+
+    def _open(self) -> None:
+        if self.state != self.OPEN:
+            self.times_opened += 1
+            logger.warning("Dify circuit opened", extra={"dify_app": self.dify_app, "consecutive_failures": self.consecutive_failures})
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("Dify circuit closed again", extra={"dify_app": self.dify_app})
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[None]:
+        is_probe = self._check_can_call()
+        try:
+            yield
+        except BaseException as exc:
+            if is_upstream_failure(exc):
+                self.record_failure()
+            elif not is_local_rejection(exc) and not isinstance(exc, _ABANDONED):
+                self.record_success() # The upstream answered, the request itself was bad
+            raise
+        else:
+            self.record_success()
+        finally:
+            if is_probe:
+                self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout_seconds": self.reset_timeout,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+_bulkheads: Dict[str, Bulkhead] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_bulkhead(dify_app: str) -> Bulkhead:
+    bulkhead = _bulkheads.get(dify_app)
+    if bulkhead is None:
+        bulkhead = _bulkheads[dify_app] = Bulkhead(dify_app)
+    return bulkhead
+
+
+def get_circuit_breaker(dify_app: str) -> CircuitBreaker:
+    breaker = _breakers.get(dify_app)
+    if breaker is None:
+        breaker = _breakers[dify_app] = CircuitBreaker(dify_app)
+    return breaker
+
+
+@asynccontextmanager
+async def dify_app_guard(dify_app: str) -> AsyncIterator[None]:
+    """Circuit breaker check first (fail fast), then a bulkhead slot for the duration of the call."""
+    async with get_circuit_breaker(dify_app).guard():
+        async with get_bulkhead(dify_app).slot():
+            yield
+
+
+def resilience_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        dify_app: {"bulkhead": get_bulkhead(dify_app).stats(), "circuit_breaker": get_circuit_breaker(dify_app).stats()}
+        for dify_app in DIFY_APP_SETTINGS_PREFIXES
+    }
@@ -0,0 +1,228 @@
+# backend/app/services/dify_retry.py
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional as PyOptional
+
+from app.core.config import settings, DIFY_APP_SETTINGS_PREFIXES
+from app.services.dify_errors import DifyWorkflowError
+from app.services.dify_resilience import is_local_rejection
+
+logger = logging.getLogger(__name__)
+
+# Transient upstream statuses worth another attempt (504 also covers our own read timeouts).
+RETRYABLE_STATUS_CODES = (429, 502, 503, 504)
+
+
+@dataclass
+class DifyCallReport:
+    """What happened during one call_dify_api call, collected per HTTP request (see begin_call_reports)."""
+    dify_app: str
+    attempts: int = 0
+    hedged: bool = False
+    hedge_won: bool = False
+    from_cache: bool = False
+    coalesced: bool = False
+    elapsed_ms: float = 0.0
+    outcome: str = "pending" # "ok" / "error" / "deadline_exceeded"
+
+    def to_header_value(self) -> str:
+        parts = [self.dify_app, f"attempts={self.attempts}", f"outcome={self.outcome}", f"ms={self.elapsed_ms:.0f}"]
+        if self.from_cache:
+            parts.append("cache=hit")
+        if self.coalesced:
+            parts.append("coalesced=1")
+        if self.hedged:
+            parts.append(f"hedge={'won' if self.hedge_won else 'lost'}")
+        return ";".join(parts)
+
+
+_call_reports: contextvars.ContextVar[PyOptional[List[DifyCallReport]]] = contextvars.ContextVar("dify_call_reports", default=None)
+
+
+def begin_call_reports() -> List[DifyCallReport]:
+    """Starts collecting call reports for the current request (called by the middleware)."""
+    reports: List[DifyCallReport] = []
+    _call_reports.set(reports)
+    return reports
+
+
+def new_call_report(dify_app: str) -> DifyCallReport:
+    report = DifyCallReport(dify_app=dify_app)
+    reports = _call_reports.get()
+    if reports is not None:
+        reports.append(report)
+    return report
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies for one app."""
+
+    def __init__(self, window_size: int):
+        self._samples: Deque[float] = deque(maxlen=window_size)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> PyOptional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RetryStats:
+    def __init__(self, dify_app: str):
+        self.dify_app = dify_app
+        self.latency = LatencyTracker(settings.DIFY_LATENCY_WINDOW_SIZE)
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.deadline_exceeded = 0
+
+    def hedge_delay(self) -> PyOptional[float]:
+        """The observed p95, once enough samples exist; None disables hedging for now."""
+        if len(self.latency) < settings.DIFY_HEDGE_MIN_SAMPLES:
+            return None
+        return max(settings.DIFY_HEDGE_MIN_DELAY_SECONDS, self.latency.percentile(0.95))
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "deadline_exceeded": self.deadline_exceeded,
+            "latency_samples": len(self.latency),
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+_retry_stats: Dict[str, RetryStats] = {}
+
+
+def get_retry_stats(dify_app: str) -> RetryStats:
+    app_stats = _retry_stats.get(dify_app)
+    if app_stats is None:
+        app_stats = _retry_stats[dify_app] = RetryStats(dify_app)
+    return app_stats
+
+
+def retry_stats() -> Dict[str, Dict[str, Any]]:
+    return {dify_app: get_retry_stats(dify_app).stats() for dify_app in DIFY_APP_SETTINGS_PREFIXES}
+
+
+def is_retryable(exc: DifyWorkflowError) -> bool:
+    return exc.status_code in RETRYABLE_STATUS_CODES and not is_local_rejection(exc)
+
+
+def _backoff_seconds(retry_index: int) -> float:
+    cap = min(settings.DIFY_RETRY_BACKOFF_MAX_SECONDS, settings.DIFY_RETRY_BACKOFF_BASE_SECONDS * (2 ** retry_index))
+    return random.uniform(0, cap) # Full jitter keeps retrying clients from synchronizing
+
+
+async def call_with_deadline(
+    dify_app: str,
+    attempt_fn: Callable[[float, float], Awaitable[Any]],
+    idempotent: bool,
+    report: DifyCallReport,
+) -> Any:
+    """
+    Runs `attempt_fn(read_timeout, connect_timeout)` within the app's latency budget.
+    Idempotent calls are retried on transient errors with jittered exponential backoff while the
+    budget allows, and (if HEDGE_ENABLED) hedged with a second request once the first outlives the p95.
+    """
+    app_stats = get_retry_stats(dify_app)
+    budget: float = settings.dify_app_setting(dify_app, "LATENCY_BUDGET_SECONDS")
+    read_timeout_setting: float = settings.dify_app_setting(dify_app, "READ_TIMEOUT_SECONDS")
+    connect_timeout: float = settings.dify_app_setting(dify_app, "CONNECT_TIMEOUT_SECONDS")
+    max_retries: int = settings.dify_app_setting(dify_app, "MAX_RETRIES") if idempotent else 0
+    hedge_enabled: bool = idempotent and settings.dify_app_setting(dify_app, "HEDGE_ENABLED")
+
+    deadline = time.monotonic() + budget
+    app_stats.calls += 1
+
+    def remaining() -> float:
+        return deadline - time.monotonic()
+
+    async def attempt() -> Any:
+        report.attempts += 1
+        app_stats.attempts += 1
+        return await attempt_fn(max(0.001, min(read_timeout_setting, remaining())), connect_timeout)
+
+    retry_index = 0
+    while True:
+        try:
+            hedge_delay = app_stats.hedge_delay() if hedge_enabled else None
+            attempt_started_at = time.monotonic()
+            result = await _attempt_with_hedge(attempt, hedge_delay, report, app_stats)
+            app_stats.latency.record(time.monotonic() - attempt_started_at)
+            return result
+        except DifyWorkflowError as e:
+            if retry_index >= max_retries or not is_retryable(e):
+                raise
+            backoff = _backoff_seconds(retry_index)
+            if remaining() <= backoff:
+                app_stats.deadline_exceeded += 1
+                raise DifyWorkflowError(
+                    f"Dify app '{dify_app}' latency budget of {budget} seconds exhausted after {report.attempts} attempt(s): {e}",
+                    status_code=504, details={"reason": "deadline_exceeded", "attempts": report.attempts, "last_error": e.details})
+            retry_index += 1
+            app_stats.retries += 1
+            logger.warning(
+                "Dify attempt failed, retrying",
+                extra={"dify_app": dify_app, "attempt": report.attempts, "status_code": e.status_code,
+                       "backoff_seconds": round(backoff, 3), "budget_left_seconds": round(remaining(), 2)},
+            )
+            await asyncio.sleep(backoff)
+
+
+async def _attempt_with_hedge(
+    attempt: Callable[[], Awaitable[Any]],
+    hedge_delay: PyOptional[float],
+    report: DifyCallReport,
+    app_stats: RetryStats,
+) -> Any:
+    if hedge_delay is None:
+        return await attempt()
+
+    primary = asyncio.ensure_future(attempt())
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        report.hedged = True
+        app_stats.hedges_fired += 1
+        hedge = asyncio.ensure_future(attempt())
+        tasks.append(hedge)
+        pending = set(tasks)
+        first_error: PyOptional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        report.hedge_won = True
+                        app_stats.hedges_won += 1
+                    return task.result()
+                first_error = first_error or task.exception()
+        raise first_error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel() # The loser (or both, if we were cancelled) must not keep a connection busy
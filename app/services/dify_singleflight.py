@@ -0,0 +1,67 @@
+# backend/app/services/dify_singleflight.py
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict
+
+from app.core.config import settings, DIFY_APP_SETTINGS_PREFIXES
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one upstream call: the first caller starts it,
+    later callers await the same task and receive its result (or its exception).
+    """
+
+    def __init__(self, dify_app: str):
+        self.dify_app = dify_app
+        self.enabled: bool = settings.dify_app_setting(dify_app, "COALESCE_ENABLED")
+        self._inflight: Dict[str, "asyncio.Task[Any]"] = {}
+        self.leaders = 0     # Calls that actually went upstream
+        self.coalesced = 0   # Calls that joined an in-flight upstream call instead
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            # Every follower gets its own copy, the leader keeps the original.
+            return copy.deepcopy(await asyncio.shield(task))
+
+        self.leaders += 1
+        # Run upstream in its own task so a disconnecting leader doesn't cancel it for the followers.
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda finished: self._forget(key, finished))
+        return await asyncio.shield(task)
+
+    def is_in_flight(self, key: str) -> bool:
+        return key in self._inflight
+
+    def _forget(self, key: str, task: "asyncio.Task[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception() # Mark as retrieved even if every waiter went away
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.leaders,
+            "coalesced_calls": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0,
+        }
+
+
+_single_flights: Dict[str, SingleFlight] = {}
+
+
+def get_single_flight(dify_app: str) -> SingleFlight:
+    single_flight = _single_flights.get(dify_app)
+    if single_flight is None:
+        single_flight = _single_flights[dify_app] = SingleFlight(dify_app)
+    return single_flight
+
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    return {dify_app: get_single_flight(dify_app).stats() for dify_app in DIFY_APP_SETTINGS_PREFIXES}
@@ -0,0 +1,69 @@
+# backend/app/services/dify_upload_cache.py
+from typing import Any, Dict, Optional as PyOptional
+
+from app.core.config import settings
+from app.services.dify_cache import TTLLRUCache
+
+
+class DifyUploadCache:
+    """
+    Content-addressed map (Dify app, Dify user, SHA-256 of the file bytes) -> Dify upload_file_id, so resubmitting
+    the same image skips /files/upload. Dify scopes an uploaded file to the end user who uploaded it, so an id is
+    only reused for that same user. Entries expire after DIFY_UPLOAD_CACHE_TTL_SECONDS, which must stay below the
+    time Dify keeps uploaded files around.
+    """
+
+    def __init__(self):
+        self.enabled: bool = settings.DIFY_UPLOAD_CACHE_ENABLED
+        self._cache = TTLLRUCache(
+            max_entries=settings.DIFY_UPLOAD_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.DIFY_UPLOAD_CACHE_TTL_SECONDS,
+        )
+        self.bytes_uploaded = 0
+        self.bytes_saved = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(dify_app: str, dify_user: str, sha256: str) -> str:
+        return f"{dify_app}:{dify_user}:{sha256}"
+
+    def get(self, dify_app: str, dify_user: str, sha256: str, size: int) -> PyOptional[str]:
+        if not self.enabled:
+            return None
+        upload_file_id = self._cache.get(self._key(dify_app, dify_user, sha256))
+        if upload_file_id is not None:
+            self.bytes_saved += size
+        return upload_file_id
+
+    def set(self, dify_app: str, dify_user: str, sha256: str, size: int, upload_file_id: str) -> None:
+        self.bytes_uploaded += size
+        if self.enabled:
+            self._cache.set(self._key(dify_app, dify_user, sha256), upload_file_id)
+
+    def invalidate(self, dify_app: str, dify_user: str, sha256: str) -> None:
+        """Drops an id Dify no longer accepts (e.g. the file was cleaned up earlier than expected)."""
+        if self._cache.pop(self._key(dify_app, dify_user, sha256)):
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            **self._cache.stats(),
+            "bytes_uploaded": self.bytes_uploaded,
+            "bytes_saved": self.bytes_saved,
+            "invalidations": self.invalidations,
+        }
+
+
+_upload_cache: PyOptional[DifyUploadCache] = None
+
+
+def get_upload_cache() -> DifyUploadCache:
+    global _upload_cache
+    if _upload_cache is None:
+        _upload_cache = DifyUploadCache()
+    return _upload_cache
+
+
+def upload_cache_stats() -> Dict[str, Any]:
+    return get_upload_cache().stats()
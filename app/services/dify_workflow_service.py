@@ -1,67 +1,164 @@
 # backend/app/services/dify_workflow_service.py
-import requests
-import json
-from typing import Dict, Any, Optional as PyOptional
+import contextlib
+import httpx
+import logging
+import time
+from typing import AsyncIterator, Dict, Any, Optional as PyOptional
 
-# Settings will be passed or accessed differently now, or functions will take them directly.
-# from app.core.config import settings # We might not use the global settings directly here anymore
+from app.services.dify_client import get_dify_client, build_timeout, track_dify_request
+from app.services.dify_errors import DifyWorkflowError # Re-exported, API modules import it from here
+from app.services.dify_cache import get_response_cache, make_request_key
+from app.services.dify_singleflight import get_single_flight
+from app.services.dify_resilience import dify_app_guard
+from app.services.dify_retry import DifyCallReport, call_with_deadline, new_call_report
+from app.core.config import settings
+from app.core import json_codec
+from app.core.logging_config import log_payload, truncate_for_log
 
-class DifyWorkflowError(Exception):
-    def __init__(self, message: str, status_code: int = 500, details: Any = None):
-        super().__init__(message)
-        self.status_code = status_code
-        self.details = details
+logger = logging.getLogger(__name__)
 
-def call_dify_api( # Renamed for clarity, as it's more generic now
+CHAT_ENDPOINT_PATHS = ("/chat-messages", "/completion-messages")
+
+
+def _dify_error_from_http_error(e: httpx.HTTPError, dify_api_endpoint_path: str, timeout: float) -> DifyWorkflowError:
+    """Maps an httpx failure to the DifyWorkflowError (and HTTP status) the API layer exposes."""
+    # ... (Error handling IDENTICAL to the previous run_dify_workflow function) ...
+    if isinstance(e, httpx.TimeoutException):
+        msg = f"Dify request to {dify_api_endpoint_path} timed out after {timeout} seconds."
+        logger.warning(msg, extra={"endpoint": dify_api_endpoint_path, "timeout_seconds": timeout})
+        return DifyWorkflowError(msg, status_code=504, details={"timeout_seconds": timeout, "endpoint": dify_api_endpoint_path})
+    if isinstance(e, httpx.TransportError):
+        msg = f"Could not connect to Dify service for {dify_api_endpoint_path}: {e}"
+        logger.error(msg, extra={"endpoint": dify_api_endpoint_path})
+        return DifyWorkflowError(msg, status_code=503, details=str(e))
+    if isinstance(e, httpx.HTTPStatusError):
+        error_text = e.response.text
+        logger.error("Dify HTTP error", extra={"endpoint": dify_api_endpoint_path, "status_code": e.response.status_code, "body": truncate_for_log(error_text)})
+        try: error_details = json_codec.loads(e.response.content)
+        except ValueError: error_details = error_text
+        return DifyWorkflowError(f"Dify execution at {dify_api_endpoint_path} failed (status {e.response.status_code}).", status_code=e.response.status_code, details=error_details)
+    msg = f"An unexpected error occurred with Dify for {dify_api_endpoint_path}: {e}"
+    logger.error(msg, extra={"endpoint": dify_api_endpoint_path})
+    return DifyWorkflowError(msg, status_code=500, details=str(e))
+
+async def call_dify_api( # Renamed for clarity, as it's more generic now
     dify_base_url: str,
     dify_api_key: str,
     dify_api_endpoint_path: str, # e.g., "/chat-messages" or "/workflows/run"
     payload: Dict[str, Any], # This will contain inputs, user, response_mode, etc.
-    timeout: int = 500
+    timeout: PyOptional[float] = None, # Read timeout; defaults to the app's READ_TIMEOUT_SECONDS (500s without an app)
+    dify_app: PyOptional[str] = None # "chat" / "composition" / "vocab" / "grammar", enables the per-app policies below
 ) -> Dict[str, Any]:
     """
     A generic function to call a Dify API endpoint.
     The payload should be structured according to Dify's requirements for the specific endpoint.
+    Uses the pooled keep-alive client of the base URL, so it never blocks the event loop.
+    With `dify_app`, the call goes through that app's policies: response cache, coalescing of identical
+    concurrent calls, latency budget with retries/hedging (workflows only), circuit breaker and bulkhead.
     """
     if not dify_base_url or not dify_api_key:
         raise DifyWorkflowError("Dify Base URL or API Key was not provided for the API call.", status_code=503)
 
+    if not dify_app:
+        return await _post_to_dify(dify_base_url, dify_api_key, dify_api_endpoint_path, payload, timeout or 500)
+
+    report = new_call_report(dify_app)
+    started_at = time.monotonic()
+    try:
+        result = await _call_dify_app(dify_base_url, dify_api_key, dify_api_endpoint_path, payload, timeout, dify_app, report)
+        report.outcome = "ok"
+        return result
+    except DifyWorkflowError as e:
+        is_deadline = isinstance(e.details, dict) and e.details.get("reason") == "deadline_exceeded"
+        report.outcome = "deadline_exceeded" if is_deadline else "error"
+        raise
+    finally:
+        report.elapsed_ms = (time.monotonic() - started_at) * 1000
+
+
+async def _call_dify_app(
+    dify_base_url: str,
+    dify_api_key: str,
+    dify_api_endpoint_path: str,
+    payload: Dict[str, Any],
+    timeout: PyOptional[float],
+    dify_app: str,
+    report: DifyCallReport,
+) -> Dict[str, Any]:
+    is_blocking = payload.get("response_mode", "blocking") == "blocking"
+    cache = get_response_cache(dify_app)
+    single_flight = get_single_flight(dify_app)
+    cache_key: PyOptional[str] = None
+    if is_blocking and cache.enabled:
+        cache_key = cache.make_key(dify_api_endpoint_path, payload)
+        cached_result = cache.get(cache_key)
+        if cached_result is not None:
+            logger.debug("Dify response cache hit", extra={"dify_app": dify_app, "endpoint": dify_api_endpoint_path})
+            report.from_cache = True
+            return cached_result
+
+    async def attempt(read_timeout: float, connect_timeout: float) -> Dict[str, Any]:
+        async with dify_app_guard(dify_app): # Every attempt (retry, hedge) needs the breaker's consent and a slot
+            return await _post_to_dify(dify_base_url, dify_api_key, dify_api_endpoint_path, payload,
+                                       min(read_timeout, timeout) if timeout else read_timeout, connect_timeout, dify_app)
+
+    async def fetch() -> Dict[str, Any]:
+        # Chat messages append to a conversation, so only workflow runs are retried/hedged.
+        idempotent = dify_api_endpoint_path not in CHAT_ENDPOINT_PATHS
+        result = await call_with_deadline(dify_app, attempt, idempotent=idempotent, report=report)
+        if cache_key is not None:
+            cache.set(cache_key, result)
+        return result
+
+    if is_blocking and single_flight.enabled:
+        # Same key rules as the cache: `user` only counts for apps that aren't shareable.
+        flight_key = cache_key or make_request_key(dify_app, dify_api_endpoint_path, payload, include_user=not cache.shareable)
+        report.coalesced = single_flight.is_in_flight(flight_key)
+        return await single_flight.do(flight_key, fetch)
+    return await fetch()
+
+
+def _app_guard(dify_app: PyOptional[str]):
+    """Per-app circuit breaker + bulkhead; calls without an app name are not guarded."""
+    return dify_app_guard(dify_app) if dify_app else contextlib.nullcontext()
+
+
+async def _post_to_dify(
+    dify_base_url: str,
+    dify_api_key: str,
+    dify_api_endpoint_path: str,
+    payload: Dict[str, Any],
+    timeout: float,
+    connect_timeout: PyOptional[float] = None,
+    dify_app: PyOptional[str] = None # Only used as the metrics label
+) -> Dict[str, Any]:
+    """Performs the actual blocking-mode POST and normalizes the result."""
+
     url = f"{dify_base_url.rstrip('/')}{dify_api_endpoint_path}"
     headers = {
         "Authorization": f"Bearer {dify_api_key}",
         "Content-Type": "application/json",
     }
 
-    print(f"Calling Dify API: URL={url}, Payload User={payload.get('user')}")
-    print(f"Full Payload to Dify ({dify_api_endpoint_path}): {json.dumps(payload, indent=2, ensure_ascii=False)}")
+    logger.debug("Calling Dify API", extra={"url": url, "dify_user": payload.get("user")})
+    log_payload(logger, "Dify request payload", payload, endpoint=dify_api_endpoint_path)
 
+    client = get_dify_client(dify_base_url)
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=timeout)
-        response.raise_for_status()
-    # ... (Error handling IDENTICAL to the previous run_dify_workflow function) ...
-    except requests.exceptions.Timeout:
-        msg = f"Dify request to {dify_api_endpoint_path} timed out after {timeout} seconds."
-        print(f"[DIFY API ERROR] {msg}")
-        raise DifyWorkflowError(msg, status_code=504, details={"timeout_seconds": timeout, "endpoint": dify_api_endpoint_path})
-    except requests.exceptions.ConnectionError as e:
-        msg = f"Could not connect to Dify service for {dify_api_endpoint_path}: {e}"
-        print(f"[DIFY API ERROR] {msg}")
-        raise DifyWorkflowError(msg, status_code=503, details=str(e))
-    except requests.exceptions.HTTPError as e:
-        error_text = e.response.text
-        print(f"[DIFY API ERROR] HTTP error from {dify_api_endpoint_path}: {e.response.status_code} - {error_text}")
-        try: error_details = e.response.json()
-        except ValueError: error_details = error_text
-        raise DifyWorkflowError(f"Dify execution at {dify_api_endpoint_path} failed (status {e.response.status_code}).", status_code=e.response.status_code, details=error_details)
-    except requests.exceptions.RequestException as e:
-        msg = f"An unexpected error occurred with Dify for {dify_api_endpoint_path}: {e}"
-        print(f"[DIFY API ERROR] {msg}")
-        raise DifyWorkflowError(msg, status_code=500, details=str(e))
+        async with track_dify_request(dify_app, dify_api_endpoint_path) as upstream_call:
+            response = await client.post(url, headers=headers, content=json_codec.dumps(payload), timeout=build_timeout(timeout, connect_timeout))
+            upstream_call.status = str(response.status_code)
+            response.raise_for_status()
+    except httpx.HTTPError as e:
+        raise _dify_error_from_http_error(e, dify_api_endpoint_path, timeout)
 
+    result = json_codec.loads(response.content)
+    log_payload(logger, "Dify raw result", result, endpoint=dify_api_endpoint_path)
+    return parse_dify_result(result, dify_api_endpoint_path)
 
-    result = response.json()
-    print(f"Dify API Raw Result (from {dify_api_endpoint_path}): {json.dumps(result, indent=2, ensure_ascii=False)}")
 
+def parse_dify_result(result: Dict[str, Any], dify_api_endpoint_path: str) -> Dict[str, Any]:
+    """Normalizes a blocking Dify response body (chat answer or workflow outputs), raising on error structures."""
     # For /chat-messages or /completion-messages, the structure is different
     if dify_api_endpoint_path in ["/chat-messages", "/completion-messages"]:
         if result.get("answer"):
@@ -71,7 +168,7 @@ def call_dify_api( # Renamed for clarity, as it's more generic now
             dify_message = result.get('message', result.get('code')) # Dify error messages
             if dify_status != 200 or dify_message:
                  error_msg = f"Dify chat/completion error: {dify_message or 'Unknown error'}"
-                 print(f"[DIFY API ERROR] {error_msg}")
+                 logger.error(error_msg, extra={"endpoint": dify_api_endpoint_path})
                  raise DifyWorkflowError(error_msg, status_code=dify_status if isinstance(dify_status, int) else 500, details=result)
             return {"answer": "AI did not provide an answer.", "raw_dify_response": result}
 
@@ -90,9 +187,73 @@ def call_dify_api( # Renamed for clarity, as it's more generic now
         dify_message = result.get('message', result.get('error', {}).get('message'))
         if dify_status not in [200, "succeeded", "success"] or result.get('code'):
             error_msg_from_dify = dify_message or 'Unknown Dify internal error in response body.'
-            print(f"[DIFY WORKFLOW ERROR] Dify API returned an error structure: {error_msg_from_dify}")
+            logger.error("Dify API returned an error structure", extra={"endpoint": dify_api_endpoint_path, "error": error_msg_from_dify})
             error_status_code = dify_status if isinstance(dify_status, int) and dify_status >= 400 else 500
             raise DifyWorkflowError(error_msg_from_dify, status_code=error_status_code, details=result)
         return {"text": "AI未能提供标准格式的输出。", "raw_dify_response": result}
 
-    return outputs
\ No newline at end of file
+    return outputs
+
+
+async def stream_dify_api(
+    dify_base_url: str,
+    dify_api_key: str,
+    dify_api_endpoint_path: str,
+    payload: Dict[str, Any],
+    timeout: PyOptional[float] = None,
+    dify_app: PyOptional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Calls a Dify endpoint with response_mode=streaming and yields every SSE event as a dict
+    (e.g. 'message', 'message_end', 'workflow_started', 'node_finished', 'workflow_finished').
+    `timeout` bounds the gap between two chunks, not the whole stream (Dify sends pings in between).
+    Streams are never retried: events may already have been relayed to the client.
+    Dify 'error' events and HTTP/transport failures are raised as DifyWorkflowError.
+    With `dify_app`, the whole stream holds one of the app's bulkhead slots and counts for its circuit breaker.
+    """
+    if not dify_base_url or not dify_api_key:
+        raise DifyWorkflowError("Dify Base URL or API Key was not provided for the API call.", status_code=503)
+
+    url = f"{dify_base_url.rstrip('/')}{dify_api_endpoint_path}"
+    headers = {
+        "Authorization": f"Bearer {dify_api_key}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+    }
+    connect_timeout: PyOptional[float] = None
+    if dify_app:
+        timeout = timeout or settings.dify_app_setting(dify_app, "READ_TIMEOUT_SECONDS")
+        connect_timeout = settings.dify_app_setting(dify_app, "CONNECT_TIMEOUT_SECONDS")
+    timeout = timeout or 500
+    streaming_payload = {**payload, "response_mode": "streaming"}
+    logger.debug("Streaming Dify API", extra={"url": url, "dify_user": payload.get("user")})
+    log_payload(logger, "Dify request payload", streaming_payload, endpoint=dify_api_endpoint_path)
+
+    client = get_dify_client(dify_base_url)
+    async with _app_guard(dify_app):
+        try:
+            async with track_dify_request(dify_app, dify_api_endpoint_path) as upstream_call, \
+                    client.stream("POST", url, headers=headers, content=json_codec.dumps(streaming_payload), timeout=build_timeout(timeout, connect_timeout)) as response:
+                upstream_call.status = str(response.status_code)
+                if response.is_error:
+                    await response.aread() # Load the error body so it can be reported
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue # Blank separators, 'event: ping' lines, comments
+                    data = line[len("data:"):].strip()
+                    if not data:
+                        continue
+                    try:
+                        event = json_codec.loads(data)
+                    except ValueError:
+                        logger.warning("Skipping undecodable Dify stream line", extra={"endpoint": dify_api_endpoint_path, "line": truncate_for_log(data, 200)})
+                        continue
+                    if event.get("event") == "error":
+                        dify_status = event.get("status")
+                        error_msg = f"Dify stream error: {event.get('message') or event.get('code') or 'Unknown error'}"
+                        logger.error(error_msg, extra={"endpoint": dify_api_endpoint_path})
+                        raise DifyWorkflowError(error_msg, status_code=dify_status if isinstance(dify_status, int) and dify_status >= 400 else 500, details=event)
+                    yield event
+        except httpx.HTTPError as e:
+            raise _dify_error_from_http_error(e, dify_api_endpoint_path, timeout)
@@ -0,0 +1,85 @@
+# backend/app/services/idempotency.py
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from app.core.config import settings
+from app.services.dify_cache import TTLLRUCache
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status_code: int
+    body: bytes # Rendered JSON
+
+
+class IdempotencyKeyConflict(Exception):
+    """The Idempotency-Key was already used by the same user for a different request."""
+
+
+class IdempotencyStore:
+    """
+    Idempotency-Key support for expensive POST endpoints (IDEMPOTENCY_*): the first request with a key runs,
+    a repeat (same user and key) replays its stored response for IDEMPOTENCY_TTL_SECONDS, or, while the original
+    is still running, waits for it instead of starting a second run. Only successful responses are stored, so
+    a retry after an error runs again. Each key is bound to a fingerprint of its request; reusing it for a
+    different request raises IdempotencyKeyConflict.
+    """
+
+    def __init__(self):
+        self.enabled: bool = settings.IDEMPOTENCY_ENABLED
+        self._completed = TTLLRUCache(max_entries=settings.IDEMPOTENCY_MAX_ENTRIES, ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+        self._inflight: Dict[str, Tuple[str, "asyncio.Task[StoredResponse]"]] = {}
+        self.executed = 0  # Keyed requests that actually ran
+        self.replayed = 0  # Repeats answered from a stored response
+        self.attached = 0  # Repeats that joined the still-running original
+        self.conflicts = 0
+
+    async def run(self, user_id: int, key: str, fingerprint: str, fn: Callable[[], Awaitable[StoredResponse]]) -> Tuple[StoredResponse, bool]:
+        """The response for this user's `key`, and whether it comes from an earlier request rather than this one."""
+        scope = f"{user_id}:{key}"
+        completed = self._completed.get(scope)
+        if completed is not None:
+            self._check(completed[0], fingerprint)
+            self.replayed += 1
+            return completed[1], True
+
+        inflight = self._inflight.get(scope)
+        if inflight is not None:
+            self._check(inflight[0], fingerprint)
+            self.attached += 1
+            return await asyncio.shield(inflight[1]), True
+
+        self.executed += 1
+        # Run in its own task so the result is still stored for the retry when the original client disconnects.
+        task = asyncio.ensure_future(fn())
+        self._inflight[scope] = (fingerprint, task)
+        task.add_done_callback(lambda finished: self._finish(scope, fingerprint, finished))
+        return await asyncio.shield(task), False
+
+    def _check(self, stored_fingerprint: str, fingerprint: str) -> None:
+        if stored_fingerprint != fingerprint:
+            self.conflicts += 1
+            raise IdempotencyKeyConflict()
+
+    def _finish(self, scope: str, fingerprint: str, task: "asyncio.Task[StoredResponse]") -> None:
+        if self._inflight.get(scope, (None, None))[1] is task:
+            del self._inflight[scope]
+        if task.cancelled() or task.exception() is not None: # Also marks the exception retrieved if every waiter went away
+            return
+        self._completed.set(scope, (fingerprint, task.result()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "attached": self.attached,
+            "duplicate_calls_avoided": self.replayed + self.attached,
+            "conflicts": self.conflicts,
+            "stored_responses": self._completed.stats(),
+        }
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,143 @@
+# backend/app/services/image_preprocessing.py
+import asyncio
+import io
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Optional as PyOptional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Pillow is optional: without it composition images are forwarded untouched
+    Image = None
+    ImageOps = None
+
+OUTPUT_FORMATS = {"JPEG": ("image/jpeg", ".jpg"), "WEBP": ("image/webp", ".webp")}
+# Formats forwarded as they are when the image is also below IMAGE_PREPROCESS_MIN_BYTES
+PASSTHROUGH_MIME_TYPES = frozenset({"image/jpeg", "image/png", "image/webp", "image/gif"})
+
+
+@dataclass
+class PreprocessedImage:
+    content: bytes
+    mime_type: str
+    extension: str
+    width: int
+    height: int
+
+
+def preprocess_image_bytes(content: bytes, max_edge: int, output_format: str, quality: int, grayscale: bool) -> PreprocessedImage:
+    """
+    Auto-orients (EXIF), downscales so the longest edge is at most `max_edge`, optionally converts to
+    grayscale and re-encodes as JPEG/WEBP. Metadata (EXIF, ICC, GPS) is not carried over.
+    Runs in a worker process; must stay a picklable module-level function.
+    """
+    mime_type, extension = OUTPUT_FORMATS[output_format]
+    with Image.open(io.BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("L" if grayscale else "RGB")
+        if max(image.size) > max_edge:
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format=output_format, quality=quality, optimize=True)
+        return PreprocessedImage(output.getvalue(), mime_type, extension, image.width, image.height)
+
+
+class ImagePreprocessor:
+    """Process pool for CPU-heavy image work, so decoding/resizing never blocks the event loop."""
+
+    def __init__(self):
+        self._pool: PyOptional[ProcessPoolExecutor] = None
+        self.processed = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.IMAGE_PREPROCESS_ENABLED and Image is not None
+
+    def applies(self, size: PyOptional[int], mime_type: PyOptional[str]) -> bool:
+        """
+        Whether an image is preprocessed: only large ones (IMAGE_PREPROCESS_MIN_BYTES, or of unknown size) and ones
+        in other formats. Those are held in memory for the pool; all others stream to Dify untouched.
+        """
+        if not self.enabled:
+            return False
+        return size is None or size >= settings.IMAGE_PREPROCESS_MIN_BYTES or mime_type not in PASSTHROUGH_MIME_TYPES
+
+    def start(self) -> None:
+        if not settings.IMAGE_PREPROCESS_ENABLED:
+            return
+        if Image is None:
+            logger.warning("IMAGE_PREPROCESS_ENABLED is set but Pillow is not installed; composition images are uploaded as-is.")
+            return
+        self._pool = ProcessPoolExecutor(max_workers=settings.IMAGE_PREPROCESS_WORKERS)
+        logger.info("Image preprocessing pool started", extra={"processes": settings.IMAGE_PREPROCESS_WORKERS})
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def preprocess(self, content: bytes) -> PyOptional[PreprocessedImage]:
+        """Returns the preprocessed image, or None if disabled or the image could not be processed."""
+        if not self.enabled:
+            return None
+        if self._pool is None:
+            self.start()
+        started_at = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._pool, preprocess_image_bytes, content,
+                settings.IMAGE_PREPROCESS_MAX_EDGE, settings.IMAGE_PREPROCESS_FORMAT.upper(),
+                settings.IMAGE_PREPROCESS_QUALITY, settings.IMAGE_PREPROCESS_GRAYSCALE,
+            )
+        except Exception as e:
+            self.failed += 1
+            logger.warning("Image preprocessing failed, uploading the original", extra={"error": f"{type(e).__name__}: {e}"})
+            return None
+        elapsed = time.perf_counter() - started_at
+        self.processed += 1
+        self.bytes_in += len(content)
+        self.bytes_out += len(result.content)
+        self.total_seconds += elapsed
+        logger.info(
+            "Image preprocessed",
+            extra={"elapsed_ms": round(elapsed * 1000, 1), "bytes_in": len(content), "bytes_out": len(result.content),
+                   "width": result.width, "height": result.height, "mime_type": result.mime_type},
+        )
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "processes": settings.IMAGE_PREPROCESS_WORKERS if self._pool is not None else 0,
+            "processed": self.processed,
+            "failed": self.failed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "size_ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+            "avg_ms": round(self.total_seconds / self.processed * 1000, 1) if self.processed else None,
+        }
+
+
+image_preprocessor = ImagePreprocessor()
+
+
+def max_image_input_bytes() -> int:
+    """Raw upload cap: originals may exceed the Dify upload limit when they are downscaled first."""
+    if image_preprocessor.enabled:
+        return max(settings.IMAGE_PREPROCESS_MAX_INPUT_BYTES, settings.DIFY_UPLOAD_MAX_BYTES)
+    return settings.DIFY_UPLOAD_MAX_BYTES
+
+
+def preprocessed_filename(original_filename: str, image: PreprocessedImage) -> str:
+    return os.path.splitext(original_filename)[0] + image.extension
@@ -0,0 +1,92 @@
+# backend/app/services/known_words.py
+import logging
+import math
+from typing import Any, Dict, FrozenSet
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session as SQLAlchemySession
+
+from app.core.config import settings
+from app.crud import vocabulary_crud
+from app.services.dify_cache import TTLLRUCache
+
+logger = logging.getLogger(__name__)
+
+# Prior for the share of generated words a user already knows, until their own requests say otherwise
+INITIAL_KNOWN_RATIO = 0.2
+# Weight of the latest request in the per-user moving average of that share
+KNOWN_RATIO_ALPHA = 0.3
+# Over-fetching never assumes more than this share is known (the request would balloon otherwise)
+MAX_KNOWN_RATIO = 0.75
+
+
+class KnownWordFilter:
+    """
+    Keeps generated vocabulary free of words the user already has as KNOWN/MASTERED (VOCAB_GEN_FILTER_KNOWN_WORDS):
+    the known-word set is cached per user (invalidated on progress updates), and Dify is asked for more words
+    than requested, scaled by the share of known words the user's recent lists contained, so that the fresh words
+    usually fill `word_count` without a second call.
+    """
+
+    def __init__(self):
+        self.enabled: bool = settings.VOCAB_GEN_FILTER_KNOWN_WORDS
+        self._known_words = TTLLRUCache(max_entries=settings.KNOWN_WORDS_CACHE_MAX_USERS, ttl_seconds=settings.KNOWN_WORDS_CACHE_TTL_SECONDS)
+        self._known_ratios = TTLLRUCache(max_entries=settings.KNOWN_WORDS_CACHE_MAX_USERS, ttl_seconds=86400)
+        self.requests = 0
+        self.words_generated = 0
+        self.words_dropped = 0
+        self.second_calls = 0
+        self.second_calls_avoided = 0 # Known words were dropped, and the over-fetched words still filled the count
+
+    def known_words(self, db: SQLAlchemySession, user_id: int) -> FrozenSet[str]:
+        """
+        Casefolded KNOWN/MASTERED words of the user, one indexed query per user and cache TTL.
+        Empty when filtering is disabled or the query fails (generation then just isn't filtered).
+        """
+        if not self.enabled:
+            return frozenset()
+        known = self._known_words.get(str(user_id))
+        if known is None:
+            try:
+                known = frozenset(word.casefold() for word in vocabulary_crud.get_known_words(db, user_id))
+            except SQLAlchemyError:
+                logger.exception("Could not load known words, vocabulary is not filtered", extra={"user_id": user_id})
+                return frozenset()
+            self._known_words.set(str(user_id), known)
+        return known
+
+    def invalidate(self, user_id: int) -> None:
+        self._known_words.pop(str(user_id))
+
+    def fetch_count(self, user_id: str, word_count: int, known: FrozenSet[str]) -> int:
+        """How many words to ask Dify for so that `word_count` of them are likely new to the user."""
+        if not known:
+            return word_count
+        ratio = self._known_ratios.get(user_id)
+        ratio = min(INITIAL_KNOWN_RATIO if ratio is None else ratio, MAX_KNOWN_RATIO)
+        wanted = math.ceil(word_count * (1 + settings.VOCAB_GEN_OVERFETCH_MARGIN) / (1 - ratio))
+        return max(word_count, min(wanted, settings.VOCAB_GEN_OVERFETCH_MAX_WORDS))
+
+    def record(self, user_id: str, generated: int, dropped: int) -> None:
+        self.words_generated += generated
+        self.words_dropped += dropped
+        if generated:
+            previous = self._known_ratios.get(user_id)
+            latest = dropped / generated
+            self._known_ratios.set(user_id, latest if previous is None else previous + KNOWN_RATIO_ALPHA * (latest - previous))
+
+    def stats(self) -> Dict[str, Any]:
+        filtered = self.second_calls + self.second_calls_avoided
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "words_generated": self.words_generated,
+            "known_words_dropped": self.words_dropped,
+            "second_calls": self.second_calls,
+            "second_calls_avoided": self.second_calls_avoided,
+            "second_call_avoided_rate": round(self.second_calls_avoided / filtered, 4) if filtered else 0.0,
+            "known_word_sets": self._known_words.stats(),
+        }
+
+
+known_word_filter = KnownWordFilter()
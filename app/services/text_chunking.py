@@ -0,0 +1,40 @@
+# backend/app/services/text_chunking.py
+import re
+import zlib
+from typing import List
+
+# A sentence runs up to its terminator (plus closing quotes/brackets) or a line break, trailing whitespace included.
+# English terminators need whitespace after them so "3.5" or "e.g.x" stay whole; CJK ones don't.
+SENTENCE_RE = re.compile(r".+?(?:[.!?]+[\"'”’)\]]*(?=\s|$)|[。！？]+[”’」』)）]*|\n|$)\s*", re.S)
+
+# A chunk that has reached its minimum size ends after a sentence whose hash hits this modulus
+# (on average after every 4th sentence), so boundaries depend on the sentences, not on their offsets.
+BOUNDARY_MODULUS = 4
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences of `text`; joined back together they give `text` exactly."""
+    return [match.group(0) for match in SENTENCE_RE.finditer(text) if match.group(0)]
+
+
+def chunk_text(text: str, max_chars: int) -> List[str]:
+    """
+    Splits `text` at sentence boundaries into chunks of at most `max_chars` (a single longer sentence
+    becomes a chunk of its own). Boundaries are content-defined: editing one sentence only changes
+    the chunk containing it (and, rarely, its neighbour), so the other chunks keep their cache keys.
+    Chunks are stripped; whitespace-only chunks are dropped.
+    """
+    min_chars = max_chars // 4
+    chunks: List[str] = []
+    current = ""
+    for sentence in split_sentences(text):
+        if current and len(current) + len(sentence) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += sentence
+        if len(current) >= min_chars and zlib.crc32(sentence.strip().encode("utf-8")) % BOUNDARY_MODULUS == 0:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
@@ -0,0 +1,213 @@
+# backend/app/services/vocab_semantic_cache.py
+import copy
+import math
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional as PyOptional, Set, Tuple
+
+from app.core.config import settings
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Connectives and filler that don't change which words a keyword set asks for
+STOPWORDS = frozenset({
+    "a", "an", "and", "or", "the", "of", "for", "in", "on", "at", "to", "with", "about", "words", "word", "vocabulary",
+    "和", "与", "及", "的", "或", "关于", "单词", "词汇",
+})
+
+# Words ending in -s that are not plurals (or whose -s must stay to keep the topic apart from another word)
+NOT_PLURALS = frozenset({
+    "news", "series", "species", "means", "lens", "gas", "bus", "yes", "this", "thus", "its", "has", "was", "his",
+    "always", "perhaps", "whereas", "atlas", "canvas", "bias", "alias", "christmas", "chaos", "cosmos", "pancreas",
+    "trousers", "jeans", "pants", "scissors", "glasses", "clothes", "goods", "savings", "arms", "manners", "customs",
+})
+
+# Endings that are not a plural -s: class, status, basis, physics, famous
+NON_PLURAL_ENDINGS = ("ss", "us", "is", "ics", "ous")
+# Plurals formed with -es: the -es goes (boxes -> box, churches -> church)
+ES_PLURAL_ENDINGS = ("sses", "shes", "ches", "xes", "zes")
+
+# Upper (exclusive) edges of the best-similarity buckets reported in stats(), followed by "1.0" and "no_candidate"
+SIMILARITY_BUCKETS = (0.5, 0.7, 0.8, 0.9, 0.95, 1.0)
+
+_Key = Tuple[str, str] # (scope, normalized keywords)
+
+
+def _fold_plural(token: str) -> str:
+    """
+    Minimal English plural folding. It errs on the side of keeping the token: an irregular plural that stays
+    apart from its singular only lowers the similarity, a different word folded onto another ("news" -> "new")
+    would serve the wrong topic at similarity 1.0.
+    """
+    if len(token) <= 3 or not token.endswith("s") or token in NOT_PLURALS or token.endswith(NON_PLURAL_ENDINGS):
+        return token
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith(ES_PLURAL_ENDINGS):
+        return token[:-2]
+    return token[:-1]
+
+
+def normalize_keywords(keywords: str) -> str:
+    """Casefolded, de-duplicated, sorted tokens without stopwords or plural endings: "Airports & travel" -> "airport travel"."""
+    tokens = {_fold_plural(token) for token in _TOKEN_RE.findall(keywords.casefold()) if token not in STOPWORDS}
+    return " ".join(sorted(tokens))
+
+
+def keyword_vector(normalized: str) -> Dict[str, float]:
+    """
+    L2-normalized sparse vector of character trigrams of every token (padded, so word starts/ends count)
+    plus one feature per whole token: spelling variants overlap, different topics mostly don't.
+    """
+    counts: Dict[str, float] = {}
+    for token in normalized.split():
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            gram = padded[i:i + 3]
+            counts[gram] = counts.get(gram, 0.0) + 1.0
+        counts["w:" + token] = counts.get("w:" + token, 0.0) + 1.0
+    norm = math.sqrt(sum(value * value for value in counts.values()))
+    return {feature: value / norm for feature, value in counts.items()} if norm else {}
+
+
+@dataclass
+class _Entry:
+    vector: Dict[str, float]
+    words: List[Dict[str, Any]]
+    expires_at: float
+    exhausted: bool # A top-up of this list brought no new words
+
+
+@dataclass
+class SemanticMatch:
+    keywords: str # Normalized keywords of the stored list
+    words: List[Dict[str, Any]]
+    similarity: float
+    exhausted: bool
+
+
+class SemanticVocabularyCache:
+    """
+    Near-duplicate cache of generated word lists (VOCAB_GEN_SEMANTIC_CACHE_*), on top of the exact response cache:
+    a lookup returns the stored list whose keywords are most similar (cosine over keyword_vector) to the requested
+    ones, if that similarity reaches the threshold. Entries are scoped (per user unless vocab results are shareable),
+    expire with VOCAB_GEN_CACHE_TTL_SECONDS and are evicted least recently used first.
+    """
+
+    def __init__(self):
+        self.enabled: bool = settings.VOCAB_GEN_SEMANTIC_CACHE_ENABLED
+        self.threshold: float = settings.VOCAB_GEN_SEMANTIC_CACHE_THRESHOLD
+        self.max_entries: int = settings.VOCAB_GEN_SEMANTIC_CACHE_MAX_ENTRIES
+        self.ttl_seconds: float = settings.VOCAB_GEN_CACHE_TTL_SECONDS
+        self._entries: "OrderedDict[_Key, _Entry]" = OrderedDict()
+        self._postings: Dict[str, Set[_Key]] = {} # Feature -> entries having it, so a lookup only scores overlapping entries
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.topups = 0
+        self.topups_exhausted = 0
+        self._similarity_counts = [0] * (len(SIMILARITY_BUCKETS) + 2)
+
+    def lookup(self, scope: str, keywords: str) -> PyOptional[SemanticMatch]:
+        normalized = normalize_keywords(keywords)
+        if not normalized:
+            return None
+        now = time.monotonic()
+        best_key: PyOptional[_Key] = None
+        best_similarity = 0.0
+        if self._live((scope, normalized), now):
+            best_key, best_similarity = (scope, normalized), 1.0
+        else:
+            scores: Dict[_Key, float] = {}
+            for feature, weight in keyword_vector(normalized).items():
+                for key in self._postings.get(feature, ()):
+                    if key[0] == scope:
+                        scores[key] = scores.get(key, 0.0) + weight * self._entries[key].vector[feature]
+            for key, similarity in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+                if self._live(key, now):
+                    best_key, best_similarity = key, min(similarity, 1.0)
+                    break
+        self._record_similarity(best_key is not None, best_similarity)
+
+        if best_key is None or best_similarity < self.threshold:
+            self.misses += 1
+            return None
+        if best_key[1] == normalized:
+            self.exact_hits += 1
+        else:
+            self.near_hits += 1
+        self._entries.move_to_end(best_key)
+        entry = self._entries[best_key]
+        return SemanticMatch(keywords=best_key[1], words=copy.deepcopy(entry.words), similarity=round(best_similarity, 4), exhausted=entry.exhausted)
+
+    def store(self, scope: str, keywords: str, words: List[Dict[str, Any]], exhausted: bool = False) -> None:
+        """Stores a list; `exhausted` marks one that a top-up could not extend, so it is served as it is from then on."""
+        normalized = normalize_keywords(keywords)
+        if not normalized or not words or self.max_entries <= 0:
+            return
+        key = (scope, normalized)
+        self._remove(key)
+        vector = keyword_vector(normalized)
+        self._entries[key] = _Entry(vector=vector, words=copy.deepcopy(words), expires_at=time.monotonic() + self.ttl_seconds, exhausted=exhausted)
+        for feature in vector:
+            self._postings.setdefault(feature, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def record_topup(self, added: int) -> None:
+        self.topups += 1
+        if not added:
+            self.topups_exhausted += 1
+
+    def _live(self, key: _Key, now: float) -> bool:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        if entry.expires_at <= now:
+            self._remove(key)
+            return False
+        return True
+
+    def _remove(self, key: _Key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for feature in entry.vector:
+            keys = self._postings.get(feature)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[feature]
+
+    def _record_similarity(self, found: bool, similarity: float) -> None:
+        if not found:
+            self._similarity_counts[-1] += 1
+        elif similarity >= 1.0:
+            self._similarity_counts[-2] += 1
+        else:
+            self._similarity_counts[next(slot for slot, upper in enumerate(SIMILARITY_BUCKETS) if similarity < upper)] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.exact_hits + self.near_hits
+        lookups = hits + self.misses
+        edges = (0.0,) + SIMILARITY_BUCKETS
+        labels = [f"{lower}-{upper}" for lower, upper in zip(edges, SIMILARITY_BUCKETS)] + ["1.0", "no_candidate"]
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "lookups": lookups,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "topups": self.topups,
+            "topups_without_new_words": self.topups_exhausted,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "best_similarity_histogram": dict(zip(labels, self._similarity_counts)),
+        }
+
+
+vocab_semantic_cache = SemanticVocabularyCache()
@@ -0,0 +1,143 @@
+# backend/app/services/vocab_word_bank.py
+import asyncio
+import copy
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional as PyOptional, Set
+
+from app.core import json_codec
+from app.core.config import settings
+from app.schemas.vocabulary_schemas import dify_word_text
+from app.services.vocab_semantic_cache import normalize_keywords
+
+logger = logging.getLogger(__name__)
+
+
+class WordBank:
+    """
+    Every successfully generated word, kept for answering vocabulary requests while the Dify app is slow or down
+    (VOCAB_WORD_BANK_*). On disk it is an append-only JSONL file, one {"word": {...}, "topics": [...]} line per new
+    word or new topic of a word; in memory, the latest data per word plus an inverted index from topic tokens
+    (the normalized keywords the word was generated for, and the word itself) to words.
+    The file is loaded once at startup (start(), in a worker thread) and appended to by a background writer,
+    so requests never touch the disk.
+    """
+
+    def __init__(self):
+        self.enabled: bool = settings.VOCAB_WORD_BANK_ENABLED
+        self.path: str = settings.data_path(settings.VOCAB_WORD_BANK_PATH)
+        self.max_words: int = settings.VOCAB_WORD_BANK_MAX_WORDS
+        self._words: Dict[str, Dict[str, Any]] = {}  # casefolded word -> word data
+        self._topics: Dict[str, Set[str]] = {}       # casefolded word -> its topic tokens
+        self._index: Dict[str, Set[str]] = {}        # topic token -> casefolded words
+        self._added_at: Dict[str, float] = {}
+        self._loaded = False
+        self._pending: List[bytes] = [] # Lines not yet appended to the file
+        self._writer: PyOptional["asyncio.Task[None]"] = None
+        self.lookups = 0
+        self.served = 0
+        self.write_errors = 0
+
+    def start(self) -> None:
+        """Loads the file into memory; blocking, run it off the event loop."""
+        if not self.enabled or self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        started_at = time.perf_counter()
+        skipped = 0
+        with open(self.path, "rb") as bank_file:
+            for line in bank_file:
+                try:
+                    record = json_codec.loads(line)
+                    self._index_word(record["word"], record["topics"])
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    skipped += 1 # A torn last line after a crash, or a hand edit
+        logger.info("Vocabulary word bank loaded", extra={"path": self.path, "words": len(self._words), "skipped_lines": skipped,
+                                                          "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 1)})
+
+    def add(self, keywords: str, words: List[Dict[str, Any]]) -> None:
+        """Banks a generated list under the keywords it was generated for; only new words/topics are queued for the disk."""
+        if not self.enabled:
+            return
+        topics = normalize_keywords(keywords).split()
+        lines: List[bytes] = []
+        for word in words:
+            key = dify_word_text(word).casefold()
+            if not key or (key not in self._words and len(self._words) >= self.max_words):
+                continue
+            new_topics = set(topics) | set(normalize_keywords(key).split())
+            if key in self._words and new_topics <= self._topics[key]:
+                continue
+            self._index_word(word, sorted(new_topics))
+            lines.append(json_codec.dumps({"word": word, "topics": sorted(new_topics)}) + b"\n")
+        if not lines:
+            return
+        self._pending.extend(lines)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write_pending())
+
+    async def _write_pending(self) -> None:
+        while self._pending:
+            lines, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._append, lines)
+            except OSError as e:
+                self.write_errors += 1
+                logger.warning("Could not write to the vocabulary word bank", extra={"path": self.path, "error": str(e), "lines": len(lines)})
+
+    def _append(self, lines: List[bytes]) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "ab") as bank_file:
+            bank_file.write(b"".join(lines))
+
+    async def flush(self) -> None:
+        """Waits until every queued line is on disk (at shutdown)."""
+        while self._writer is not None and not self._writer.done():
+            await self._writer
+
+    def _index_word(self, word: Dict[str, Any], topics: List[str]) -> None:
+        key = str(word["word"]).casefold()
+        self._words[key] = word
+        self._added_at[key] = time.monotonic()
+        known_topics = self._topics.setdefault(key, set())
+        for topic in topics:
+            known_topics.add(topic)
+            self._index.setdefault(topic, set()).add(key)
+
+    def get(self, word: str) -> PyOptional[Dict[str, Any]]:
+        """The banked details of exactly this word, if any."""
+        data = self._words.get(word.strip().casefold())
+        return copy.deepcopy(data) if data is not None else None
+
+    def lookup(self, keywords: str, word_count: int) -> List[Dict[str, Any]]:
+        """
+        Up to `word_count` banked words for the keywords: most matching topic tokens first, then most recently banked.
+        Empty if no word shares a topic token with the keywords.
+        """
+        self.lookups += 1
+        scores: Dict[str, int] = {}
+        for token in normalize_keywords(keywords).split():
+            for key in self._index.get(token, ()):
+                scores[key] = scores.get(key, 0) + 1
+        ranked = sorted(scores, key=lambda key: (scores[key], self._added_at[key]), reverse=True)[:word_count]
+        if ranked:
+            self.served += 1
+        return [copy.deepcopy(self._words[key]) for key in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "words": len(self._words),
+            "topics": len(self._index),
+            "max_words": self.max_words,
+            "fallback_lookups": self.lookups,
+            "fallbacks_served": self.served,
+            "pending_writes": len(self._pending),
+            "write_errors": self.write_errors,
+        }
+
+
+vocab_word_bank = WordBank()
@@ -0,0 +1,97 @@
+# backend/app/services/word_detail_fetcher.py
+import logging
+import time
+from typing import Any, Dict, List, Optional as PyOptional
+
+from app.core import json_codec
+from app.core.config import settings
+from app.schemas.vocabulary_schemas import dify_word_text
+from app.services.dify_workflow_service import call_dify_api
+from app.services.vocab_word_bank import vocab_word_bank
+
+logger = logging.getLogger(__name__)
+
+# Dify user the paid lookups run as (they are not on behalf of one user)
+BACKFILL_DIFY_USER = "word-detail-backfill"
+
+
+class WordDetailFetcher:
+    """
+    Details of a single word for the word_details backfill (word_detail_store.schedule_backfill).
+    The local word bank is tried first, which costs nothing. Dify has no lookup for one word, so the fallback is a
+    token-billed run of the vocab workflow (keywords = the word, count 1) whose non-deterministic answer only helps
+    if it contains that word. Those runs are capped at WORD_DETAIL_BACKFILL_DIFY_CALLS_PER_HOUR (0 = never), since
+    they are triggered by reads of the review list; the words they do return are banked for later lookups.
+    """
+
+    def __init__(self):
+        self.dify_calls_per_hour: int = settings.WORD_DETAIL_BACKFILL_DIFY_CALLS_PER_HOUR
+        self._window_started_at = time.monotonic()
+        self._window_calls = 0
+        self.bank_hits = 0
+        self.dify_calls = 0
+        self.dify_misses = 0 # Paid runs that did not return the word
+        self.over_budget = 0
+
+    async def fetch(self, word: str) -> PyOptional[Dict[str, Any]]:
+        banked = vocab_word_bank.get(word)
+        if banked is not None:
+            self.bank_hits += 1
+            return banked
+        if not self._take_dify_call():
+            self.over_budget += 1
+            return None
+
+        self.dify_calls += 1
+        dify_response_data = await call_dify_api(
+            dify_base_url=settings.VOCAB_GEN_APP_BASE_URL,
+            dify_api_key=settings.VOCAB_GEN_APP_API_KEY,
+            dify_api_endpoint_path=settings.VOCAB_GEN_APP_API_ENDPOINT,
+            payload={
+                "inputs": {settings.VOCAB_GEN_INPUT_KEY: word, settings.VOCAB_GEN_WORD_COUNT_KEY: 1},
+                "response_mode": "blocking",
+                "user": BACKFILL_DIFY_USER,
+            },
+            dify_app="vocab",
+        )
+        words = self._word_list(dify_response_data)
+        vocab_word_bank.add(word, words)
+        key = word.strip().casefold()
+        detail = next((generated for generated in words if dify_word_text(generated).strip().casefold() == key), None)
+        if detail is None:
+            self.dify_misses += 1
+        return detail
+
+    def _take_dify_call(self) -> bool:
+        now = time.monotonic()
+        if now - self._window_started_at >= 3600:
+            self._window_started_at = now
+            self._window_calls = 0
+        if self._window_calls >= self.dify_calls_per_hour:
+            return False
+        self._window_calls += 1
+        return True
+
+    @staticmethod
+    def _word_list(dify_response_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The generated word entries (objects only); empty if the output is not a word list."""
+        words = dify_response_data.get(settings.VOCAB_GEN_OUTPUT_KEY)
+        if isinstance(words, str):
+            try:
+                words = json_codec.loads(words)
+            except json_codec.JSONDecodeError:
+                logger.warning("Word detail lookup returned malformed JSON", extra={"output": words[:200]})
+                return []
+        return [word for word in words if isinstance(word, dict)] if isinstance(words, list) else []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "dify_calls_per_hour": self.dify_calls_per_hour,
+            "bank_hits": self.bank_hits,
+            "dify_calls": self.dify_calls,
+            "dify_calls_without_the_word": self.dify_misses,
+            "skipped_over_budget": self.over_budget,
+        }
+
+
+word_detail_fetcher = WordDetailFetcher()
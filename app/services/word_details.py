@@ -0,0 +1,126 @@
+# backend/app/services/word_details.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional as PyOptional, Set
+
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.crud import vocabulary_crud
+from app.db.database import SessionLocal
+from app.schemas.vocabulary_schemas import DifyWordSchema, dify_word_text
+from app.services.dify_cache import TTLLRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class WordDetailStore:
+    """
+    Keeps the shared word_details table filled (WORD_DETAIL_*): generated words are written through as they are
+    produced, and words found without details (e.g. on a review list) are backfilled in the background, at most
+    WORD_DETAIL_BACKFILL_CONCURRENCY at a time. Only entries that match DifyWordSchema are stored (the generated
+    list itself is passed through unvalidated), so readers can rely on it. Database work runs in worker threads,
+    off the event loop.
+    """
+
+    def __init__(self):
+        self.enabled: bool = settings.WORD_DETAIL_STORE_ENABLED
+        self._backfill_slots = asyncio.Semaphore(max(1, settings.WORD_DETAIL_BACKFILL_CONCURRENCY))
+        self._backfilling: Set[str] = set()
+        # Words whose backfill found nothing are not tried again until this expires
+        self._recent_failures = TTLLRUCache(max_entries=10000, ttl_seconds=settings.WORD_DETAIL_BACKFILL_RETRY_SECONDS)
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self.words_saved = 0
+        self.words_rejected = 0 # Entries that do not match DifyWordSchema, not stored
+        self.save_errors = 0
+        self.backfilled = 0
+        self.backfill_failed = 0
+
+    def save(self, words: List[Dict[str, Any]]) -> None:
+        """Writes the details of generated words through to the table, without waiting for it."""
+        if self.enabled and words:
+            self._spawn(self._save(words))
+
+    async def _save(self, words: List[Dict[str, Any]]) -> int:
+        """Number of words stored."""
+        words = self._schema_valid(words)
+        if not words:
+            return 0
+        try:
+            saved = await asyncio.to_thread(self._save_sync, words)
+        except Exception:
+            self.save_errors += 1
+            logger.exception("Could not store word details", extra={"words": len(words)})
+            return 0
+        self.words_saved += saved
+        return saved
+
+    def _schema_valid(self, words: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        valid = []
+        for word in words:
+            try:
+                valid.append(DifyWordSchema.model_validate(word).model_dump(mode="json", exclude_unset=True))
+            except ValidationError as e:
+                self.words_rejected += 1
+                logger.warning("Word details do not match the schema, not stored", extra={"word": dify_word_text(word), "error": f"{e.errors()[0]['msg']} ({e.errors()[0]['loc']})"})
+        return valid
+
+    @staticmethod
+    def _save_sync(words: List[Dict[str, Any]]) -> int:
+        db = SessionLocal()
+        try:
+            try:
+                return vocabulary_crud.upsert_word_details(db, words)
+            except IntegrityError:
+                # Another request inserted one of the words first; the retry updates it instead
+                db.rollback()
+                return vocabulary_crud.upsert_word_details(db, words)
+        finally:
+            db.close()
+
+    def schedule_backfill(self, words: List[str], fetch_detail: Callable[[str], Awaitable[PyOptional[Dict[str, Any]]]]) -> None:
+        """Looks up details of words that have none in the background; `fetch_detail` returns one word's details or None."""
+        if not self.enabled:
+            return
+        for word in words:
+            key = vocabulary_crud.normalize_word(word)
+            if not key or key in self._backfilling or self._recent_failures.get(key) is not None:
+                continue
+            self._backfilling.add(key)
+            self._spawn(self._backfill(key, word, fetch_detail))
+
+    async def _backfill(self, key: str, word: str, fetch_detail: Callable[[str], Awaitable[PyOptional[Dict[str, Any]]]]) -> None:
+        try:
+            async with self._backfill_slots:
+                detail = await fetch_detail(word)
+            if detail is None or not await self._save([detail]):
+                self.backfill_failed += 1
+                self._recent_failures.set(key, True)
+                return
+            self.backfilled += 1
+        except Exception as e:
+            self.backfill_failed += 1
+            self._recent_failures.set(key, True)
+            logger.warning("Word detail backfill failed", extra={"word": word, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            self._backfilling.discard(key)
+
+    def _spawn(self, coroutine: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task) # Keep a reference until done, nobody awaits these
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "words_saved": self.words_saved,
+            "words_rejected": self.words_rejected,
+            "save_errors": self.save_errors,
+            "backfill_running": len(self._backfilling),
+            "backfilled": self.backfilled,
+            "backfill_failed": self.backfill_failed,
+        }
+
+
+word_detail_store = WordDetailStore()
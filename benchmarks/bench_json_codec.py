@@ -0,0 +1,91 @@
+# backend/benchmarks/bench_json_codec.py
+"""
+Word-list JSON paths before/after the codec layer (app/core/json_codec.py + DIFY_WORD_LIST_ADAPTER).
+
+    python -m benchmarks.bench_json_codec [--sizes 30 500] [--runs 300]
+
+generate-vocabulary  old: json.loads of the Dify string -> jsonable_encoder -> json.dumps (JSONResponse)
+                     new: codec loads -> codec dumps (entries passed through, no jsonable_encoder)
+review-list          old: json.loads per stored word -> response_model validation -> serialization -> json.dumps
+                     new: codec loads per stored word -> adapter.validate_python -> adapter.dump_json
+Also the raw codec (Dify response body decode, SSE event encode). orjson in use: see the first line.
+"""
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.core import json_codec
+from app.schemas.vocabulary_schemas import DIFY_WORD_LIST_ADAPTER, DifyWordSchema
+from benchmarks.fake_dify import fake_word
+
+
+def stdlib_render(content: Any) -> bytes:
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def per_call_us(fn: Callable[[], Any], runs: int) -> float:
+    fn() # Warm up
+    started_at = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - started_at) / runs * 1e6
+
+
+def generate_vocabulary_paths(words_json: str) -> Dict[str, Callable[[], Any]]:
+    def old() -> bytes:
+        words = json.loads(words_json)
+        return stdlib_render(jsonable_encoder({"message": "单词列表生成成功。", "words": words}))
+
+    def new() -> bytes:
+        words = json_codec.loads(words_json)
+        return json_codec.dumps({"message": "单词列表生成成功。", "words": words})
+
+    return {"old": old, "new": new}
+
+
+def review_list_paths(stored: List[str]) -> Dict[str, Callable[[], Any]]:
+    response_model = TypeAdapter(List[DifyWordSchema]) # What FastAPI builds for response_model=List[DifyWordSchema]
+
+    def old() -> bytes:
+        words = [json.loads(data) for data in stored]
+        validated = response_model.validate_python(words)
+        return stdlib_render(jsonable_encoder(response_model.dump_python(validated, mode="json")))
+
+    def new() -> bytes:
+        words = DIFY_WORD_LIST_ADAPTER.validate_python([json_codec.loads(data) for data in stored])
+        return DIFY_WORD_LIST_ADAPTER.dump_json(words)
+
+    return {"old": old, "new": new}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[30, 500])
+    parser.add_argument("--runs", type=int, default=300)
+    args = parser.parse_args()
+
+    print(f"orjson: {'yes' if json_codec.orjson is not None else 'no (stdlib fallback)'}")
+    print(f"{'path':<36}{'words':>7}{'old us':>11}{'new us':>11}{'speedup':>9}")
+    for size in args.sizes:
+        words = [fake_word(i, "travel") for i in range(size)]
+        words_json = json.dumps(words, ensure_ascii=False)
+        body = json.dumps({"workflow_run_id": "run", "data": {"status": "succeeded", "outputs": {"word_list": words_json}}}, ensure_ascii=False).encode("utf-8")
+        event = {"message": "单词列表生成成功。", "words": words}
+        rows = [
+            ("generate-vocabulary result", generate_vocabulary_paths(words_json)),
+            ("review-list response", review_list_paths([json.dumps(word, ensure_ascii=False) for word in words])),
+            ("decode Dify response body", {"old": lambda: json.loads(body), "new": lambda: json_codec.loads(body)}),
+            ("encode SSE event data", {"old": lambda: json.dumps(event, ensure_ascii=False), "new": lambda: json_codec.dumps_str(event)}),
+        ]
+        for name, paths in rows:
+            old_us = per_call_us(paths["old"], args.runs)
+            new_us = per_call_us(paths["new"], args.runs)
+            print(f"{name:<36}{size:>7}{old_us:>11.1f}{new_us:>11.1f}{old_us / new_us:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# backend/benchmarks/bench_response_slimming.py
+"""
+Response bytes and serialization time of the Dify endpoints with and without the raw Dify response.
+
+    python -m benchmarks.bench_response_slimming [--text-bytes 1200] [--word-count 10 30] [--runs 2000]
+
+The upstream bodies are the synthetic ones of benchmarks.fake_dify, normalized by parse_dify_result and
+turned into endpoint results by the same build_*_result helpers the endpoints use, then serialized the
+way FastAPI's JSONResponse does. "raw" = ?include_raw=true (the old default), "slim" = the new default.
+"""
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from app.apis.dify_api import (
+    build_composition_result,
+    build_grammar_result,
+    build_vocabulary_result,
+    extract_text_from_dify_response,
+    shape_dify_result,
+)
+from app.core.config import settings
+from app.services.dify_workflow_service import parse_dify_result
+from benchmarks.fake_dify import filler_text, workflow_outputs
+
+
+def serialize(content: Dict[str, Any]) -> bytes:
+    # Same settings as starlette's JSONResponse.render
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def workflow_body(inputs: Dict[str, Any], text_bytes: int) -> Dict[str, Any]:
+    return {"workflow_run_id": "run", "task_id": "task", "data": {
+        "id": "run", "workflow_id": "wf", "status": "succeeded", "outputs": workflow_outputs(inputs, text_bytes),
+        "error": None, "elapsed_time": 1.5, "total_tokens": 900, "total_steps": 3, "created_at": 0, "finished_at": 2}}
+
+
+def chat_result(text_bytes: int) -> Dict[str, Any]:
+    body = {"event": "message", "message_id": "msg", "conversation_id": "conv", "mode": "chat",
+            "answer": filler_text(text_bytes), "metadata": {}, "created_at": 0}
+    dify_response_data = parse_dify_result(body, "/chat-messages")
+    # Mirrors ai_chat_endpoint
+    return {
+        "message": "AI回复已生成。",
+        "ai_text": extract_text_from_dify_response(dify_response_data, settings.CHAT_TEXT_OUTPUT_KEY),
+        "conversation_id": dify_response_data.get("conversation_id"),
+        "dify_full_response": dify_response_data,
+    }
+
+
+def cases(text_bytes: int, word_counts: List[int]) -> List[Tuple[str, Callable[[], Dict[str, Any]]]]:
+    items: List[Tuple[str, Callable[[], Dict[str, Any]]]] = [
+        ("ai-chat", lambda: chat_result(text_bytes)),
+        ("correct-composition", lambda: build_composition_result(parse_dify_result(
+            workflow_body({settings.COMPOSITION_TEXT_INPUT_KEY: "..."}, text_bytes), settings.COMPOSITION_APP_API_ENDPOINT))),
+        ("parse-grammar", lambda: build_grammar_result(parse_dify_result(
+            workflow_body({settings.GRAMMAR_PARSE_INPUT_KEY: "..."}, text_bytes), settings.GRAMMAR_PARSE_APP_API_ENDPOINT))),
+    ]
+    for count in word_counts:
+        inputs = {settings.VOCAB_GEN_INPUT_KEY: "travel", settings.VOCAB_GEN_WORD_COUNT_KEY: count}
+        items.append((f"generate-vocabulary ({count} words)", lambda inputs=inputs: build_vocabulary_result(parse_dify_result(
+            workflow_body(inputs, text_bytes), settings.VOCAB_GEN_APP_API_ENDPOINT))))
+    return items
+
+
+def time_serialization(content: Dict[str, Any], runs: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(runs):
+        serialize(content)
+    return (time.perf_counter() - started_at) / runs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--text-bytes", type=int, default=1200, help="Length of generated answers / feedback")
+    parser.add_argument("--word-count", type=int, nargs="+", default=[10, 30])
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'endpoint':<34}{'raw bytes':>11}{'slim bytes':>12}{'saved':>8}{'raw us':>9}{'slim us':>9}")
+    for name, build in cases(args.text_bytes, args.word_count):
+        result = build()
+        raw = shape_dify_result(result, include_raw=True)
+        slim = shape_dify_result(result, include_raw=False)
+        raw_bytes, slim_bytes = len(serialize(raw)), len(serialize(slim))
+        raw_us = time_serialization(raw, args.runs) * 1e6
+        slim_us = time_serialization(slim, args.runs) * 1e6
+        print(f"{name:<34}{raw_bytes:>11}{slim_bytes:>12}{1 - slim_bytes / raw_bytes:>8.0%}{raw_us:>9.1f}{slim_us:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
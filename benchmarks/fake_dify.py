@@ -0,0 +1,407 @@
+# backend/benchmarks/fake_dify.py
+"""
+Local stand-in for the Dify API, for load tests that must not touch the real instance.
+
+    python -m benchmarks.fake_dify [--port 5001] [--workflow-latency lognormal:1500:0.5] [--error-rate 0.02]
+    python -m benchmarks.fake_dify --record captured.jsonl --upstream https://dify.example.com/v1
+    python -m benchmarks.fake_dify --replay captured.jsonl [--replay-latency recorded|<spec>]
+
+Serves POST /chat-messages, /workflows/run (blocking and streaming) and /files/upload, with or without
+a /v1 prefix, so *_APP_BASE_URL can point at http://127.0.0.1:5001 or http://127.0.0.1:5001/v1.
+
+Latency specs (milliseconds): fixed:300, uniform:100:900, normal:800:200, lognormal:<median>:<sigma>.
+Workflow outputs follow the configured input/output keys (VOCAB_GEN_*, GRAMMAR_PARSE_*, COMPOSITION_*),
+so responses go through the same parsing as real ones.
+
+--record proxies every call to --upstream and appends request/response pairs (streams: every SSE line
+with its offset) to a JSONL file; --replay serves those captures, matched by endpoint, response mode
+and inputs, falling back to round-robin over the captures of the same endpoint/app.
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.core.config import settings
+
+ERROR_STATUS_CODES = (429, 500, 502, 503)
+
+
+class LatencyDistribution:
+    """Parsed latency spec; `sample()` returns seconds."""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, *params = spec.split(":")
+        values = [float(p) for p in params]
+        if kind == "lognormal":
+            values[:1] = [v / 1000 for v in values[:1]] # Median in ms, sigma unitless
+        else:
+            values = [v / 1000 for v in values]
+        if kind == "fixed" and len(values) == 1:
+            self._sample = lambda: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self._sample = lambda: random.uniform(values[0], values[1])
+        elif kind == "normal" and len(values) == 2:
+            self._sample = lambda: random.gauss(values[0], values[1])
+        elif kind == "lognormal" and len(values) == 2:
+            self._sample = lambda: values[0] * random.lognormvariate(0, values[1])
+        else:
+            raise ValueError(f"Invalid latency spec '{spec}' (fixed:MS, uniform:MIN_MS:MAX_MS, normal:MEAN_MS:STD_MS, lognormal:MEDIAN_MS:SIGMA)")
+
+    def sample(self) -> float:
+        return max(0.0, self._sample())
+
+
+@dataclass
+class FakeDifyConfig:
+    chat_latency: LatencyDistribution = field(default_factory=lambda: LatencyDistribution("lognormal:800:0.4"))
+    workflow_latency: LatencyDistribution = field(default_factory=lambda: LatencyDistribution("lognormal:1500:0.5"))
+    upload_latency: LatencyDistribution = field(default_factory=lambda: LatencyDistribution("lognormal:150:0.3"))
+    error_rate: float = 0.0 # Fraction of calls answered with one of ERROR_STATUS_CODES
+    hang_rate: float = 0.0 # Fraction of calls that never answer within hang_seconds (client timeouts)
+    hang_seconds: float = 600.0
+    text_bytes: int = 1200 # Size of generated chat answers / feedback texts
+    stream_chunks: int = 20 # text_chunk / message events per streamed answer
+    record_path: Optional[str] = None
+    upstream: Optional[str] = None
+    replay_path: Optional[str] = None
+    replay_latency: Optional[LatencyDistribution] = None # None = sleep the recorded latency
+
+
+def inputs_key(endpoint: str, response_mode: str, payload: Dict[str, Any]) -> str:
+    material = json.dumps({"endpoint": endpoint, "mode": response_mode, "inputs": payload.get("inputs") or {},
+                           "query": payload.get("query")}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def detect_workflow_app(inputs: Dict[str, Any]) -> str:
+    if settings.VOCAB_GEN_INPUT_KEY in inputs:
+        return "vocab"
+    if settings.GRAMMAR_PARSE_INPUT_KEY in inputs:
+        return "grammar"
+    if settings.GRAMMAR_PARSE_MICROBATCH_INPUT_KEY in inputs:
+        return "grammar-batch"
+    return "composition"
+
+
+def filler_text(size: int) -> str:
+    sentence = "The quick brown fox jumps over the lazy dog; 这是一段用于压测的示例反馈。 "
+    return (sentence * (size // len(sentence) + 1))[:size]
+
+
+def fake_word(index: int, keywords: str) -> Dict[str, Any]:
+    word = f"{(keywords.split() or ['word'])[0].lower()}{index}"
+    return {
+        "word": word,
+        "phonetic_us": f"/{word}/",
+        "part_of_speech": "n.",
+        "definition_cn": f"{word} 的中文释义",
+        "examples": [{"example_en": f"This is an example with {word}.", "example_cn": f"这是包含 {word} 的例句。"}],
+    }
+
+
+def workflow_outputs(inputs: Dict[str, Any], text_bytes: int) -> Dict[str, Any]:
+    dify_app = detect_workflow_app(inputs)
+    if dify_app == "vocab":
+        count = int(inputs.get(settings.VOCAB_GEN_WORD_COUNT_KEY) or 10)
+        words = [fake_word(i, str(inputs.get(settings.VOCAB_GEN_INPUT_KEY) or "")) for i in range(count)]
+        return {settings.VOCAB_GEN_OUTPUT_KEY: json.dumps(words, ensure_ascii=False)}
+    if dify_app == "grammar":
+        return {settings.GRAMMAR_PARSE_OUTPUT_KEY: filler_text(text_bytes)}
+    if dify_app == "grammar-batch":
+        texts = json.loads(inputs[settings.GRAMMAR_PARSE_MICROBATCH_INPUT_KEY])
+        return {settings.GRAMMAR_PARSE_MICROBATCH_OUTPUT_KEY: [filler_text(text_bytes) for _ in texts]}
+    return {settings.COMPOSITION_TEXT_OUTPUT_KEY: filler_text(text_bytes)}
+
+
+def sse_line(event: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+class Recorder:
+    """Appends captured exchanges to a JSONL file."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ReplayStore:
+    """Captured exchanges indexed by exact inputs key and by (endpoint, mode, app) for the fallback."""
+
+    def __init__(self, path: str):
+        self._exact: Dict[str, Dict[str, Any]] = {}
+        self._by_route: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._exact.setdefault(record["key"], record)
+                self._by_route.setdefault((record["endpoint"], record["mode"], record["app"]), []).append(record)
+        self._cycles = {route: itertools.cycle(records) for route, records in self._by_route.items()}
+
+    def __len__(self) -> int:
+        return sum(len(records) for records in self._by_route.values())
+
+    def find(self, key: str, endpoint: str, mode: str, dify_app: str) -> Optional[Dict[str, Any]]:
+        record = self._exact.get(key)
+        if record is not None:
+            return record
+        cycle = self._cycles.get((endpoint, mode, dify_app))
+        return next(cycle) if cycle is not None else None
+
+
+def create_app(config: FakeDifyConfig) -> FastAPI:
+    recorder = Recorder(config.record_path) if config.record_path else None
+    replay = ReplayStore(config.replay_path) if config.replay_path else None
+    upstream = httpx.AsyncClient(base_url=config.upstream.rstrip("/"), timeout=httpx.Timeout(600.0, connect=10.0)) if config.upstream else None
+    counters: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def lifespan(_: FastAPI):
+        yield
+        if upstream is not None:
+            await upstream.aclose()
+        if recorder is not None:
+            recorder.close()
+
+    app = FastAPI(title="Fake Dify", lifespan=lifespan)
+
+    def count(name: str) -> None:
+        counters[name] = counters.get(name, 0) + 1
+
+    async def injected_failure() -> Optional[JSONResponse]:
+        roll = random.random()
+        if roll < config.hang_rate:
+            count("hangs")
+            await asyncio.sleep(config.hang_seconds)
+        elif roll < config.hang_rate + config.error_rate:
+            count("errors")
+            status_code = random.choice(ERROR_STATUS_CODES)
+            return JSONResponse(status_code=status_code, content={"code": "fake_error", "message": f"Injected {status_code}", "status": status_code})
+        return None
+
+    # --- record: proxy to the real Dify and capture ---
+    async def proxy_and_record(request: Request, endpoint: str, payload: Dict[str, Any], dify_app: str):
+        assert upstream is not None and recorder is not None
+        mode = payload.get("response_mode", "blocking")
+        headers = {"Authorization": request.headers.get("authorization", "")}
+        record = {"key": inputs_key(endpoint, mode, payload), "endpoint": endpoint, "mode": mode, "app": dify_app}
+        started_at = time.perf_counter()
+        if mode != "streaming":
+            response = await upstream.post(endpoint, json=payload, headers=headers)
+            record.update(status=response.status_code, latency_ms=round((time.perf_counter() - started_at) * 1000, 1), body=response.json())
+            recorder.write(record)
+            return JSONResponse(status_code=response.status_code, content=record["body"])
+
+        upstream_request = upstream.build_request("POST", endpoint, json=payload, headers={**headers, "Accept": "text/event-stream"})
+        response = await upstream.send(upstream_request, stream=True)
+
+        async def relay() -> AsyncIterator[str]:
+            lines: List[Tuple[float, str]] = []
+            try:
+                async for line in response.aiter_lines():
+                    lines.append((round((time.perf_counter() - started_at) * 1000, 1), line))
+                    yield line + "\n"
+            finally:
+                await response.aclose()
+                record.update(status=response.status_code, lines=lines)
+                recorder.write(record)
+        return StreamingResponse(relay(), status_code=response.status_code, media_type="text/event-stream")
+
+    # --- replay: serve captures ---
+    async def replay_response(endpoint: str, payload: Dict[str, Any], dify_app: str):
+        assert replay is not None
+        mode = payload.get("response_mode", "blocking")
+        record = replay.find(inputs_key(endpoint, mode, payload), endpoint, mode, dify_app)
+        if record is None:
+            count("replay_misses")
+            return JSONResponse(status_code=404, content={"code": "not_recorded", "message": f"No capture for {endpoint} ({mode}, {dify_app})", "status": 404})
+        count("replay_hits")
+        if mode != "streaming":
+            await asyncio.sleep(config.replay_latency.sample() if config.replay_latency else record["latency_ms"] / 1000)
+            return JSONResponse(status_code=record["status"], content=record["body"])
+
+        async def relay() -> AsyncIterator[str]:
+            scale = 1.0
+            if config.replay_latency and record["lines"]:
+                scale = config.replay_latency.sample() / max(0.001, record["lines"][-1][0] / 1000)
+            previous_ms = 0.0
+            for offset_ms, line in record["lines"]:
+                await asyncio.sleep(max(0.0, offset_ms - previous_ms) * scale / 1000)
+                previous_ms = offset_ms
+                yield line + "\n"
+        return StreamingResponse(relay(), status_code=record["status"], media_type="text/event-stream")
+
+    # --- synthetic responses ---
+    async def synthetic_chat(payload: Dict[str, Any]):
+        conversation_id = payload.get("conversation_id") or uuid.uuid4().hex
+        message_id = uuid.uuid4().hex
+        answer = filler_text(config.text_bytes)
+        latency = config.chat_latency.sample()
+        if payload.get("response_mode") != "streaming":
+            await asyncio.sleep(latency)
+            return JSONResponse({"event": "message", "message_id": message_id, "conversation_id": conversation_id,
+                                 "mode": "chat", "answer": answer, "metadata": {}, "created_at": int(time.time())})
+
+        async def events() -> AsyncIterator[str]:
+            step = max(1, len(answer) // config.stream_chunks)
+            for start in range(0, len(answer), step):
+                await asyncio.sleep(latency / config.stream_chunks)
+                yield sse_line({"event": "message", "message_id": message_id, "conversation_id": conversation_id, "answer": answer[start:start + step]})
+            yield sse_line({"event": "message_end", "message_id": message_id, "conversation_id": conversation_id, "metadata": {}})
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def synthetic_workflow(payload: Dict[str, Any]):
+        inputs = payload.get("inputs") or {}
+        workflow_run_id = uuid.uuid4().hex
+        task_id = uuid.uuid4().hex
+        outputs = workflow_outputs(inputs, config.text_bytes)
+        latency = config.workflow_latency.sample()
+        started = int(time.time())
+        finished_data = {"id": workflow_run_id, "workflow_id": "fake-workflow", "status": "succeeded", "outputs": outputs,
+                         "error": None, "elapsed_time": round(latency, 3), "total_tokens": 0, "total_steps": 3,
+                         "created_at": started, "finished_at": started + int(latency)}
+        if payload.get("response_mode") != "streaming":
+            await asyncio.sleep(latency)
+            return JSONResponse({"workflow_run_id": workflow_run_id, "task_id": task_id, "data": finished_data})
+
+        async def events() -> AsyncIterator[str]:
+            yield sse_line({"event": "workflow_started", "workflow_run_id": workflow_run_id, "task_id": task_id, "data": {"id": workflow_run_id}})
+            nodes = [("start", "start", "Start"), ("llm", "llm", "LLM"), ("end", "end", "End")]
+            text = next(iter(outputs.values()))
+            step = max(1, len(text) // config.stream_chunks)
+            for index, (node_id, node_type, title) in enumerate(nodes, start=1):
+                yield sse_line({"event": "node_started", "workflow_run_id": workflow_run_id, "task_id": task_id,
+                                "data": {"node_id": node_id, "node_type": node_type, "title": title, "index": index}})
+                if node_type == "llm":
+                    for start in range(0, len(text), step):
+                        await asyncio.sleep(latency / config.stream_chunks)
+                        yield sse_line({"event": "text_chunk", "workflow_run_id": workflow_run_id, "task_id": task_id, "data": {"text": text[start:start + step]}})
+                yield sse_line({"event": "node_finished", "workflow_run_id": workflow_run_id, "task_id": task_id,
+                                "data": {"node_id": node_id, "node_type": node_type, "title": title, "status": "succeeded", "elapsed_time": 0.0}})
+            yield sse_line({"event": "workflow_finished", "workflow_run_id": workflow_run_id, "task_id": task_id, "data": finished_data})
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def handle(request: Request, endpoint: str):
+        count(endpoint)
+        payload = await request.json()
+        dify_app = "chat" if endpoint == "/chat-messages" else detect_workflow_app(payload.get("inputs") or {})
+        if recorder is not None:
+            return await proxy_and_record(request, endpoint, payload, dify_app)
+        if replay is not None:
+            return await replay_response(endpoint, payload, dify_app)
+        failure = await injected_failure()
+        if failure is not None:
+            return failure
+        if endpoint == "/chat-messages":
+            return await synthetic_chat(payload)
+        return await synthetic_workflow(payload)
+
+    async def files_upload(request: Request):
+        count("/files/upload")
+        form = await request.form()
+        upload = form.get("file")
+        content = await upload.read() if upload is not None else b""
+        if upstream is not None:
+            # Uploads are proxied but never recorded: the ids only mean something to the upstream instance.
+            files = {"file": (upload.filename, content, upload.content_type)} if upload is not None else None
+            response = await upstream.post("/files/upload", files=files, data={"user": form.get("user") or ""},
+                                           headers={"Authorization": request.headers.get("authorization", "")})
+            return JSONResponse(status_code=response.status_code, content=response.json())
+        if replay is None:
+            failure = await injected_failure()
+            if failure is not None:
+                return failure
+        await asyncio.sleep(config.upload_latency.sample())
+        return JSONResponse(status_code=201, content={
+            "id": str(uuid.uuid4()), "name": getattr(upload, "filename", "file"), "size": len(content),
+            "extension": (getattr(upload, "filename", "") or "").rsplit(".", 1)[-1], "mime_type": getattr(upload, "content_type", None),
+            "created_by": form.get("user"), "created_at": int(time.time()),
+        })
+
+    async def chat_messages(request: Request):
+        return await handle(request, "/chat-messages")
+
+    async def workflows_run(request: Request):
+        return await handle(request, "/workflows/run")
+
+    async def fake_stats():
+        return {"mode": "record" if recorder else "replay" if replay else "synthetic", "requests": counters,
+                "replay_captures": len(replay) if replay is not None else None}
+
+    for prefix in ("", "/v1"):
+        app.add_api_route(f"{prefix}/chat-messages", chat_messages, methods=["POST"])
+        app.add_api_route(f"{prefix}/workflows/run", workflows_run, methods=["POST"])
+        app.add_api_route(f"{prefix}/files/upload", files_upload, methods=["POST"])
+    app.add_api_route("/_fake/stats", fake_stats, methods=["GET"])
+    return app
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--chat-latency", default="lognormal:800:0.4")
+    parser.add_argument("--workflow-latency", default="lognormal:1500:0.5")
+    parser.add_argument("--upload-latency", default="lognormal:150:0.3")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=600.0)
+    parser.add_argument("--text-bytes", type=int, default=1200)
+    parser.add_argument("--stream-chunks", type=int, default=20)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", metavar="JSONL", help="Proxy to --upstream and capture the exchanges")
+    mode.add_argument("--replay", metavar="JSONL", help="Serve captured exchanges")
+    parser.add_argument("--upstream", help="Real Dify base URL for --record, e.g. https://dify.example.com/v1")
+    parser.add_argument("--replay-latency", default="recorded", help="'recorded' or a latency spec")
+    return parser
+
+
+def config_from_args(args: argparse.Namespace) -> FakeDifyConfig:
+    if args.record and not args.upstream:
+        raise SystemExit("--record needs --upstream")
+    return FakeDifyConfig(
+        chat_latency=LatencyDistribution(args.chat_latency),
+        workflow_latency=LatencyDistribution(args.workflow_latency),
+        upload_latency=LatencyDistribution(args.upload_latency),
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        text_bytes=args.text_bytes,
+        stream_chunks=max(1, args.stream_chunks),
+        record_path=args.record,
+        upstream=args.upstream,
+        replay_path=args.replay,
+        replay_latency=None if args.replay_latency == "recorded" else LatencyDistribution(args.replay_latency),
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    args = build_arg_parser().parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,504 @@
+# backend/benchmarks/load_test.py
+"""
+End-to-end load test of the /api/v1/dify/* and /api/v1/vocabulary/* endpoints at a target request rate.
+
+    # Against a running backend (whose *_APP_BASE_URL should point at benchmarks.fake_dify):
+    python -m benchmarks.load_test --base-url http://127.0.0.1:8000 --rps 20 --duration 60
+
+    # Self-contained: starts benchmarks.fake_dify and the backend (uvicorn app.main:app) as subprocesses
+    python -m benchmarks.load_test --spawn --rps 20 --duration 60 [--fake-dify-args "--error-rate 0.02"]
+    python -m benchmarks.load_test --spawn --record captured.jsonl --upstream https://dify.example.com/v1
+    python -m benchmarks.load_test --spawn --replay captured.jsonl
+
+    # Regression gate: exit code 1 if any scenario's p95 grew by more than 25% against a saved report
+    python -m benchmarks.load_test --spawn --json report.json --baseline baseline.json --max-regression 0.25
+
+Requests are sent open-loop (a new request every 1/rps seconds regardless of how many are still
+running, up to --max-in-flight), so a slow backend shows up as latency instead of a lower request rate.
+--mix picks scenarios by weight, e.g. "parse-grammar=3,generate-vocabulary=2,vocab-summary=1".
+Streaming scenarios also report the time to the first event / NDJSON line (ttfb).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+DIFY_PREFIX = "/api/v1/dify"
+VOCABULARY_PREFIX = "/api/v1/vocabulary"
+TERMINAL_JOB_STATUSES = ("succeeded", "failed")
+BATCH_SIZE = 30 # Items per batch-scenario request (one class worth of texts)
+
+# 1x1 PNG; random trailing bytes make each upload distinct so the upload cache doesn't hide the upload path.
+TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360606060000000050001a5f645400000000049454e44ae426082"
+)
+KEYWORDS = ["travel", "food", "school", "weather", "sports", "music", "health", "science", "business", "family"]
+SENTENCES = [
+    "Yesterday I go to the library and borrowed three books about history.",
+    "She don't like coffee, but she drinks tea every mornings.",
+    "If I would have known, I would come earlier to the meeting.",
+    "The results of the experiment was surprising for everyone in the lab.",
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+@dataclass
+class ScenarioResult:
+    latencies_ms: List[float] = field(default_factory=list)
+    ttfb_ms: List[float] = field(default_factory=list)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+
+    def record(self, status: str, elapsed_ms: float, ok: bool, ttfb_ms: Optional[float] = None) -> None:
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if ok:
+            self.latencies_ms.append(elapsed_ms)
+            if ttfb_ms is not None:
+                self.ttfb_ms.append(ttfb_ms)
+        else:
+            self.errors += 1
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies_ms)
+        ttfb = sorted(self.ttfb_ms)
+        total = len(latencies) + self.errors
+
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value, 1) if value is not None else None
+
+        return {
+            "requests": total,
+            "errors": self.errors,
+            "error_rate": round(self.errors / total, 4) if total else 0.0,
+            "throughput_rps": round(len(latencies) / duration, 2) if duration else 0.0,
+            "p50_ms": ms(percentile(latencies, 0.50)),
+            "p95_ms": ms(percentile(latencies, 0.95)),
+            "p99_ms": ms(percentile(latencies, 0.99)),
+            "ttfb_p50_ms": ms(percentile(ttfb, 0.50)),
+            "statuses": self.statuses,
+        }
+
+
+class BenchUser:
+    """A registered user with a bearer token; the jobs it submitted are polled with its token."""
+
+    def __init__(self, email: str, token: str):
+        self.email = email
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.conversation_id: Optional[str] = None
+
+
+async def create_user(client: httpx.AsyncClient) -> BenchUser:
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    password = uuid.uuid4().hex
+    response = await client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    response.raise_for_status()
+    response = await client.post("/api/v1/auth/login", data={"username": email, "password": password})
+    response.raise_for_status()
+    return BenchUser(email, response.json()["access_token"])
+
+
+@dataclass
+class Outcome:
+    status: str
+    ok: bool
+    ttfb_ms: Optional[float] = None
+
+
+class Scenarios:
+    """One coroutine per scenario; each performs one logical request and reports its outcome."""
+
+    def __init__(self, distinct_inputs: int):
+        self.distinct_inputs = max(1, distinct_inputs)
+
+    def _variant(self) -> int:
+        return random.randrange(self.distinct_inputs) # Bounded variety keeps response cache hit rates realistic
+
+    def keywords(self) -> str:
+        variant = self._variant()
+        return f"{KEYWORDS[variant % len(KEYWORDS)]} {variant}"
+
+    def sentence(self) -> str:
+        variant = self._variant()
+        return f"{SENTENCES[variant % len(SENTENCES)]} ({variant})"
+
+    @staticmethod
+    async def _json(client: httpx.AsyncClient, method: str, url: str, user: BenchUser, **kwargs: Any) -> Outcome:
+        response = await client.request(method, url, headers=user.headers, **kwargs)
+        return Outcome(str(response.status_code), response.is_success)
+
+    @staticmethod
+    async def _sse(client: httpx.AsyncClient, url: str, user: BenchUser, final_events: Tuple[str, ...], **kwargs: Any) -> Outcome:
+        started_at = time.perf_counter()
+        ttfb_ms: Optional[float] = None
+        last_event: Optional[str] = None
+        async with client.stream("POST", url, headers=user.headers, **kwargs) as response:
+            if not response.is_success:
+                await response.aread()
+                return Outcome(str(response.status_code), False)
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    if ttfb_ms is None:
+                        ttfb_ms = (time.perf_counter() - started_at) * 1000
+                    last_event = line[len("event:"):].strip()
+        if last_event in final_events:
+            return Outcome("200", True, ttfb_ms)
+        return Outcome(f"200/{last_event or 'empty'}", False, ttfb_ms)
+
+    @staticmethod
+    async def _ndjson(client: httpx.AsyncClient, url: str, user: BenchUser, **kwargs: Any) -> Outcome:
+        started_at = time.perf_counter()
+        ttfb_ms: Optional[float] = None
+        last_type: Optional[str] = None
+        async with client.stream("POST", url, headers=user.headers, **kwargs) as response:
+            if not response.is_success:
+                await response.aread()
+                return Outcome(str(response.status_code), False)
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                if ttfb_ms is None:
+                    ttfb_ms = (time.perf_counter() - started_at) * 1000
+                last_type = json.loads(line).get("type")
+        if last_type == "done":
+            return Outcome("200", True, ttfb_ms)
+        return Outcome(f"200/{last_type or 'empty'}", False, ttfb_ms)
+
+    async def ai_chat(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._json(client, "POST", f"{DIFY_PREFIX}/ai-chat", user, json={"query": self.sentence()})
+
+    async def ai_chat_stream(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._sse(client, f"{DIFY_PREFIX}/ai-chat/stream", user, ("done",), json={"query": self.sentence()})
+
+    def _composition_form(self, with_image: bool) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {"data": {"composition_text": " ".join(self.sentence() for _ in range(5))}}
+        if with_image:
+            kwargs["files"] = {"composition_image": ("photo.png", TINY_PNG + os.urandom(16), "image/png")}
+        return kwargs
+
+    async def correct_composition(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._json(client, "POST", f"{DIFY_PREFIX}/correct-composition", user, **self._composition_form(False))
+
+    async def correct_composition_image(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._json(client, "POST", f"{DIFY_PREFIX}/correct-composition", user, **self._composition_form(True))
+
+    async def correct_composition_stream(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._sse(client, f"{DIFY_PREFIX}/correct-composition/stream", user, ("workflow_finished",), **self._composition_form(False))
+
+    async def composition_job(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        """Submit + poll until finished; the latency is submission to result."""
+        response = await client.post(f"{DIFY_PREFIX}/correct-composition/jobs", headers=user.headers, **self._composition_form(False))
+        if response.status_code != 202:
+            return Outcome(str(response.status_code), False)
+        status_url = response.json()["status_url"]
+        while True:
+            await asyncio.sleep(0.25)
+            response = await client.get(status_url, headers=user.headers)
+            if not response.is_success:
+                return Outcome(f"poll/{response.status_code}", False)
+            job_status = response.json()["status"]
+            if job_status in TERMINAL_JOB_STATUSES:
+                return Outcome(f"202/{job_status}", job_status == "succeeded")
+
+    async def generate_vocabulary(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._json(client, "POST", f"{DIFY_PREFIX}/generate-vocabulary", user, json={"keywords": self.keywords(), "word_count": 10})
+
+    async def generate_vocabulary_stream(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._sse(client, f"{DIFY_PREFIX}/generate-vocabulary/stream", user, ("workflow_finished",),
+                               json={"keywords": self.keywords(), "word_count": 10})
+
+    async def generate_vocabulary_ndjson(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._ndjson(client, f"{DIFY_PREFIX}/generate-vocabulary/ndjson", user, json={"keywords": self.keywords(), "word_count": 10})
+
+    async def parse_grammar(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._json(client, "POST", f"{DIFY_PREFIX}/parse-grammar", user, json={"text_to_parse": self.sentence()})
+
+    async def parse_grammar_stream(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._sse(client, f"{DIFY_PREFIX}/parse-grammar/stream", user, ("workflow_finished",), json={"text_to_parse": self.sentence()})
+
+    async def parse_grammar_batch(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        # A class set of texts, results streamed as they complete (ttfb = first finished item)
+        items = [{"text_to_parse": self.sentence()} for _ in range(BATCH_SIZE)]
+        return await self._ndjson(client, f"{DIFY_PREFIX}/parse-grammar/batch", user, params={"stream": "true"}, json={"items": items})
+
+    async def generate_vocabulary_batch(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        items = [{"keywords": self.keywords(), "word_count": 10} for _ in range(BATCH_SIZE)]
+        return await self._json(client, "POST", f"{DIFY_PREFIX}/generate-vocabulary/batch", user, json={"items": items})
+
+    async def dify_stats(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._json(client, "GET", f"{DIFY_PREFIX}/stats", user)
+
+    async def vocab_progress(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        word = f"{random.choice(KEYWORDS)}{self._variant()}"
+        return await self._json(client, "POST", f"{VOCABULARY_PREFIX}/progress", user,
+                                json={"word": word, "status": random.choice(["unknown", "vague", "known"])})
+
+    async def vocab_progress_batch(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        updates = [{"word": f"{random.choice(KEYWORDS)}{self._variant()}", "status": random.choice(["unknown", "vague", "known"])} for _ in range(10)]
+        return await self._json(client, "POST", f"{VOCABULARY_PREFIX}/progress/batch", user, json={"progress_updates": updates})
+
+    async def vocab_review_list(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._json(client, "GET", f"{VOCABULARY_PREFIX}/review-list", user, params={"limit": 20})
+
+    async def vocab_summary(self, client: httpx.AsyncClient, user: BenchUser) -> Outcome:
+        return await self._json(client, "GET", f"{VOCABULARY_PREFIX}/summary", user)
+
+    def all(self) -> Dict[str, Callable[[httpx.AsyncClient, BenchUser], Awaitable[Outcome]]]:
+        return {
+            "ai-chat": self.ai_chat,
+            "ai-chat-stream": self.ai_chat_stream,
+            "correct-composition": self.correct_composition,
+            "correct-composition-image": self.correct_composition_image,
+            "correct-composition-stream": self.correct_composition_stream,
+            "composition-job": self.composition_job,
+            "generate-vocabulary": self.generate_vocabulary,
+            "generate-vocabulary-stream": self.generate_vocabulary_stream,
+            "generate-vocabulary-ndjson": self.generate_vocabulary_ndjson,
+            "parse-grammar": self.parse_grammar,
+            "parse-grammar-stream": self.parse_grammar_stream,
+            "parse-grammar-batch": self.parse_grammar_batch,
+            "generate-vocabulary-batch": self.generate_vocabulary_batch,
+            "dify-stats": self.dify_stats,
+            "vocab-progress": self.vocab_progress,
+            "vocab-progress-batch": self.vocab_progress_batch,
+            "vocab-review-list": self.vocab_review_list,
+            "vocab-summary": self.vocab_summary,
+        }
+
+
+def parse_mix(spec: Optional[str], available: List[str]) -> Dict[str, float]:
+    if not spec:
+        return {name: 1.0 for name in available}
+    mix: Dict[str, float] = {}
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in available:
+            raise SystemExit(f"Unknown scenario '{name}', choose from: {', '.join(available)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def run_load(
+    base_url: str,
+    rps: float,
+    duration: float,
+    mix: Dict[str, float],
+    scenarios: Scenarios,
+    users: int,
+    max_in_flight: int,
+    timeout: float,
+) -> Tuple[Dict[str, ScenarioResult], float, int]:
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        bench_users = [await create_user(client) for _ in range(max(1, users))]
+        handlers = scenarios.all()
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        results: Dict[str, ScenarioResult] = {name: ScenarioResult() for name in names}
+        in_flight: set = set()
+        dropped = 0
+
+        async def one(name: str) -> None:
+            started_at = time.perf_counter()
+            try:
+                outcome = await handlers[name](client, random.choice(bench_users))
+            except httpx.TimeoutException:
+                outcome = Outcome("client_timeout", False)
+            except httpx.HTTPError as e:
+                outcome = Outcome(type(e).__name__, False)
+            results[name].record(outcome.status, (time.perf_counter() - started_at) * 1000, outcome.ok, outcome.ttfb_ms)
+
+        started_at = time.perf_counter()
+        sent = 0
+        while True:
+            next_at = started_at + sent / rps
+            if next_at - started_at >= duration:
+                break
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            sent += 1
+            if len(in_flight) >= max_in_flight:
+                dropped += 1 # The backend is not keeping up; don't let the queue grow without bound
+                continue
+            task = asyncio.create_task(one(random.choices(names, weights)[0]))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.wait(in_flight)
+        return results, time.perf_counter() - started_at, dropped
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"target {report['target_rps']} rps for {report['duration_s']} s, elapsed {report['elapsed_s']} s, dropped {report['dropped']}")
+    print(f"{'scenario':<28}{'reqs':>7}{'errors':>8}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb p50':>10}  statuses")
+    for name, summary in report["scenarios"].items():
+        cells = [f"{summary[key]:>10.1f}" if summary[key] is not None else f"{'-':>10}" for key in ("p50_ms", "p95_ms", "p99_ms", "ttfb_p50_ms")]
+        statuses = " ".join(f"{status}:{n}" for status, n in sorted(summary["statuses"].items()))
+        print(f"{name:<28}{summary['requests']:>7}{summary['errors']:>8}{summary['throughput_rps']:>8.2f}{''.join(cells)}  {statuses}")
+    overall = report["overall"]
+    print(f"{'overall':<28}{overall['requests']:>7}{overall['errors']:>8}{overall['throughput_rps']:>8.2f}"
+          + "".join(f"{overall[key]:>10.1f}" if overall[key] is not None else f"{'-':>10}" for key in ("p50_ms", "p95_ms", "p99_ms")))
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Scenarios whose p95 (or error rate) got worse than the baseline allows."""
+    regressions = []
+    for name, summary in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        if before.get("p95_ms") and summary.get("p95_ms") and summary["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {before['p95_ms']} ms -> {summary['p95_ms']} ms")
+        if summary["error_rate"] > before.get("error_rate", 0.0) + 0.01:
+            regressions.append(f"{name}: error rate {before.get('error_rate', 0.0):.2%} -> {summary['error_rate']:.2%}")
+    return regressions
+
+
+# --- --spawn: fake Dify + backend as subprocesses ---
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_until_listening(port: int, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Process {process.args} exited with code {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"Nothing listening on port {port} after {timeout} seconds")
+
+
+def spawn_processes(args: argparse.Namespace, workdir: str) -> Tuple[List[subprocess.Popen], int, int]:
+    fake_port, backend_port = free_port(), free_port()
+    fake_cmd = [sys.executable, "-m", "benchmarks.fake_dify", "--port", str(fake_port), *shlex.split(args.fake_dify_args)]
+    if args.record:
+        fake_cmd += ["--record", args.record, "--upstream", args.upstream]
+    elif args.replay:
+        fake_cmd += ["--replay", args.replay]
+    fake_base_url = f"http://127.0.0.1:{fake_port}/v1"
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "LOG_LEVEL": args.backend_log_level,
+        "DIFY_HTTP_WARMUP_ON_STARTUP": "false",
+    }
+    for prefix in ("CHAT", "COMPOSITION", "VOCAB_GEN", "GRAMMAR_PARSE"):
+        env[f"{prefix}_APP_BASE_URL"] = fake_base_url
+        env.setdefault(f"{prefix}_APP_API_KEY", f"fake-{prefix.lower()}")
+        if args.record: # Recording needs the real keys; they are only forwarded by the fake Dify
+            env[f"{prefix}_APP_API_KEY"] = os.environ.get(f"{prefix}_APP_API_KEY", env[f"{prefix}_APP_API_KEY"])
+    backend_cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(backend_port),
+                   "--workers", str(args.backend_workers), "--log-level", "warning", "--no-access-log"]
+    processes = [subprocess.Popen(fake_cmd), subprocess.Popen(backend_cmd, env=env, cwd=os.getcwd())]
+    return processes, fake_port, backend_port
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rps", type=float, default=10.0)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    parser.add_argument("--mix", help="scenario=weight,... (default: every scenario, equal weights)")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--distinct-inputs", type=int, default=50, help="Variety of keywords/texts (controls cache hit rates)")
+    parser.add_argument("--max-in-flight", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", metavar="PATH", help="Write the report as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="Previous --json report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed relative p95 growth vs. the baseline")
+    parser.add_argument("--list", action="store_true", help="List the scenarios and exit")
+    spawn = parser.add_argument_group("--spawn: start benchmarks.fake_dify and the backend locally")
+    spawn.add_argument("--spawn", action="store_true")
+    spawn.add_argument("--fake-dify-args", default="", help='Extra fake Dify options, e.g. "--workflow-latency fixed:500 --error-rate 0.05"')
+    spawn.add_argument("--backend-workers", type=int, default=1)
+    spawn.add_argument("--backend-log-level", default="WARNING")
+    mode = spawn.add_mutually_exclusive_group()
+    mode.add_argument("--record", metavar="JSONL", help="Fake Dify proxies to --upstream and captures the responses")
+    mode.add_argument("--replay", metavar="JSONL", help="Fake Dify serves previously captured responses")
+    spawn.add_argument("--upstream", help="Real Dify base URL for --record")
+    args = parser.parse_args()
+
+    scenarios = Scenarios(args.distinct_inputs)
+    if args.list:
+        print("\n".join(scenarios.all()))
+        return
+    if (args.record or args.replay) and not args.spawn:
+        parser.error("--record/--replay need --spawn (or start benchmarks.fake_dify with them yourself)")
+    if args.record and not args.upstream:
+        parser.error("--record needs --upstream")
+    if args.seed is not None:
+        random.seed(args.seed)
+    mix = parse_mix(args.mix, list(scenarios.all()))
+
+    processes: List[subprocess.Popen] = []
+    base_url = args.base_url
+    with tempfile.TemporaryDirectory(prefix="dify-bench-") as workdir:
+        try:
+            if args.spawn:
+                processes, fake_port, backend_port = spawn_processes(args, workdir)
+                await wait_until_listening(fake_port, processes[0])
+                await wait_until_listening(backend_port, processes[1])
+                base_url = f"http://127.0.0.1:{backend_port}"
+            results, elapsed, dropped = await run_load(base_url, args.rps, args.duration, mix, scenarios,
+                                                       args.users, args.max_in_flight, args.timeout)
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+            for process in processes:
+                process.wait(timeout=30)
+
+    overall = ScenarioResult()
+    for result in results.values():
+        overall.latencies_ms += result.latencies_ms
+        overall.errors += result.errors
+        for status, n in result.statuses.items():
+            overall.statuses[status] = overall.statuses.get(status, 0) + n
+    report = {
+        "target_rps": args.rps,
+        "duration_s": args.duration,
+        "elapsed_s": round(elapsed, 1),
+        "dropped": dropped,
+        "mode": "record" if args.record else "replay" if args.replay else "synthetic" if args.spawn else "external",
+        "scenarios": {name: result.summary(elapsed) for name, result in results.items()},
+        "overall": overall.summary(elapsed),
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
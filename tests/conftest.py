@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Before any app import: settings are read once, at import. The tests get their own database and data
+# directory instead of the checked-in test.db and ./data.
+_TEST_DIR = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}")
+os.environ.setdefault("DATA_DIR", os.path.join(_TEST_DIR, "data"))
@@ -0,0 +1,51 @@
+import zlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.apis.auth_api import get_current_active_user
+from app.core import json_codec
+from app.db.database import SessionLocal
+from app.db.models import User, UserWord, WordDetail, WordLearningStatus
+from app.main import app
+from app.services.word_details import word_detail_store
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(word_detail_store, "enabled", False) # No background backfill of the missing details
+    db = SessionLocal()
+    user = User(email="review-list@example.com", hashed_password="x", is_active=True)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    app.dependency_overrides[get_current_active_user] = lambda: user
+    try:
+        yield TestClient(app), db, user
+    finally:
+        app.dependency_overrides.pop(get_current_active_user, None)
+        db.query(UserWord).delete()
+        db.query(WordDetail).delete()
+        db.query(User).delete()
+        db.commit()
+        db.close()
+
+
+def seed(db, user, word, details):
+    db.add(UserWord(user_id=user.id, word=word, status=WordLearningStatus.VAGUE))
+    db.add(WordDetail(word=word, data=zlib.compress(json_codec.dumps(details))))
+    db.commit()
+
+
+def test_malformed_stored_details_only_replace_their_own_entry(client):
+    http, db, user = client
+    seed(db, user, "broken", {"word": "broken", "examples": ["a bare sentence"]})
+    seed(db, user, "airport", {"word": "airport", "definition_cn": "机场", "examples": [{"en": "At the airport.", "cn": "在机场。"}]})
+
+    response = http.get("/api/v1/vocabulary/review-list")
+
+    assert response.status_code == 200
+    words = {word["word"]: word for word in response.json()}
+    assert words["broken"]["definition_cn"] == "详细信息未存储"
+    assert words["airport"]["definition_cn"] == "机场"
+    assert words["airport"]["examples"][0]["en"] == "At the airport."
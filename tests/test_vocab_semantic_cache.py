@@ -0,0 +1,48 @@
+import pytest
+
+from app.services.vocab_semantic_cache import SemanticVocabularyCache, normalize_keywords
+
+
+@pytest.mark.parametrize("keyword", ["news", "physics", "series", "species", "status", "class", "glasses", "famous"])
+def test_words_ending_in_s_that_are_not_plurals_are_kept(keyword):
+    assert normalize_keywords(keyword) == keyword
+
+
+@pytest.mark.parametrize("plural, singular", [
+    ("airports", "airport"),
+    ("boxes", "box"),
+    ("churches", "church"),
+    ("classes", "class"),
+    ("cities", "city"),
+])
+def test_regular_plurals_fold_to_the_singular(plural, singular):
+    assert normalize_keywords(plural) == normalize_keywords(singular) == singular
+
+
+def test_normalization_ignores_case_order_and_stopwords():
+    assert normalize_keywords("Travel & the Airports") == normalize_keywords("airport travel") == "airport travel"
+
+
+def test_news_is_not_served_the_list_for_new():
+    cache = SemanticVocabularyCache()
+    cache.store("", "new", [{"word": "novel"}])
+
+    assert cache.lookup("", "news") is None
+    assert cache.lookup("", "New").words == [{"word": "novel"}]
+
+
+def test_plural_keywords_hit_the_singular_entry():
+    cache = SemanticVocabularyCache()
+    cache.store("", "airport travel", [{"word": "boarding pass"}])
+
+    match = cache.lookup("", "Airports & travel")
+    assert match is not None and match.similarity == 1.0
+
+
+def test_a_list_that_a_top_up_could_not_extend_is_marked_exhausted():
+    cache = SemanticVocabularyCache()
+    cache.store("", "airport", [{"word": "gate"}])
+    assert not cache.lookup("", "airport").exhausted
+
+    cache.store("", "airport", [{"word": "gate"}], exhausted=True)
+    assert cache.lookup("", "airports").exhausted
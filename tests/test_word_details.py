@@ -0,0 +1,28 @@
+import asyncio
+
+from app.crud import vocabulary_crud
+from app.db.database import SessionLocal
+from app.db.models import WordDetail
+from app.services.word_details import WordDetailStore
+
+
+def test_only_schema_valid_details_are_stored():
+    store = WordDetailStore()
+    words = [
+        {"word": "airport", "definition_cn": "机场", "level": "A2"},
+        {"word": "broken", "examples": ["a bare sentence"]},
+        {"word": "gate", "part_of_speech": ["n.", "v."]},
+    ]
+
+    saved = asyncio.run(store._save(words))
+
+    db = SessionLocal()
+    try:
+        stored = vocabulary_crud.get_word_details(db, ["airport", "broken", "gate"])
+        db.query(WordDetail).delete()
+        db.commit()
+    finally:
+        db.close()
+    assert saved == 1
+    assert store.stats()["words_rejected"] == 2
+    assert stored == {"airport": {"word": "airport", "definition_cn": "机场", "level": "A2"}}